@@ -1,14 +1,29 @@
+import contextlib
+import itertools
 import logging
+import math
 import os
 import re
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from . import compressibility
 from . import helpers
+from . import metadata
+from . import sorting
 from . import splitter
+from . import tar_writer
+from . import walker
+from .hash_cache import HashCache
+from .tar_listing import TarListingWriter
 from .constants import COMPRESSED_ARCHIVE_SUFFIX, ENCRYPTED_ARCHIVE_SUFFIX, \
-    DEFAULT_COMPRESSION_LEVEL
-from .encryption import encrypt_list_of_archives
+    DEFAULT_COMPRESSION_LEVEL, DEFAULT_HASH_ALGORITHM, DEFAULT_HASH_BACKEND, SORT_MEMORY_BYTE_SIZE, \
+    HASH_LIST_SLICE_NR_FILES, HASH_CACHE_MAX_BYTE_SIZE, CHUNK_HASH_SUFFIX, CHUNK_SIZE_HEADER, DEFAULT_SPLIT_STRATEGY, MEMBER_INDEX_SUFFIX, \
+    CHUNK_TREE_HASH_INDEX, \
+    LZIP_DICTIONARY_BYTE_SIZES, LZIP_MIN_DATA_BYTE_SIZE, COMPRESSION_MAX_THREADS_PER_PART, \
+    INCOMPRESSIBLE_COMPRESSION_LEVEL, INCOMPRESSIBLE_PARTS_SUFFIX
+from .encryption import encrypt_list_of_archives, get_encryption_command
 
 
 def encrypt_existing_archive(archive_path, encryption_keys, destination_dir=None, remove_unencrypted=False, force=False, threads=1):
@@ -32,7 +47,7 @@ def encrypt_existing_archive(archive_path, encryption_keys, destination_dir=None
     encrypt_list_of_archives([archive_path], encryption_keys, remove_unencrypted, destination_dir, threads=threads)
 
 
-def create_archive(source_path, destination_path, threads=None, encryption_keys=None, compression=DEFAULT_COMPRESSION_LEVEL, splitting=None, remove_unencrypted=False, force=False, work_dir=None):
+def create_archive(source_path, destination_path, threads=None, encryption_keys=None, compression=DEFAULT_COMPRESSION_LEVEL, splitting=None, remove_unencrypted=False, force=False, work_dir=None, single_pass=False, hash_cache_path=None, hash_algorithms=(DEFAULT_HASH_ALGORITHM,), hash_backend=DEFAULT_HASH_BACKEND, sort_memory=SORT_MEMORY_BYTE_SIZE, chunk_size=None, walkers=1, split_strategy=DEFAULT_SPLIT_STRATEGY, split_parts=None, stream=False, adaptive=False, hash_cache_size=HASH_CACHE_MAX_BYTE_SIZE):
     # Argparse already checks if arguments are present, so only argument format needs to be validated
     helpers.terminate_if_path_nonexistent(source_path)
 
@@ -49,17 +64,32 @@ def create_archive(source_path, destination_path, threads=None, encryption_keys=
     # Create destination folder if nonexistent or overwrite if --force option used
     helpers.handle_destination_directory_creation(destination_path, force)
 
-    logging.info("Create and write hash list...")
-    create_filelist_and_hashes(source_path, destination_path, splitting, threads)
-
-    if splitting:
-        create_split_archive(source_path, destination_path, threads, encryption_keys, compression, work_dir)
+    if single_pass:
+        logging.info("Create tar archives and hash lists in a single pass...")
+        create_tar_archives_and_hashes_single_pass(source_path, destination_path, splitting, threads,
+                                                   hash_algorithms=hash_algorithms, walkers=walkers,
+                                                   split_strategy=split_strategy, split_parts=split_parts,
+                                                   adaptive=adaptive, work_dir=work_dir, sort_memory=sort_memory)
+    else:
+        logging.info("Create and write hash list...")
+        create_filelist_and_hashes(source_path, destination_path, splitting, threads, hash_cache_path=hash_cache_path,
+                                   hash_algorithms=hash_algorithms, hash_backend=hash_backend, work_dir=work_dir,
+                                   sort_memory=sort_memory, chunk_size=chunk_size, walkers=walkers,
+                                   split_strategy=split_strategy, split_parts=split_parts, adaptive=adaptive,
+                                   hash_cache_size=hash_cache_size)
+
+    if splitting or split_parts:
+        create_split_archive(source_path, destination_path, threads, encryption_keys, compression, work_dir,
+                             tars_created=single_pass, stream=stream)
+    elif stream:
+        _process_part_streaming(source_path, destination_path, work_dir, source_name, threads, compression,
+                                encryption_keys)
     else:
-        _process_part(source_path, destination_path, work_dir, source_name)
+        if not single_pass:
+            _process_part(source_path, destination_path, work_dir, source_name)
 
         logging.info("Starting compression of tar archive...")
         compress_using_lzip(destination_path, source_name, threads, compression)
-        create_and_write_compressed_archive_hash(destination_path, source_name)
 
         if encryption_keys:
             logging.info("Starting encryption...")
@@ -69,94 +99,254 @@ def create_archive(source_path, destination_path, threads=None, encryption_keys=
     logging.info(f"Archive created: {helpers.get_absolute_path_string(destination_path)}")
 
 
-def create_split_archive(source_path, destination_path, threads, encryption_keys, compression, work_dir=None):
+def create_split_archive(source_path, destination_path, threads, encryption_keys, compression, work_dir=None, tars_created=False,
+                         stream=False):
     logging.info("Start creation of split archive")
 
     if not threads:
         threads = 1
 
-    create_tar_archives_and_listings(source_path, destination_path, work_dir, workers=threads)
+    if stream:
+        create_compressed_tar_archives_streaming(source_path, destination_path, work_dir, threads, compression,
+                                                 encryption_keys=encryption_keys)
+        return
 
-    compress_and_hash(destination_path, threads, compression)
+    if not tars_created:
+        create_tar_archives_and_listings(source_path, destination_path, work_dir, workers=threads)
+
+    # parts are encrypted as soon as they are compressed, only keeping the encrypted parts
+    compress_and_hash(destination_path, threads, compression, encryption_keys=encryption_keys,
+                      remove_unencrypted=True)
 
-    if encryption_keys:
-        do_encryption(destination_path, encryption_keys, threads)
 
+def create_filelist_and_hashes(source_path, destination_path, split_size, threads, max_single_size=None, hash_cache_path=None,
+                               hash_algorithms=(DEFAULT_HASH_ALGORITHM,), hash_backend=DEFAULT_HASH_BACKEND, work_dir=None,
+                               sort_memory=SORT_MEMORY_BYTE_SIZE, chunk_size=None, walkers=1,
+                               split_strategy=DEFAULT_SPLIT_STRATEGY, split_parts=None, adaptive=False,
+                               hash_cache_size=HASH_CACHE_MAX_BYTE_SIZE):
+    logging.info(f"Using hash algorithms {', '.join(hash_algorithms)}")
 
-def create_filelist_and_hashes(source_path, destination_path, split_size, threads, max_single_size=None):
+    if chunk_size:
+        logging.info(f"Hashing files larger than {chunk_size} bytes in chunks")
+
+    if hash_cache_path:
+        logging.info(f"Using hash cache {hash_cache_path}")
+        with HashCache(hash_cache_path, hash_cache_size) as hash_cache:
+            _create_filelist_and_hashes(source_path, destination_path, split_size, threads, max_single_size, hash_algorithms,
+                                        hash_backend, work_dir, sort_memory, chunk_size, walkers, split_strategy,
+                                        split_parts, adaptive, hash_cache)
+    else:
+        _create_filelist_and_hashes(source_path, destination_path, split_size, threads, max_single_size, hash_algorithms,
+                                    hash_backend, work_dir, sort_memory, chunk_size, walkers, split_strategy, split_parts,
+                                    adaptive)
 
-    if split_size:
-        logging.info(f"Using a split size of {split_size} bytes ({split_size/1024**3:.3f}GB).")
 
+def _create_filelist_and_hashes(source_path, destination_path, split_size, threads, max_single_size, hash_algorithms,
+                                hash_backend, work_dir, sort_memory, chunk_size, walkers, split_strategy, split_parts,
+                                adaptive=False, hash_cache=None):
+    if split_size or split_parts:
         nr_parts = create_file_listing_hash_split_archives(source_path, destination_path,
-                                                split_size, max_single_size, threads)
+                                                split_size, max_single_size, threads, hash_cache, hash_algorithms,
+                                                hash_backend, work_dir, sort_memory, chunk_size, walkers, split_strategy,
+                                                split_parts, adaptive)
 
-        with open(destination_path / f"{source_path.name}.parts.txt", "w") as f:
-            f.write(f"{nr_parts}\n")
+        write_parts_file(destination_path, source_path.name, nr_parts)
     else:
         create_file_listing_hash(source_path, destination_path,
-                                 source_path.name, max_workers=threads)
+                                 source_path.name, max_workers=threads, hash_cache=hash_cache,
+                                 hash_algorithms=hash_algorithms, hash_backend=hash_backend, work_dir=work_dir,
+                                 sort_memory=sort_memory, chunk_size=chunk_size, walkers=walkers)
 
 
-def create_file_listing_hash_split_archives(source_path, destination_path, split_size, max_single_size, threads):
+def create_file_listing_hash_split_archives(source_path, destination_path, split_size, max_single_size, threads, hash_cache=None,
+                                            hash_algorithms=(DEFAULT_HASH_ALGORITHM,), hash_backend=DEFAULT_HASH_BACKEND,
+                                            work_dir=None, sort_memory=SORT_MEMORY_BYTE_SIZE, chunk_size=None, walkers=1,
+                                            split_strategy=DEFAULT_SPLIT_STRATEGY, split_parts=None, adaptive=False):
 
-    split_archives = splitter.split_directory(source_path, split_size, max_single_size)
+    split_archives = split_source_directory(source_path, split_size, max_single_size, walkers, split_strategy,
+                                            split_parts, adaptive, threads)
 
     source_name = source_path.name
     nr_parts = 0
-    for index, archive in enumerate(split_archives):
+    incompressible_part_names = []
+    for index, (_, listing, incompressible) in enumerate(split_archives):
         logging.info(f"Generate file listings for part {index + 1}")
         source_part_name = f"{source_name}.part{index + 1}"
         create_file_listing_hash(source_path, destination_path,
-                                 source_part_name, archive[0], archive[1],
-                                 max_workers=threads)
+                                 source_part_name, listing,
+                                 max_workers=threads, hash_cache=hash_cache, hash_algorithms=hash_algorithms,
+                                 hash_backend=hash_backend, work_dir=work_dir, sort_memory=sort_memory,
+                                 chunk_size=chunk_size, walkers=walkers)
         nr_parts += 1
+        if incompressible:
+            incompressible_part_names.append(source_part_name)
+
+    if adaptive:
+        write_incompressible_parts_file(destination_path, source_name, incompressible_part_names)
+
     return nr_parts
 
 
-def create_file_listing_hash(source_path_root, destination_path, source_name, archive_list=None, listing=None, max_workers=1):
-    if archive_list:
-        paths_to_hash_list = archive_list
-    else:
-        paths_to_hash_list = [source_path_root]
+def split_source_directory(source_path, split_size, max_single_size=None, walkers=1,
+                           split_strategy=DEFAULT_SPLIT_STRATEGY, split_parts=None, adaptive=False, workers=1):
+    """
+    Splits into split_parts parts of similar size if given, otherwise into parts of at most split_size bytes.
+
+    :return: iterable of (archive list, listing, incompressible) of every part, where archive list and listing contain
+    walker.FileEntry objects and only the parts of incompressible files of an adaptive split are incompressible
+    """
+    if adaptive:
+        logging.info("Splitting incompressible files into parts of their own.")
+        return splitter.split_directory_by_compressibility(source_path, split_size, split_parts, max_single_size,
+                                                           walkers, workers)
+
+    return ((archive_list, listing, False) for archive_list, listing in
+            _split_source_directory(source_path, split_size, max_single_size, walkers, split_strategy, split_parts))
+
+
+def _split_source_directory(source_path, split_size, max_single_size, walkers, split_strategy, split_parts):
+    if split_parts:
+        logging.info(f"Splitting into {split_parts} parts of similar size.")
+        return splitter.split_directory_into_parts(source_path, split_parts, walkers)
+
+    logging.info(f"Using a split size of {split_size} bytes ({split_size/1024**3:.3f}GB) and the {split_strategy} "
+                 f"split strategy.")
+    return splitter.split_directory(source_path, split_size, max_single_size, walkers, split_strategy)
+
+
+def create_file_listing_hash(source_path_root, destination_path, source_name, listing=None, max_workers=1, hash_cache=None,
+                             hash_algorithms=(DEFAULT_HASH_ALGORITHM,), hash_backend=DEFAULT_HASH_BACKEND, work_dir=None,
+                             sort_memory=SORT_MEMORY_BYTE_SIZE, chunk_size=None, walkers=1):
+    """
+    Writes the listing and the file hash lists of the walker.FileEntry objects in listing, by default of the whole
+    tree below source_path_root. Both are created from the same entries, s.t. every file is only stat'ed once.
+    """
+    if listing is None:
+        # streaming the listing in the order of the directory traversal, the order in which tar adds the files
+        listing = walker.scan_tree(source_path_root, include_dirs=True, walkers=walkers)
+
+    chunk_hashes = []
+    with open(destination_path.joinpath(source_name + ".lst"), "a") as listing_file:
+        hashes = hashes_for_listing(listing, source_path_root, listing_file, max_workers, hash_cache, hash_algorithms,
+                                    hash_backend, chunk_size, chunk_hashes)
+        write_hash_files(hashes, destination_path, source_name, hash_algorithms, work_dir, sort_memory)
+
+    if chunk_size:
+        write_chunk_hash_files(chunk_hashes, destination_path, source_name, hash_algorithms, chunk_size)
+
+
+def _escape_path(file_path):
+    if '\n' in file_path or '\\' in file_path:
+        # escaping new lines in filenames...
+        # see https://www.gnu.org/software/coreutils/manual/html_node/md5sum-invocation.html#md5sum-invocation
+        return '\\', file_path.replace('\\', '\\\\').replace('\n', '\\n')
+    return '', file_path
+
+
+def write_hash_files(hashes, destination_path, source_name, hash_algorithms, work_dir=None,
+                     sort_memory=SORT_MEMORY_BYTE_SIZE):
+    """
+    Writes one hash list per algorithm sorted by path, hashes is an iterable of [path, hash per algorithm...].
+    Hash lists not fitting into sort_memory are sorted using temporary files in work_dir.
+    """
+    hash_file_paths = [destination_path.joinpath(source_name + helpers.hash_suffix(a)) for a in hash_algorithms]
+
+    with contextlib.ExitStack() as stack:
+        hash_files = []
+        for hash_file_path in hash_file_paths:
+            logging.info(f"Writing file hash list to {hash_file_path}")
+            hash_files.append(stack.enter_context(open(hash_file_path, "a")))
+
+        for row in sorting.sort_rows(hashes, work_dir, sort_memory):
+            hash_prefix, file_path = _escape_path(row[0])
+            for hash_file, file_hash in zip(hash_files, row[1:]):
+                hash_file.write(f"{hash_prefix}{file_hash} {file_path}\n")
+
+
+def write_chunk_hash_files(chunk_hashes, destination_path, source_name, hash_algorithms, chunk_size):
+    """
+    Writes the hashes of the chunks of files hashed in chunks next to every hash list, e.g. to NAME.md5.chunks.
+    The chunks of every file are followed by its tree hash over the chunk hashes (see helpers.get_tree_hash).
+    chunk_hashes contains [path, chunk index, hash per algorithm...]
+    """
+    chunk_hashes = sorted(chunk_hashes, key=lambda c: (c[0], int(c[1])))
+    chunk_hashes_by_path = {path: list(chunks) for path, chunks in itertools.groupby(chunk_hashes, key=lambda c: c[0])}
+
+    for index, algorithm in enumerate(hash_algorithms):
+        chunk_hash_file_path = destination_path.joinpath(source_name + helpers.hash_suffix(algorithm) + CHUNK_HASH_SUFFIX)
+
+        logging.info(f"Writing chunk hash list to {chunk_hash_file_path}")
+        with open(chunk_hash_file_path, "w") as chunk_hash_file:
+            chunk_hash_file.write(f"{CHUNK_SIZE_HEADER}{chunk_size}\n")
+
+            for path, chunks in chunk_hashes_by_path.items():
+                hash_prefix, file_path = _escape_path(path)
+                for c in chunks:
+                    chunk_hash_file.write(f"{hash_prefix}{c[index + 2]} {c[1]} {file_path}\n")
+
+                tree_hash = helpers.get_tree_hash([c[index + 2] for c in chunks], algorithm)
+                chunk_hash_file.write(f"{hash_prefix}{tree_hash} {CHUNK_TREE_HASH_INDEX} {file_path}\n")
+
+
+def write_listing_file(source_path_root, listing, listing_file_path):
+    logging.info(f"Writing complete file listing to {listing_file_path}")
+    with open(listing_file_path, "a") as listing_file:
+        _write_listing(source_path_root, listing, listing_file)
 
-    hashes = sorted(hashes_for_path_list(paths_to_hash_list, source_path_root, max_workers), key=lambda p: p[0])
-    hash_file_path = destination_path.joinpath(source_name + ".md5")
 
-    logging.info(f"Writing file hash list to {hash_file_path}")
-    with open(hash_file_path, "a") as hash_file:
-        for line in hashes:
-            file_path = line[0]
-            hash_prefix = ''
-            if '\n' in file_path or '\\' in file_path:
-                file_path = file_path.replace('\\', '\\\\').replace('\n', '\\n') # escaping new lines in filenames...
-                hash_prefix = '\\' # see https://www.gnu.org/software/coreutils/manual/html_node/md5sum-invocation.html#md5sum-invocation
+def _write_listing(source_path_root, listing, listing_file):
+    for entry in listing:
+        prefix, file_path = _escape_path(entry.path.relative_to(source_path_root.parent).as_posix())
+        listing_file.write(f"{prefix}{file_path}\n")
 
-            file_hash = line[1]
-            hash_file.write(f"{hash_prefix}{file_hash} {file_path}\n")
 
-    listing_file_path = destination_path.joinpath(source_name + ".lst")
-    logging.info(f"Writing complete file listing to {listing_file_path}")
-    if not listing:
-        listing = helpers.get_files_in_folder(source_path_root, include_dirs=True)
-    listing = [_.relative_to(source_path_root.parent).as_posix() for _ in listing]
-    with open(listing_file_path, "a") as listing_file:
-        for file_path in listing:
-            prefix = ''
-            if '\n' in file_path or '\\' in file_path:
-                file_path = file_path.replace('\\', '\\\\').replace('\n', '\\n') # escaping new lines in filenames...
-                prefix = '\\'
-            listing_file.write(f"{prefix}{file_path}\n")
+def write_parts_file(destination_path, source_name, nr_parts):
+    with open(destination_path / f"{source_name}.parts.txt", "w") as f:
+        f.write(f"{nr_parts}\n")
+
+
+def write_incompressible_parts_file(destination_path, source_name, part_names):
+    with open(destination_path / f"{source_name}{INCOMPRESSIBLE_PARTS_SUFFIX}", "w") as f:
+        f.writelines(f"{part_name}\n" for part_name in part_names)
+
+
+def read_incompressible_part_names(destination_path):
+    """:return: names of the parts with incompressible files of an adaptive split, empty if there are none"""
+    part_names = set()
+
+    for path in destination_path.glob(f"*{INCOMPRESSIBLE_PARTS_SUFFIX}"):
+        with open(path, "r") as f:
+            part_names.update(line.rstrip("\n") for line in f if line.strip())
 
+    return part_names
 
-def hashes_for_path_list(path_list, source_path_root, max_workers=1):
-    files = [path for path in path_list if (not path.is_dir()) or path.is_symlink()]
 
-    for path in path_list:
-        if path.is_dir() and not path.is_symlink():
-            files.extend(helpers.get_files_in_folder(path))
+def get_part_compression_levels(destination_path, part_names, compression):
+    """:return: compression level of every part, parts with incompressible files are hardly compressed"""
+    incompressible_part_names = read_incompressible_part_names(destination_path)
 
-    return helpers.hash_files_and_check_symlinks(source_path_root, files, max_workers=max_workers)
+    return [INCOMPRESSIBLE_COMPRESSION_LEVEL if p in incompressible_part_names else compression for p in part_names]
+
+
+def hashes_for_listing(listing, source_path_root, listing_file, max_workers=1, hash_cache=None,
+                       hash_algorithms=(DEFAULT_HASH_ALGORITHM,), hash_backend=DEFAULT_HASH_BACKEND, chunk_size=None,
+                       chunk_hashes=None):
+    """
+    Yields [path, hash per algorithm...] for every file of the walker.FileEntry objects in listing and writes the
+    listing to listing_file on the way. Entries are processed in slices to bound memory usage.
+    See helpers.hash_files_and_check_symlinks for chunk_size and chunk_hashes.
+    """
+    listing = iter(listing)
+    logging.info(f"Writing complete file listing to {listing_file.name}")
+
+    for entries_slice in iter(lambda: list(itertools.islice(listing, HASH_LIST_SLICE_NR_FILES)), []):
+        _write_listing(source_path_root, entries_slice, listing_file)
+
+        files_slice = [e for e in entries_slice if not e.is_dir()]
+        yield from helpers.hash_files_and_check_symlinks(source_path_root, files_slice, max_workers=max_workers,
+                                                         hash_cache=hash_cache, algorithms=hash_algorithms,
+                                                         backend=hash_backend, chunk_size=chunk_size,
+                                                         chunk_hashes=chunk_hashes)
 
 
 def _process_part(source_path, destination_path, work_dir, source_part_name):
@@ -164,14 +354,118 @@ def _process_part(source_path, destination_path, work_dir, source_part_name):
     archive_list = [source_path.parent / f for f in helpers.read_file_listing(destination_path / f"{source_part_name}.lst")]
 
     logging.info(f"Create tar archive for {source_part_name} in {destination_path} ...")
-    create_tar_archive(source_path, destination_path, source_part_name, archive_list, work_dir)
-    logging.info(f"Generating hash for tar archive {source_part_name} in {destination_path}")
-    create_and_write_archive_hash(destination_path, source_part_name)
-    logging.info(f"Generating tar archive listing for tar archive {source_part_name} in {destination_path}")
-    create_archive_listing(destination_path, source_part_name)
+    # same algorithms as chosen for the file hash list
+    algorithms = helpers.get_hash_algorithms_for_path(destination_path.joinpath(source_part_name))
+    # the tar archive listing and member index are generated from the archive while it is written
+    tar_hashes = create_tar_archive(source_path, destination_path, source_part_name, archive_list, work_dir, algorithms,
+                                    listing_path=destination_path.joinpath(source_part_name + ".tar.lst"),
+                                    index_path=destination_path.joinpath(source_part_name + MEMBER_INDEX_SUFFIX))
+    helpers.write_file_hashes(destination_path.joinpath(source_part_name + ".tar").absolute(), tar_hashes, algorithms)
+
+
+def _process_part_streaming(source_path, destination_path, work_dir, source_part_name, threads, compression,
+                            encryption_keys=None):
+    """
+    Like _process_part followed by compress_using_lzip, but tar is piped into plzip. The tar archive is hashed and
+    listed on the way, so only the compressed archive is written. With encryption keys, plzip is further piped into
+    gpg and only the encrypted archive is written, the unencrypted data never touches the disk.
+    """
+    archive_list = [source_path.parent / f for f in helpers.read_file_listing(destination_path / f"{source_part_name}.lst")]
+    tar_path = destination_path.joinpath(source_part_name + ".tar").absolute()
+    compressed_path = destination_path.joinpath(source_part_name + COMPRESSED_ARCHIVE_SUFFIX).absolute()
+    listing_path = destination_path.joinpath(source_part_name + ".tar.lst")
+    index_path = destination_path.joinpath(source_part_name + MEMBER_INDEX_SUFFIX)
+
+    logging.info(f"Create compressed tar archive for {source_part_name} in {destination_path} using {threads} threads ...")
+    # same algorithms as chosen for the file hash list
+    algorithms = helpers.get_hash_algorithms_for_path(destination_path.joinpath(source_part_name))
+    cmds = [get_plzip_command(compression, threads)]
+    output_path = compressed_path
+
+    if encryption_keys:
+        cmds.append(get_encryption_command(encryption_keys))
+        output_path = helpers.add_suffix_to_path(compressed_path, ".gpg")
+
+    with tar_command(source_path, archive_list, work_dir) as cmd, open(listing_path, "w") as listing_file, \
+            open(index_path, "w") as index_file:
+        hashes = helpers.run_pipeline_with_hashed_outputs([cmd] + cmds, output_path, algorithms,
+                                                          sinks={0: [TarListingWriter(listing_file, index_file)]})
+
+    # hashes of the tar and compressed archive are written although they only existed as stream
+    for path, path_hashes in zip([tar_path, compressed_path, output_path], hashes):
+        helpers.write_file_hashes(path, path_hashes, algorithms)
+    metadata.create_and_write_metadata(output_path)
+
+
+def create_tar_archives_and_hashes_single_pass(source_path, destination_path, split_size, threads, max_single_size=None,
+                                               hash_algorithms=(DEFAULT_HASH_ALGORITHM,), walkers=1,
+                                               split_strategy=DEFAULT_SPLIT_STRATEGY, split_parts=None, adaptive=False,
+                                               work_dir=None, sort_memory=SORT_MEMORY_BYTE_SIZE):
+    """
+    Creates the tar archives together with file hash lists and listings, hashing the files while
+    they are written into the tar archives. Every source file is hence only read once.
+    Hash lists not fitting into sort_memory are sorted using temporary files in work_dir.
+    """
+    source_name = source_path.name
+
+    if split_size or split_parts:
+        split_archives = list(split_source_directory(source_path, split_size, max_single_size, walkers,
+                                                     split_strategy, split_parts, adaptive, threads))
+        listings = [listing for _, listing, _ in split_archives]
+        part_names = [f"{source_name}.part{index + 1}" for index in range(len(listings))]
+
+        write_parts_file(destination_path, source_name, len(part_names))
+        if adaptive:
+            write_incompressible_parts_file(destination_path, source_name,
+                                            [n for n, (_, _, incompressible) in zip(part_names, split_archives)
+                                             if incompressible])
+    else:
+        listings = [list(walker.scan_tree(source_path, include_dirs=True, walkers=walkers))]
+        part_names = [source_name]
+
+    logging.info(f"Creating tar archives, hashes and listings for {','.join(part_names)} using {threads} workers.")
+    helpers.exec_parallel(_process_part_single_pass, zip(part_names, listings),
+                          lambda p: (source_path, destination_path, p[0], p[1], hash_algorithms, work_dir, sort_memory),
+                          min(threads, len(part_names)))
+
+
+def _process_part_single_pass(source_path, destination_path, source_part_name, listing, hash_algorithms, work_dir=None,
+                              sort_memory=SORT_MEMORY_BYTE_SIZE):
+    tar_path = destination_path.joinpath(source_part_name + ".tar")
+
+    logging.info(f"Create tar archive for {source_part_name} in {destination_path} while hashing files ...")
+    hashes, tar_hashes = tar_writer.write_tar_with_hashes(
+        source_path, tar_path, [e.path for e in listing], hash_algorithms,
+        tar_listing_path=destination_path.joinpath(source_part_name + ".tar.lst"),
+        index_path=destination_path.joinpath(source_part_name + MEMBER_INDEX_SUFFIX))
+
+    write_hash_files(hashes, destination_path, source_part_name, hash_algorithms, work_dir, sort_memory)
+    write_listing_file(source_path, listing, destination_path.joinpath(source_part_name + ".lst"))
+    helpers.write_file_hashes(tar_path.absolute(), tar_hashes, hash_algorithms)
 
 
 def create_tar_archives_and_listings(source_path, destination_path, work_dir, parts=None, workers=1):
+    part_names = get_part_names_from_listings(source_path, destination_path, parts)
+
+    logging.info(f"Creating tar archives and listings for {','.join(part_names)} using {workers} workers.")
+    helpers.exec_parallel(_process_part, part_names, lambda p: (source_path, destination_path, work_dir, p), workers)
+
+
+def create_compressed_tar_archives_streaming(source_path, destination_path, work_dir, threads, compression, parts=None,
+                                             encryption_keys=None):
+    """
+    Creates the compressed (and possibly encrypted) tar archives and listings by piping tar into plzip (and gpg),
+    s.t. only the final archives are written. Parts are processed sequentially, as compression with all threads
+    is the bottleneck.
+    """
+    part_names = get_part_names_from_listings(source_path, destination_path, parts)
+    levels = get_part_compression_levels(destination_path, part_names, compression)
+
+    for part_name, level in zip(part_names, levels):
+        _process_part_streaming(source_path, destination_path, work_dir, part_name, threads, level, encryption_keys)
+
+
+def get_part_names_from_listings(source_path, destination_path, parts=None):
     source_name = source_path.name
 
     if parts:
@@ -186,25 +480,38 @@ def create_tar_archives_and_listings(source_path, destination_path, work_dir, pa
         if not part_listings:
             helpers.terminate_with_message(f"No {source_name}.lst or files matching {source_name}.part[0-9]+.list found in {destination_path}")
 
-    part_names = [os.path.splitext(p.name)[0] for p in helpers.sort_paths_with_part(part_listings)]
-
-    logging.info(f"Creating tar archives and listings for {','.join(part_names)} using {workers} workers.")
-    helpers.exec_parallel(_process_part, part_names, lambda p: (source_path, destination_path, work_dir, p), workers)
+    return [os.path.splitext(p.name)[0] for p in helpers.sort_paths_with_part(part_listings)]
 
 
-def create_tar_archive(source_path, destination_path, source_name, archive_list=None, work_dir=None):
+def create_tar_archive(source_path, destination_path, source_name, archive_list=None, work_dir=None,
+                       algorithms=(DEFAULT_HASH_ALGORITHM,), listing_path=None, index_path=None):
+    """
+    Creates the tar archive and returns its hashes, computed while tar writes the archive.
+    With listing_path, the listing of the archive like `tar -tvf` is written there as well,
+    with index_path the offsets of its members (see member_index).
+    """
     destination_file_path = destination_path.joinpath(source_name + ".tar")
-    source_path_parent = source_path.absolute().parent
 
-    if archive_list:
-        create_tar_archive_from_list(source_path, archive_list, destination_file_path, source_path_parent, work_dir)
-        return
+    with contextlib.ExitStack() as stack:
+        cmd = stack.enter_context(tar_command(source_path, archive_list, work_dir))
+        sinks = []
+        if listing_path:
+            index_file = stack.enter_context(open(index_path, "w")) if index_path else None
+            sinks.append(TarListingWriter(stack.enter_context(open(listing_path, "w")), index_file))
 
-    # -C flag on tar necessary to get relative path in tar archive
-    helpers.run_shell_cmd(["tar", "--posix", "-cf", destination_file_path, "-C", source_path_parent, source_path.stem])
+        return helpers.run_cmd_with_hashed_output(cmd, destination_file_path, algorithms, sinks)
 
 
-def create_tar_archive_from_list(source_path, archive_list, destination_file_path, source_path_parent, work_dir=None):
+@contextlib.contextmanager
+def tar_command(source_path, archive_list=None, work_dir=None):
+    """Yields the command writing a tar archive of source_path, or only of the paths in archive_list, to stdout"""
+    source_path_parent = source_path.absolute().parent
+
+    if not archive_list:
+        # -C flag on tar necessary to get relative path in tar archive
+        yield ["tar", "--posix", "--sparse", "-cf", "-", "-C", source_path_parent, source_path.stem]
+        return
+
     relative_archive_list = [path.absolute().relative_to(source_path.absolute().parent) for path in archive_list]
     files_string_list = [path.as_posix() for path in relative_archive_list]
 
@@ -215,17 +522,12 @@ def create_tar_archive_from_list(source_path, archive_list, destination_file_pat
         with open(tmp_file_path, "w") as tmp_file:
             tmp_file.write("\0".join(files_string_list))
 
-        helpers.run_shell_cmd(["tar", "--posix", "-cf", destination_file_path, "-C", source_path_parent, "--null", "--no-recursion", "--files-from", tmp_file_path])
-
+        yield ["tar", "--posix", "--sparse", "-cf", "-", "-C", source_path_parent, "--null", "--no-recursion",
+               "--files-from", tmp_file_path]
 
-def create_archive_listing(destination_path, source_name):
-    listing_path = destination_path.joinpath(source_name + ".tar.lst")
-    tar_path = destination_path.joinpath(source_name + ".tar")
 
-    helpers.run_shell_cmd(["tar", "-tvf", tar_path], file_output=listing_path)
-
-
-def compress_and_hash(destination_path, threads, compression, part=None):
+def compress_and_hash(destination_path, threads, compression, part=None, encryption_keys=None,
+                      remove_unencrypted=False):
     if part:
         parts = list(destination_path.glob(f'*part{part}.tar'))
     else:
@@ -234,41 +536,117 @@ def compress_and_hash(destination_path, threads, compression, part=None):
     if not parts:
         helpers.terminate_with_message(f"No suitable tar files found to be compressed in {destination_path}")
 
-    part_names = [os.path.splitext(p.name)[0] for p in helpers.sort_paths_with_part(parts)]
+    parts = helpers.sort_paths_with_part(parts)
+    part_names = [os.path.splitext(p.name)[0] for p in parts]
+    tar_byte_sizes = [p.stat().st_size for p in parts]
+    levels = get_part_compression_levels(destination_path, part_names, compression)
+    allotment = get_compression_thread_allotment(tar_byte_sizes, threads, levels)
+    _log_adaptive_compression_savings(tar_byte_sizes, levels, compression)
 
-    # compress sequentially
-    for part in part_names:
-        logging.info(f"Compressing {part} using {threads} threads.")
-        compress_using_lzip(destination_path, part, threads, compression)
+    # longest compression first, s.t. a large part doesn't keep the threads busy at the end
+    jobs = sorted(zip(part_names, allotment, levels, tar_byte_sizes), reverse=True,
+                  key=lambda j: compressibility.estimate_compression_seconds(j[3], j[2]))
 
-    # compute md5sums of archive parts in parallel
-    logging.info(f"Generate hash of compressed tar {','.join(part_names)} using {threads} threads.")
+    if len(jobs) == 1:
+        _compress_part(destination_path, *jobs[0][:3], encryption_keys, remove_unencrypted)
+        return
 
-    helpers.exec_parallel(create_and_write_compressed_archive_hash, part_names, lambda part: (destination_path, part),
-                          min(threads, len(parts)))
+    budget = helpers.ThreadBudget(threads)
 
+    with ThreadPoolExecutor(len(jobs)) as executor:
+        futures = []
+        for part_name, part_threads, level, _ in jobs:
+            budget.acquire(part_threads)
+            if any(f.done() and f.exception() for f in futures):
+                # not starting further parts after a failure
+                budget.release(part_threads)
+                break
+            futures.append(executor.submit(_compress_part, destination_path, part_name, part_threads, level,
+                                           encryption_keys, remove_unencrypted, budget))
 
-def compress_using_lzip(destination_path, source_name, threads, compression):
-    path = destination_path.joinpath(source_name + ".tar")
+        for future in futures:
+            future.result()
 
-    additional_arguments = []
 
-    if threads:
-        additional_arguments.extend(["--threads", str(threads)])
+def get_compression_thread_allotment(tar_byte_sizes, threads, compression_levels):
+    """
+    Divides the threads among parts compressed concurrently. With more than COMPRESSION_MAX_THREADS_PER_PART threads,
+    several parts are compressed at the same time, and a part never gets more threads than it has blocks for plzip
+    to compress in parallel at its compression level, s.t. the remaining threads are used by further parts.
+
+    :return: number of plzip threads for every part
+    """
+    nr_concurrent_parts = max(1, min(len(tar_byte_sizes), threads // COMPRESSION_MAX_THREADS_PER_PART))
+    threads_per_part = max(1, threads // nr_concurrent_parts)
+    allotment = []
+
+    for size, compression in zip(tar_byte_sizes, compression_levels):
+        block_byte_size = max(2 * LZIP_DICTIONARY_BYTE_SIZES[int(compression)], LZIP_MIN_DATA_BYTE_SIZE)
+        allotment.append(max(1, min(threads_per_part, math.ceil(size / block_byte_size))))
+
+    return allotment
 
-    helpers.run_shell_cmd(["plzip", path, f"-{compression}"] + additional_arguments)
+
+def _log_adaptive_compression_savings(tar_byte_sizes, levels, compression):
+    reduced = [(size, level) for size, level in zip(tar_byte_sizes, levels) if level != compression]
+    if not reduced:
+        return
+
+    saved_seconds = sum(compressibility.estimate_compression_seconds(size, compression) -
+                        compressibility.estimate_compression_seconds(size, level) for size, level in reduced)
+    logging.info(f"Compressing {len(reduced)} parts of incompressible files with "
+                 f"{sum(size for size, _ in reduced)} bytes at level {INCOMPRESSIBLE_COMPRESSION_LEVEL} instead of "
+                 f"{compression} saves an estimated {saved_seconds / 3600:.1f} CPU hours")
 
 
-def create_and_write_archive_hash(destination_path, source_name):
-    path = destination_path.joinpath(source_name + ".tar").absolute()
+def _compress_part(destination_path, part_name, threads, compression, encryption_keys=None, remove_unencrypted=False,
+                   budget=None):
+    """Compresses and optionally encrypts a part, releasing its threads of the budget when done"""
+    try:
+        tar_byte_size = destination_path.joinpath(part_name + ".tar").stat().st_size
+        logging.info(f"Compressing {part_name} at level {compression} using {threads} threads.")
+        compress_using_lzip(destination_path, part_name, threads, compression)
 
-    helpers.create_and_write_file_hash(path)
+        compressed_byte_size = destination_path.joinpath(part_name + COMPRESSED_ARCHIVE_SUFFIX).stat().st_size
+        logging.info(f"Compressed {part_name} to {compressed_byte_size / max(tar_byte_size, 1):.1%} of its size")
+
+        if encryption_keys:
+            # gpg and hashing the encrypted part use a single thread, the others go to parts still to be compressed
+            if budget:
+                budget.release(threads - 1)
+                threads = 1
+            archive_list = [destination_path.joinpath(part_name + COMPRESSED_ARCHIVE_SUFFIX)]
+            encrypt_list_of_archives(archive_list, encryption_keys, remove_unencrypted)
+    finally:
+        if budget:
+            budget.release(threads)
 
 
-def create_and_write_compressed_archive_hash(destination_path, source_name):
-    path = destination_path.joinpath(source_name + ".tar.lz").absolute()
+def compress_using_lzip(destination_path, source_name, threads, compression):
+    """Compresses the tar archive, hashing the compressed archive while it is written, and removes the tar archive"""
+    path = destination_path.joinpath(source_name + ".tar")
+    compressed_path = destination_path.joinpath(source_name + COMPRESSED_ARCHIVE_SUFFIX).absolute()
+
+    # same algorithms as chosen for the tar archive
+    algorithms = helpers.get_hash_algorithms_for_path(path)
+    hashes = helpers.run_cmd_with_hashed_output(get_plzip_command(compression, threads) + [path], compressed_path,
+                                                algorithms)
+
+    # like plzip when not writing to stdout
+    path.unlink()
+
+    helpers.write_file_hashes(compressed_path, hashes, algorithms)
+    metadata.create_and_write_metadata(compressed_path)
+
+
+def get_plzip_command(compression, threads=None):
+    """:return: plzip command compressing its standard input, or the file appended to the command, to stdout"""
+    cmd = ["plzip", "-c", f"-{compression}"]
+
+    if threads:
+        cmd.extend(["--threads", str(threads)])
 
-    helpers.create_and_write_file_hash(path)
+    return cmd
 
 
 def do_encryption(destination_path, encryption_keys, remove_unencrypted=False, part=None, threads=1):
@@ -0,0 +1,66 @@
+"""
+Detection of files whose content is already compressed, e.g. BAM, CRAM, gzip or JPEG files, which lzip can't compress
+any further. With adaptive compression, such files are put into parts of their own (see
+splitter.split_directory_by_compressibility), which are compressed with INCOMPRESSIBLE_COMPRESSION_LEVEL instead of
+spending hours of CPU time on compressing them at a high level for no gain.
+
+Files are recognized by their suffix, by the magic number at their start or by compressing a sample of their content.
+"""
+import logging
+import zlib
+
+from .constants import INCOMPRESSIBLE_SUFFIXES, COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE, COMPRESSIBILITY_SAMPLE_BYTE_SIZE, \
+    INCOMPRESSIBLE_RATIO, LZIP_COMPRESSION_BYTES_PER_SECOND
+
+# magic numbers of compressed formats, BAM and BGZF files start like gzip
+_MAGIC_NUMBERS = [
+    b"\x1f\x8b",  # gzip
+    b"BZh",  # bzip2
+    b"\xfd7zXZ\x00",  # xz
+    b"LZIP",  # lzip
+    b"\x28\xb5\x2f\xfd",  # zstd
+    b"7z\xbc\xaf\x27\x1c",  # 7-zip
+    b"PK\x03\x04",  # zip
+    b"CRAM",  # CRAM
+    b"\xff\xd8\xff",  # JPEG
+    b"\x89PNG\r\n\x1a\n",  # PNG
+]
+_MAGIC_NUMBER_MAX_LENGTH = max(len(m) for m in _MAGIC_NUMBERS)
+
+
+def is_incompressible(path, byte_size):
+    """
+    :return: whether the regular file at path with byte_size bytes is already compressed. Files smaller than
+    COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE are only judged by their suffix, as they hardly take any time to compress.
+    """
+    if path.suffix.lower() in INCOMPRESSIBLE_SUFFIXES:
+        return True
+
+    if byte_size < COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE:
+        return False
+
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(_MAGIC_NUMBER_MAX_LENGTH)
+            if any(magic.startswith(m) for m in _MAGIC_NUMBERS):
+                return True
+
+            # the middle of the file, as headers often compress well also for compressed formats
+            f.seek(max(0, byte_size // 2 - COMPRESSIBILITY_SAMPLE_BYTE_SIZE // 2))
+            sample = f.read(COMPRESSIBILITY_SAMPLE_BYTE_SIZE)
+    except OSError as error:
+        # reported when the file is archived
+        logging.debug(f"Could not sample {path}: {error}")
+        return False
+
+    return bool(sample) and get_sample_ratio(sample) > INCOMPRESSIBLE_RATIO
+
+
+def get_sample_ratio(sample):
+    """:return: size of the sample compressed by a fast compressor divided by its size"""
+    return len(zlib.compress(sample, 1)) / len(sample)
+
+
+def estimate_compression_seconds(byte_size, compression):
+    """:return: rough estimate of the CPU time in seconds for compressing byte_size bytes at a compression level"""
+    return byte_size / LZIP_COMPRESSION_BYTES_PER_SECOND[int(compression)]
@@ -2,17 +2,76 @@ import re
 
 REQUIRED_SPACE_MULTIPLIER = 1.1
 HASH_SUFFIX = ".md5"
+DEFAULT_HASH_ALGORITHM = "md5"
+# xxh3 is only available if the optional xxhash package is installed
+HASH_ALGORITHMS = ["md5", "sha256", "blake2b", "xxh3"]
 TAR_HASH_SUFFIX = ".tar.md5"
 COMPRESSED_ARCHIVE_SUFFIX = ".tar.lz"
 ENCRYPTED_ARCHIVE_SUFFIX = ".tar.lz.gpg"
 COMPRESSED_ARCHIVE_HASH_SUFFIX = ".tar.lz.md5"
 ENCRYPTED_ARCHIVE_HASH_SUFFIX = ".tar.lz.gpg.md5"
 LISTING_SUFFIX = ".tar.lst"
-READ_CHUNK_BYTE_SIZE = 1000 * 1000 * 100
+# offsets of the members in the uncompressed tar archive, e.g. NAME.tar.idx
+MEMBER_INDEX_SUFFIX = ".tar.idx"
+# appended to the file hash list, e.g. NAME.md5.chunks, when hashing large files in chunks
+CHUNK_HASH_SUFFIX = ".chunks"
+# size, modification time and format specific information of an archive, e.g. NAME.tar.lz.meta
+METADATA_SUFFIX = ".meta"
+# file hashing reads multiples of the filesystem block size (st_blksize) within these bounds
+HASH_CHUNK_MIN_BYTE_SIZE = 1024 * 1024 * 4
+HASH_CHUNK_MAX_BYTE_SIZE = 1024 * 1024 * 64
+# small files are dispatched in batches of about this size to parallel workers
+PARALLEL_BATCH_BYTE_SIZE = 1000 * 1000 * 64
+PARALLEL_BATCH_MAX_ITEMS = 1000
+# executors for parallel hashing, "auto" uses threads and hashes files of at least
+# PROCESS_BACKEND_MIN_FILE_SIZE bytes in separate processes
+HASH_BACKENDS = ["auto", "thread", "process"]
+DEFAULT_HASH_BACKEND = "auto"
+SPLIT_STRATEGIES = ["greedy", "balanced"]
+DEFAULT_SPLIT_STRATEGY = "greedy"
+# when splitting into a given number of parts, directories larger than this fraction of a part are split up
+SPLIT_PARTS_UNIT_FRACTION = 16
+PROCESS_BACKEND_MIN_FILE_SIZE = 1000 * 1000 * 1000
 ENCRYPTION_ALGORITHM = "AES256"
 ENV_VAR_MAPPER_MAX_CPUS = "ARCHIVER_MAX_CPUS_ENV_VAR"
 DEFAULT_COMPRESSION_LEVEL = 6
-ARCHIVE_SUFFIXES = ['\.part[0-9]+', '\.tar', '\.md5', '\.lz', '\.gpg', '\.lst', '\.parts', '\.txt']
+# dictionary sizes of the plzip compression levels 0-9, plzip compresses blocks of twice the dictionary size
+# (at least LZIP_MIN_DATA_BYTE_SIZE) in parallel, i.e. a part only keeps as many threads busy as it has blocks
+LZIP_DICTIONARY_BYTE_SIZES = [1024 * k for k in (64, 1024, 1536, 2048, 3072, 4096, 8192, 16384, 24576, 32768)]
+LZIP_MIN_DATA_BYTE_SIZE = 1024 * 1024
+# plzip scales poorly beyond this number of threads, with more threads several parts are compressed concurrently
+COMPRESSION_MAX_THREADS_PER_PART = 16
+# rough single-threaded compression speeds of plzip for the levels 0-9, only used for estimates
+LZIP_COMPRESSION_BYTES_PER_SECOND = [1000 * 1000 * s for s in (30, 8, 6.5, 5, 4, 3.5, 2.5, 2, 1.8, 1.5)]
+# adaptive compression puts files which are already compressed into parts of their own compressed at this level,
+# the names of these parts are written to NAME.incompressible.txt
+INCOMPRESSIBLE_COMPRESSION_LEVEL = 0
+INCOMPRESSIBLE_PARTS_SUFFIX = ".incompressible.txt"
+INCOMPRESSIBLE_SUFFIXES = [".bam", ".cram", ".gz", ".bgz", ".tgz", ".bz2", ".xz", ".lz", ".zst", ".zip", ".7z", ".gpg",
+                           ".jpg", ".jpeg", ".png", ".gif", ".mp3", ".mp4", ".mkv", ".avi", ".mov"]
+# files of at least this size are sampled when their suffix isn't known, samples compressing to more than
+# INCOMPRESSIBLE_RATIO of their size with a fast compressor are incompressible
+COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE = 1024 * 1024
+COMPRESSIBILITY_SAMPLE_BYTE_SIZE = 64 * 1024
+INCOMPRESSIBLE_RATIO = 0.95
+ARCHIVE_SUFFIXES = [r'\.part[0-9]+', r'\.tar', r'\.md5', r'\.sha256', r'\.blake2b', r'\.xxh3', r'\.lz', r'\.gpg',
+                    r'\.lst', r'\.idx', r'\.parts', r'\.incompressible', r'\.txt', r'\.chunks', r'\.meta']
 ARCHIVE_SUFFIXES_REG = '$|'.join(ARCHIVE_SUFFIXES) + '$'
 
 MD5_LINE_REGEX = re.compile(r'(\S+)\s+(\S.*)')
+CHUNK_HASH_LINE_REGEX = re.compile(r'(\S+) ([0-9]+|tree) (.*)')
+CHUNK_SIZE_HEADER = "# chunk size "
+# index of the line following the chunks of a file, holding the hash over its concatenated binary chunk hashes
+CHUNK_TREE_HASH_INDEX = "tree"
+
+# file hash lists larger than this are sorted on disk, files are hashed in slices of HASH_LIST_SLICE_NR_FILES
+SORT_MEMORY_BYTE_SIZE = 1024 ** 3
+HASH_LIST_SLICE_NR_FILES = 100 * 1000
+
+# number of directories scanned ahead per thread when walking a tree in parallel, the threads scan the subdirectories
+# they find themselves as long as fewer directories are scanned ahead
+WALKER_PREFETCH_DIRECTORIES_PER_THREAD = 64
+
+HASH_CACHE_FILENAME = "archiver-hash-cache.sqlite"
+# an entry with a single md5 hash takes about 130 bytes, i.e. this covers trees of 50M files with room to spare
+HASH_CACHE_MAX_BYTE_SIZE = 16 * 1024 ** 3
@@ -4,14 +4,18 @@ from pathlib import Path
 import os
 
 from . import helpers
+from . import metadata
 from .constants import REQUIRED_SPACE_MULTIPLIER, ENCRYPTION_ALGORITHM
 
 
 def _encrypt_list_of_archives_fnc(output_dir, archive_path, encryption_keys, delete):
     output_file = output_dir / archive_path.name if output_dir else archive_path
     output_path = helpers.add_suffix_to_path(output_file, ".gpg")
+    # determining hash algorithms before the unencrypted archive is possibly deleted
+    algorithms = helpers.get_hash_algorithms_for_path(archive_path)
     encrypt_archive(archive_path, output_path, encryption_keys, delete)
-    helpers.create_and_write_file_hash(output_path)
+    helpers.create_and_write_file_hash(output_path, algorithms)
+    metadata.create_and_write_metadata(output_path)
 
 
 def encrypt_list_of_archives(archive_list, encryption_keys, delete=False, output_dir=None, threads=1):
@@ -22,9 +26,8 @@ def encrypt_list_of_archives(archive_list, encryption_keys, delete=False, output
                           eff_threads)
 
 
-def encrypt_archive(archive_path, output_path, encryption_keys, delete=False):
-    logging.info("Encrypting archive: " + helpers.get_absolute_path_string(archive_path))
-
+def get_encryption_command(encryption_keys):
+    """:return: gpg command encrypting its standard input, or the file appended to the command, to stdout"""
     argument_encryption_list = []
 
     for key_path_string in encryption_keys:
@@ -33,8 +36,14 @@ def encrypt_archive(archive_path, output_path, encryption_keys, delete=False):
         argument_encryption_list.append("--recipient-file")
         argument_encryption_list.append(key_path)
 
+    return ["gpg", "--cipher-algo", ENCRYPTION_ALGORITHM, "-z", "0", "--batch", "--encrypt"] + argument_encryption_list
+
+
+def encrypt_archive(archive_path, output_path, encryption_keys, delete=False):
+    logging.info("Encrypting archive: " + helpers.get_absolute_path_string(archive_path))
+
     try:
-        helpers.run_shell_cmd(["gpg", "--cipher-algo", ENCRYPTION_ALGORITHM, "-z", "0", "--batch", "--output", output_path, "--encrypt"] + argument_encryption_list + [archive_path])
+        helpers.run_shell_cmd(get_encryption_command(encryption_keys) + ["--output", output_path, archive_path])
         # Is there a way to overwrite the .tar.lz file instead of creating a new encrypted archive before deleting the old one? Eg. by directly piping
         if delete:
             logging.debug("Deleting unencrypted archive: " + helpers.get_absolute_path_string(archive_path))
@@ -3,6 +3,7 @@ import subprocess
 
 from . import helpers
 from . import listing
+from . import member_index
 from .constants import COMPRESSED_ARCHIVE_SUFFIX, ENCRYPTED_ARCHIVE_SUFFIX, \
     REQUIRED_SPACE_MULTIPLIER
 from .encryption import decrypt_list_of_archives
@@ -46,6 +47,9 @@ def extract_archive(source_path, destination_directory_path, partial_extraction_
     else:
         archive_files = archive_files_all
 
+    # the indices are next to the original archives, which may be decrypted elsewhere
+    member_index_paths = [member_index.get_member_index_path(path) for path in archive_files]
+
     if is_encrypted:
         # It might make sense to check that enough space is available for:
         # archive encryption (encrypted archive size * multiplier) AND unencrypted archive size -> hard to estimate on encrypted archive
@@ -61,7 +65,8 @@ def extract_archive(source_path, destination_directory_path, partial_extraction_
 
     ensure_sufficient_disk_capacity_for_extraction(archive_files, destination_directory_path)
 
-    uncompress_and_extract(archive_files, destination_directory_path, threads, partial_extraction_path=partial_extraction_path)
+    uncompress_and_extract(archive_files, destination_directory_path, threads, partial_extraction_path=partial_extraction_path,
+                           member_index_paths=member_index_paths)
 
     logging.info("Archive extracted to: " + helpers.get_absolute_path_string(destination_directory_path))
     if not archive_name:
@@ -69,12 +74,24 @@ def extract_archive(source_path, destination_directory_path, partial_extraction_
     return destination_directory_path / archive_name
 
 
-def uncompress_and_extract(archive_file_paths, destination_directory_path, threads, partial_extraction_path=None, encrypted=False):
-    for archive_path in archive_file_paths:
+def uncompress_and_extract(archive_file_paths, destination_directory_path, threads, partial_extraction_path=None, encrypted=False,
+                           member_index_paths=None):
+    """
+    With partial_extraction_path and an index of the tar members (see member_index) for an archive, only the lzip
+    members containing partial_extraction_path are decompressed instead of the whole archive.
+    """
+    for archive_index, archive_path in enumerate(archive_file_paths):
         logging.info(
             f"Extracting {partial_extraction_path if partial_extraction_path else 'all'} "
             f"from archive {helpers.get_absolute_path_string(archive_path)}")
 
+        index_path = member_index_paths[archive_index] if member_index_paths else None
+        if partial_extraction_path and index_path and index_path.is_file():
+            if member_index.extract_with_index(archive_path, index_path, destination_directory_path,
+                                               partial_extraction_path, threads):
+                logging.info(f"Extracted {partial_extraction_path} from archive {archive_path.stem} using its index")
+                continue
+
         plzip_cmd = ["plzip", "--decompress", "--stdout", archive_path]
         if threads:
             plzip_cmd.extend(["--threads", str(threads)])
@@ -0,0 +1,111 @@
+import logging
+import math
+import sqlite3
+import time
+
+from .constants import HASH_CACHE_MAX_BYTE_SIZE
+
+_INT64_LIMIT = 1 << 63
+
+
+def _as_sqlite_int(value):
+    # sqlite integers are signed 64 bit, whereas device and inode numbers are unsigned
+    return value - (1 << 64) if value >= _INT64_LIMIT else value
+
+
+def _cache_key(stat_result, algorithms):
+    return (_as_sqlite_int(stat_result.st_dev), _as_sqlite_int(stat_result.st_ino),
+            stat_result.st_size, stat_result.st_mtime_ns, ','.join(algorithms))
+
+
+class HashCache:
+    """
+    Persistent cache of file hashes, keyed by (st_dev, st_ino, st_size, st_mtime_ns) and the hash algorithms.
+
+    Allows reruns of the file listing stage to skip hashing of files which haven't changed since the
+    last run. The size of the cache is bounded by max_byte_size, least recently used entries of earlier runs are
+    evicted first, entries used by the current run are never evicted.
+    """
+
+    def __init__(self, path, max_byte_size=HASH_CACHE_MAX_BYTE_SIZE):
+        self.path = path
+        self.max_byte_size = max_byte_size
+        self.run_timestamp = int(time.time())
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(str(path), timeout=600)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, algorithms TEXT, "
+                                "hashes TEXT NOT NULL, last_used INTEGER NOT NULL, "
+                                "PRIMARY KEY (dev, ino, size, mtime_ns, algorithms))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes (last_used)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lookup(self, stat_results, algorithms):
+        """Returns the cached list of hashes (one per algorithm) for every stat result, None if there is no entry"""
+        cursor = self.connection.cursor()
+
+        hashes = []
+        used_keys = []
+        for stat_result in stat_results:
+            key = _cache_key(stat_result, algorithms)
+            row = cursor.execute("SELECT hashes FROM hashes "
+                                 "WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithms=?", key).fetchone()
+            if row:
+                hashes.append(row[0].split(','))
+                used_keys.append((self.run_timestamp,) + key)
+            else:
+                hashes.append(None)
+
+        cursor.executemany("UPDATE hashes SET last_used=? "
+                           "WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithms=?", used_keys)
+        self.connection.commit()
+
+        self.hits += len(used_keys)
+        self.misses += len(hashes) - len(used_keys)
+
+        return hashes
+
+    def store(self, stat_results, hashes, algorithms):
+        self.connection.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    [_cache_key(s, algorithms) + (','.join(h), self.run_timestamp)
+                                     for s, h in zip(stat_results, hashes)])
+        self.connection.commit()
+
+    def get_byte_size(self):
+        """:return: size of the pages in use, pages freed by evictions are reused by later runs"""
+        page_size, page_count, freelist_count = (self.connection.execute(f"PRAGMA {pragma}").fetchone()[0]
+                                                 for pragma in ("page_size", "page_count", "freelist_count"))
+        return page_size * (page_count - freelist_count)
+
+    def evict(self):
+        byte_size = self.get_byte_size()
+        if byte_size <= self.max_byte_size:
+            return
+
+        nr_entries = self.connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        # assuming entries of similar size
+        excess = math.ceil(nr_entries * (byte_size - self.max_byte_size) / byte_size)
+
+        # ties are broken by insertion order, s.t. the same entries are evicted on every run
+        evicted = self.connection.execute("DELETE FROM hashes WHERE rowid IN "
+                                          "(SELECT rowid FROM hashes WHERE last_used < ? "
+                                          "ORDER BY last_used, rowid LIMIT ?)", (self.run_timestamp, excess)).rowcount
+        self.connection.commit()
+        logging.info(f"Evicted {evicted} entries of earlier runs from hash cache {self.path}")
+
+        if evicted < excess:
+            logging.warning(f"The entries of this run exceed the hash cache size of {self.max_byte_size} bytes, "
+                            f"increase it with --hash-cache-size")
+
+    def close(self):
+        logging.info(f"Hash cache {self.path}: {self.hits} hits, {self.misses} misses")
+        self.evict()
+        self.connection.close()
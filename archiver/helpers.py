@@ -1,4 +1,6 @@
 import re
+import contextlib
+import signal
 import sys
 import os
 import hashlib
@@ -7,13 +9,30 @@ import subprocess
 import logging
 import time
 import shutil
+import tempfile
 import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Union, Sequence
 import unicodedata
 
-from .constants import READ_CHUNK_BYTE_SIZE, COMPRESSED_ARCHIVE_SUFFIX, \
+from . import lzip
+from .tree_index import build_tree_index
+from .walker import FileEntry, get_allocated_size, get_file_entry, scan_tree
+from .constants import COMPRESSED_ARCHIVE_SUFFIX, \
     ENCRYPTED_ARCHIVE_SUFFIX, ENV_VAR_MAPPER_MAX_CPUS, MD5_LINE_REGEX, \
-    ARCHIVE_SUFFIXES_REG
+    ARCHIVE_SUFFIXES_REG, DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, \
+    PARALLEL_BATCH_BYTE_SIZE, PARALLEL_BATCH_MAX_ITEMS, DEFAULT_HASH_BACKEND, \
+    PROCESS_BACKEND_MIN_FILE_SIZE, HASH_CHUNK_MIN_BYTE_SIZE, HASH_CHUNK_MAX_BYTE_SIZE, CHUNK_HASH_LINE_REGEX, \
+    CHUNK_SIZE_HEADER, CHUNK_TREE_HASH_INDEX
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# read buffer of every thread, reused for hashing all files processed by that thread
+_read_buffers = threading.local()
 
 
 def get_files_with_type_in_directory_or_terminate(directory, file_type):
@@ -41,15 +60,70 @@ def get_absolute_path_string(path):
     return path.absolute().as_posix()
 
 
-def create_and_write_file_hash(file_path):
+def create_and_write_file_hash(file_path, algorithms=(DEFAULT_HASH_ALGORITHM,)):
     """Will save the file in same directory"""
 
-    hash_output = get_file_hash_from_path(file_path)
+    hashes = get_file_hashes_from_path(file_path, algorithms)
+    write_file_hashes(file_path, hashes, algorithms)
+
+
+def write_file_hashes(file_path, hashes, algorithms):
+    for algorithm, hash_output in zip(algorithms, hashes):
+        write_file_hash(file_path, hash_output, algorithm)
 
-    with open(file_path.as_posix() + ".md5", "w") as hash_file:
+
+def write_file_hash(file_path, hash_output, algorithm=DEFAULT_HASH_ALGORITHM):
+    """Writes an already computed hash of a file next to it"""
+
+    with open(file_path.as_posix() + hash_suffix(algorithm), "w") as hash_file:
         hash_file.write(f"{hash_output}  {file_path.name}\n")
 
 
+def hash_suffix(algorithm):
+    return f".{algorithm}"
+
+
+def hash_algorithm_from_path(hash_file_path):
+    algorithm = hash_file_path.suffix[1:]
+
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm for hash file {hash_file_path}")
+
+    return algorithm
+
+
+def get_hash_algorithms_for_path(path):
+    """
+    Returns the algorithms for which hash files of path exist (i.e. path.md5, path.sha256 etc).
+    Falls back to the default algorithm if there are none.
+    """
+    algorithms = [a for a in HASH_ALGORITHMS if add_suffix_to_path(path, hash_suffix(a)).is_file()]
+
+    return algorithms if algorithms else [DEFAULT_HASH_ALGORITHM]
+
+
+def get_hash_file_for_path(path):
+    """Returns the first existing hash file of path in the order of HASH_ALGORITHMS, None if there is none"""
+    for algorithm in HASH_ALGORITHMS:
+        hash_file_path = add_suffix_to_path(path, hash_suffix(algorithm))
+        if hash_file_path.is_file():
+            return hash_file_path
+
+    return None
+
+
+def get_hasher(algorithm):
+    if algorithm == "xxh3":
+        if not xxhash:
+            raise ValueError("Hash algorithm xxh3 requires the xxhash package to be installed.")
+        return xxhash.xxh3_128()
+
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm {algorithm}. Supported are: {', '.join(HASH_ALGORITHMS)}")
+
+    return hashlib.new(algorithm)
+
+
 def read_file_listing(file_path):
 
     listing = []
@@ -94,25 +168,118 @@ def read_hash_file(file_path):
     return hash_dict
 
 
-def get_file_hash_from_path(file_path):
+def read_chunk_hash_file(file_path):
+    """
+    Reads a chunk hash list as written by archive.write_chunk_hash_files
+
+    :return: chunk size, dictionary of (path, chunk index) to chunk hash and dictionary of path to tree hash
+    """
+    chunk_hashes = {}
+    tree_hashes = {}
+
+    with open(file_path, "r", newline='\n') as file:
+        header = file.readline()
+        if not header.startswith(CHUNK_SIZE_HEADER):
+            raise ValueError(f"Chunk size header missing in {file_path}")
+        chunk_size = int(header[len(CHUNK_SIZE_HEADER):])
+
+        for l in file:
+            m = CHUNK_HASH_LINE_REGEX.match(l.rstrip('\n'))
+            if not m:
+                raise ValueError(f"Not properly formatted chunk hash line found in file {file_path}: {l}")
+
+            hash_val, index, path = m.groups()
+
+            if hash_val.startswith('\\'):
+                # reverse of archive._escape_path
+                hash_val = hash_val[1:]
+                path = path.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+
+            if index == CHUNK_TREE_HASH_INDEX:
+                tree_hashes[path] = hash_val
+            else:
+                chunk_hashes[(path, int(index))] = hash_val
+
+    return chunk_size, chunk_hashes, tree_hashes
+
+
+def get_file_hash_from_path(file_path, algorithm=DEFAULT_HASH_ALGORITHM):
+    return get_file_hashes_from_path(file_path, (algorithm,))[0]
+
+
+def get_file_hashes_from_path(file_path, algorithms):
+    """Computes the hashes of a file for several algorithms, reading the file only once"""
     if file_path.is_symlink():
-        return get_symlink_path_hash(file_path)
+        return get_symlink_path_hashes(file_path, algorithms)
+
+    return get_file_range_hashes(file_path, 0, None, algorithms)
 
-    hasher = hashlib.md5()
 
-    with open(file_path, "rb") as file:
-        for chunk in iter(lambda: file.read(READ_CHUNK_BYTE_SIZE), b""):
-            hasher.update(chunk)
+def get_file_range_hashes(file_path, offset, length, algorithms):
+    """Computes the hashes of length bytes starting at offset of a file, up to the end of the file if length is None"""
+    hashers = [get_hasher(a) for a in algorithms]
+
+    # unbuffered, s.t. data is read directly into the reused buffer without intermediate copies
+    with open(file_path, "rb", buffering=0) as file:
+        chunk_size = get_read_chunk_size(os.fstat(file.fileno()))
+        buffer = memoryview(_get_read_buffer(chunk_size))[:chunk_size]
+
+        file.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            nr_bytes = file.readinto(buffer if remaining is None else buffer[:remaining])
+            if not nr_bytes:
+                break
+
+            chunk = buffer[:nr_bytes]
+            for hasher in hashers:
+                hasher.update(chunk)
+
+            if remaining is not None:
+                remaining -= nr_bytes
+
+    return [hasher.hexdigest() for hasher in hashers]
+
+
+def get_tree_hash(chunk_hashes, algorithm):
+    """Hash of a file hashed in chunks, computed over the concatenated binary chunk hashes"""
+    hasher = get_hasher(algorithm)
+    for chunk_hash in chunk_hashes:
+        hasher.update(bytes.fromhex(chunk_hash))
 
     return hasher.hexdigest()
 
 
-def get_symlink_path_hash(symlink_path):
-    hasher = hashlib.md5()
+def get_read_chunk_size(stat_result):
+    """Chunk size to read a file with, a multiple of the block size preferred by its filesystem"""
+    block_size = max(stat_result.st_blksize, 1)
+    nr_blocks = -(-HASH_CHUNK_MIN_BYTE_SIZE // block_size)
+
+    return min(nr_blocks * block_size, HASH_CHUNK_MAX_BYTE_SIZE)
+
+
+def _get_read_buffer(byte_size):
+    buffer = getattr(_read_buffers, "buffer", None)
+
+    if buffer is None or len(buffer) < byte_size:
+        buffer = bytearray(byte_size)
+        _read_buffers.buffer = buffer
+
+    return buffer
+
+
+def get_symlink_path_hash(symlink_path, algorithm=DEFAULT_HASH_ALGORITHM):
+    return get_symlink_path_hashes(symlink_path, (algorithm,))[0]
+
+
+def get_symlink_path_hashes(symlink_path, algorithms):
     encoded_text_symlink = os.readlink(symlink_path).encode("utf-8")
-    hasher.update(encoded_text_symlink)
 
-    return hasher.hexdigest()
+    hashers = [get_hasher(a) for a in algorithms]
+    for hasher in hashers:
+        hasher.update(encoded_text_symlink)
+
+    return [hasher.hexdigest() for hasher in hashers]
 
 
 def _check_symlinks(abs_file, relative_to_path, integrity_check=False):
@@ -130,14 +297,15 @@ def _check_symlinks(abs_file, relative_to_path, integrity_check=False):
     else:
         # archiving
         absolute_root = relative_to_path.resolve().absolute()
-        if absolute_root not in abs_file.resolve().parents:
+        resolved_file = abs_file.resolve()
+        if absolute_root not in resolved_file.parents:
             logging.warning(
-                f"Symlink with outside target {abs_file.relative_to(relative_to_path.parent)} found pointing to {abs_file.resolve()} "
-                f"which is outside the archiving directory {relative_to_path.resolve().absolute()}."
+                f"Symlink with outside target {abs_file.relative_to(relative_to_path.parent)} found pointing to {resolved_file} "
+                f"which is outside the archiving directory {absolute_root}."
                 f" The archive will contain the link itself, but not the file it points to.")
-        elif not abs_file.resolve().exists():
+        elif not resolved_file.exists():
             logging.warning(
-                f"Broken symlink {abs_file.relative_to(relative_to_path.parent)} found pointing to a non-existing file {abs_file.resolve()} ."
+                f"Broken symlink {abs_file.relative_to(relative_to_path.parent)} found pointing to a non-existing file {resolved_file} ."
                 f" The archive will only contain the link itself")
         elif link.is_absolute():
             # target exists and is within tree to be archived, however, link is absolute,
@@ -147,37 +315,120 @@ def _check_symlinks(abs_file, relative_to_path, integrity_check=False):
                             f"resolved when unpacking the archive on another system.")
 
 
-def hash_files_and_check_symlinks(source_path, abs_paths, max_workers=1, integrity_check=False):
+def hash_files_and_check_symlinks(source_path, abs_paths, max_workers=1, integrity_check=False, hash_cache=None,
+                                  algorithms=(DEFAULT_HASH_ALGORITHM,), backend=DEFAULT_HASH_BACKEND, chunk_size=None,
+                                  chunk_hashes=None):
+    """
+    Hashes files and symlinks in abs_paths and warns about problematic symlinks. abs_paths may contain paths or
+    FileEntry objects (see walker.scan_tree), which avoids stat'ing the files again.
+    The backend ("thread", "process" or "auto") determines the executor used to hash files in parallel.
+
+    If chunk_size is given, files larger than chunk_size are additionally hashed in chunks of that size in parallel
+    and [path, chunk index, hash per algorithm...] of every chunk is appended to chunk_hashes.
+
+    :return: list of [path relative to the parent of source_path, hash of first algorithm, hash of second algorithm, ...]
+    """
+    entries = [p if isinstance(p, FileEntry) else get_file_entry(p) for p in abs_paths]
+
     # ignoring other file types like FIFO, sockets etc
-    file_list = [f for f in abs_paths if f.is_symlink() or f.is_file()]
+    entries = [e for e in entries if e.is_symlink() or e.is_file()]
+
+    [_check_symlinks(e.path, source_path, integrity_check=integrity_check) for e in entries if e.is_symlink()]
 
-    [_check_symlinks(f, source_path, integrity_check=integrity_check) for f in file_list]
+    if hash_cache:
+        hashes_list, chunks_by_index = _hash_files_with_cache(entries, max_workers, hash_cache, algorithms, backend,
+                                                              chunk_size)
+    else:
+        hashes_list, chunks_by_index = _hash_files(entries, max_workers, algorithms, backend, chunk_size)
 
-    hashes_list = exec_parallel(get_file_hash_from_path, file_list, lambda f: (f,), max_workers)
+    relative_paths = [unicodedata.normalize('NFC', e.path.relative_to(source_path.parent).as_posix()) for e in entries]
 
-    return [[unicodedata.normalize('NFC', e[0].relative_to(source_path.parent).as_posix()), e[1]] for e
-            in zip(file_list, hashes_list)]
+    if chunk_hashes is not None:
+        for i, chunks in chunks_by_index.items():
+            chunk_hashes.extend([relative_paths[i], str(index)] + list(h) for index, h in enumerate(chunks))
 
+    return [[path] + list(hashes) for path, hashes in zip(relative_paths, hashes_list)]
 
-def get_files_in_folder(folder_path, include_dirs=False):
-    listing = []
-    for root, dirs, files in os.walk(folder_path):
-        root_path = Path(root)
-        for file in files:
-            abs_file = root_path.joinpath(file)
-            listing.append(abs_file)
-        dirs_ = []
-        for dir in dirs:
-            abs_dir = root_path.joinpath(dir)
-            if Path(abs_dir).is_symlink():
-                listing.append(abs_dir)
+
+def _hash_range(file_path, offset, length, algorithms):
+    if offset is None:
+        return get_file_hashes_from_path(file_path, algorithms)
+    return get_file_range_hashes(file_path, offset, length, algorithms)
+
+
+def _hash_files(entries, max_workers, algorithms, backend, chunk_size=None):
+    """:return: hashes of every file entry and the chunk hashes by index in entries of files hashed in chunks"""
+    # symlinks are hashed by their target path, so their size is negligible
+    sizes = [0 if e.is_symlink() else e.stat.st_size for e in entries]
+
+    # work items (index in file_list, offset, length), where the offset is None for hashing the whole file.
+    # Files hashed in chunks are hashed as a whole as well, in parallel to their chunks, s.t. the hash lists keep
+    # the digests of the file content.
+    items = [(i, None, size) for i, size in enumerate(sizes)]
+    for i, size in enumerate(sizes):
+        if chunk_size and size > chunk_size:
+            items.extend((i, offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size))
+
+    if backend == "auto":
+        # hashlib releases the GIL while hashing, so threads avoid the serialization of paths and results
+        # between processes. Only huge files, where this overhead is negligible, are hashed in processes.
+        items_by_backend = {"process": [e for e in items if e[2] >= PROCESS_BACKEND_MIN_FILE_SIZE],
+                            "thread": [e for e in items if e[2] < PROCESS_BACKEND_MIN_FILE_SIZE]}
+    else:
+        items_by_backend = {backend: items}
+
+    hashes_list = [None] * len(entries)
+    chunks_by_index = {}
+    for backend_used, backend_items in items_by_backend.items():
+        if not backend_items:
+            continue
+
+        logging.info(f"Hashing {len(backend_items)} files or chunks using the {backend_used} backend "
+                     f"with {max_workers} workers")
+        hashes = exec_parallel_largest_first(_hash_range, backend_items,
+                                             lambda e: (entries[e[0]].path, e[1], e[2], algorithms),
+                                             [e[2] for e in backend_items], max_workers, backend=backend_used)
+
+        for (i, offset, _), h in zip(backend_items, hashes):
+            if offset is None:
+                hashes_list[i] = h
             else:
-                if include_dirs:
-                    listing.append(abs_dir)
-                dirs_.append(dir)
-        dirs[:] = dirs_
+                chunks_by_index.setdefault(i, {})[offset] = h
+
+    chunks_by_index = {i: [chunks[offset] for offset in sorted(chunks)] for i, chunks in chunks_by_index.items()}
+
+    return hashes_list, chunks_by_index
+
+
+def _hash_files_with_cache(entries, max_workers, hash_cache, algorithms, backend, chunk_size=None):
+    # symlinks are cheap to hash, only caching hashes of regular files. Chunk hashes are not cached,
+    # so files hashed in chunks are always hashed.
+    regular_files = [(i, e.stat) for i, e in enumerate(entries) if not e.is_symlink()]
+    if chunk_size:
+        regular_files = [(i, s) for i, s in regular_files if s.st_size <= chunk_size]
+    cached_hashes = hash_cache.lookup([s for _, s in regular_files], algorithms)
+
+    hashes_list = [None] * len(entries)
+    for (i, _), cached_hash in zip(regular_files, cached_hashes):
+        hashes_list[i] = cached_hash
+
+    missing = [i for i, h in enumerate(hashes_list) if h is None]
+    logging.info(f"Found {len(entries) - len(missing)} of {len(entries)} file hashes in cache, hashing remaining files.")
+
+    computed, computed_chunks = _hash_files([entries[i] for i in missing], max_workers, algorithms, backend, chunk_size)
+    for i, h in zip(missing, computed):
+        hashes_list[i] = h
+    chunks_by_index = {missing[i]: chunks for i, chunks in computed_chunks.items()}
+
+    stat_by_index = dict(regular_files)
+    hash_cache.store([stat_by_index[i] for i in missing if i in stat_by_index],
+                     [hashes_list[i] for i in missing if i in stat_by_index], algorithms)
+
+    return hashes_list, chunks_by_index
 
-    return listing
+
+def get_files_in_folder(folder_path, include_dirs=False, walkers=1):
+    return [e.path for e in scan_tree(folder_path, include_dirs, walkers)]
 
 
 def get_threads_from_args_or_environment(threads_arg):
@@ -230,14 +481,11 @@ def get_max_number_of_threads():
 
 
 def get_uncompressed_archive_size_in_bytes(archive_file_path):
-    # Not providing the option to manually specify number of threads to keep the API simple
-    threads_argument = ["--threads", str(get_number_of_threads())]
-
     try:
-        # Using
-        sp = run_shell_cmd(["plzip", "-l", archive_file_path] + threads_argument)
-        return int(sp.stdout.decode("utf-8").splitlines()[-1].lstrip().split(' ', 1)[0])
-    except subprocess.CalledProcessError:
+        # only reading the member trailers instead of running plzip --list
+        return lzip.get_uncompressed_size(archive_file_path)
+    except (OSError, ValueError) as error:
+        logging.error(f"Reading the lzip trailers of {archive_file_path} failed: {error}")
         terminate_with_message("Failed to fetch uncompressed archive size.")
 
 
@@ -263,27 +511,15 @@ def get_size_of_file(path):
     if not path.is_file():
         raise ValueError(f"Path {get_absolute_path_string(path)} must be a file.")
 
-    return path.stat().st_size
+    # sparse files are counted without holes
+    return get_allocated_size(path.stat())
 
 
 def get_size_of_directory(path, deep=False):
     if deep:
         return sum(f.stat().st_size for f in path.glob('**/*') if f.is_file())
 
-    command = ["du", "-shb", '"' + str(path) + '"' ] if plattform_is_linux() else ["du", "-sh", '"' + str(path) + '"' ]
-
-    parsed_output = run_shell_cmd(command).stdout.decode("utf-8")
-
-    dir_size = re.split(r'\t+', parsed_output.lstrip())[0]
-
-    try:
-        return int(dir_size)
-    except ValueError:
-        return get_bytes_in_string_with_unit(dir_size)
-
-
-def plattform_is_linux():
-    return sys.platform == "linux" or sys.platform == "linux2"
+    return build_tree_index(path).byte_size
 
 
 units = {"B": 1, "KB": 2**10, "K": 2**10, "MB": 2**20, "M": 2**20, "GB": 2**30, "G": 2**30, "TB": 2**40, "T": 2**40}
@@ -335,8 +571,12 @@ def get_archives_from_path(path, is_encrypted):
     return [path]
 
 
+def is_valid_archive_file(file_path):
+    return file_has_type(file_path, COMPRESSED_ARCHIVE_SUFFIX) or file_has_type(file_path, ENCRYPTED_ARCHIVE_SUFFIX)
+
+
 def file_is_valid_archive_or_terminate(file_path):
-    if not (file_has_type(file_path, COMPRESSED_ARCHIVE_SUFFIX) or file_has_type(file_path, ENCRYPTED_ARCHIVE_SUFFIX)):
+    if not is_valid_archive_file(file_path):
         terminate_with_message(f"File {file_path.as_posix()} is not a valid archive of type {COMPRESSED_ARCHIVE_SUFFIX} or {ENCRYPTED_ARCHIVE_SUFFIX} or doesn't exist.")
 
 
@@ -510,14 +750,221 @@ def run_shell_cmd(cmd: Union[str, List], file_output: Path = None, pipe_stdout=F
         raise(e)
 
 
-def exec_parallel(fnc, loop_var, args_fnc, threads):
+def run_cmd_with_hashed_output(cmd, output_path, algorithms=(DEFAULT_HASH_ALGORITHM,), sinks=()):
+    """
+    Runs cmd and writes its standard output to output_path. The output is hashed while it is
+    written, s.t. it doesn't need to be read again afterwards.
+
+    :param sinks: file-like objects which also get the output written to and are closed at the end
+    :return: hash of the output for every algorithm
+    """
+    return run_pipeline_with_hashed_outputs([cmd], output_path, algorithms, sinks={0: sinks})[0]
+
+
+def run_pipeline_with_hashed_outputs(cmds, output_path, algorithms=(DEFAULT_HASH_ALGORITHM,), taps=None, sinks=None):
+    """
+    Runs cmds as a pipeline, i.e. like `cmd1 | cmd2 | ... > output_path`. The output of every command is passed on
+    by this process and hashed on the way, s.t. intermediate outputs don't need to be written and read again.
+
+    :param taps: optional {index in cmds: [(tap_cmd, tap_output_path), ...]}, the output of cmds[index] is also
+    passed to the standard input of tap_cmd, whose output is written to tap_output_path
+    :param sinks: optional {index in cmds: [file-like object, ...]}, the output of cmds[index] is also written to
+    these objects within this process, e.g. to list a tar archive while it is written. They are closed at the end.
+    :return: for every command, the hash of its output for every algorithm
+    """
+    cmds = [[str(e) for e in cmd] for cmd in cmds]
+    logging.debug(f"Executing pipeline: '{' | '.join(' '.join(cmd) for cmd in cmds)}' writing output to {output_path}")
+
+    with contextlib.ExitStack() as stack:
+        output_file = stack.enter_context(open(output_path, "wb"))
+        processes = []
+        tap_processes = {}
+
+        for cmd in cmds:
+            stdin = subprocess.PIPE if processes else None
+            processes.append(_start_pipeline_process(stack, cmd, stdin, subprocess.PIPE))
+
+        for index, index_taps in (taps or {}).items():
+            tap_processes[index] = [_start_pipeline_process(stack, [str(e) for e in tap_cmd], subprocess.PIPE,
+                                                            stack.enter_context(open(tap_output_path, "wb")))
+                                    for tap_cmd, tap_output_path in index_taps]
+
+        hashers = [[get_hasher(a) for a in algorithms] for _ in cmds]
+        # every command writes into the next one, the last one into the output file
+        outputs = [p.stdin for p in processes[1:]] + [output_file]
+        pumps = [(process.stdout, hashers[i], [outputs[i]] + list((sinks or {}).get(i, [])),
+                  [p.stdin for p in tap_processes.get(i, [])])
+                 for i, process in enumerate(processes)]
+
+        # the output of the last command is passed on by the calling thread, all others by one thread each
+        with ThreadPoolExecutor(max_workers=max(len(pumps) - 1, 1)) as executor:
+            futures = [executor.submit(_pump_stream, *pump) for pump in pumps[:-1]]
+            _pump_stream(*pumps[-1])
+            [f.result() for f in futures]
+
+        failed = [(cmd, p) for cmd, p in zip(cmds, processes) if p.wait() != 0]
+        failed += [(p.args, p) for ps in tap_processes.values() for p in ps if p.wait() != 0]
+        # processes killed by a broken pipe only failed because a later process failed
+        failed.sort(key=lambda f: f[1].returncode == -signal.SIGPIPE)
+
+        stderrs = []
+        for _, process in failed:
+            process.stderr_file.seek(0)
+            stderrs.append(process.stderr_file.read())
+
+    if failed:
+        output_path.unlink()
+
+        (cmd, process), stderr = failed[0], stderrs[0]
+        e = subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+        logging.exception(e)
+        logging.error(f"subprocess stderr was: {stderr.decode() if stderr else '<empty>'}")
+        raise e
+
+    return [[hasher.hexdigest() for hasher in cmd_hashers] for cmd_hashers in hashers]
+
+
+def _start_pipeline_process(stack, cmd, stdin, stdout):
+    # stderr goes to a file, as reading only stdout could block the process once the stderr pipe is full
+    stderr_file = stack.enter_context(tempfile.TemporaryFile())
+    process = stack.enter_context(subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr_file))
+    process.stderr_file = stderr_file
+    return process
+
+
+def _pump_stream(source, hashers, sinks, optional_sinks):
+    """
+    Copies source to all sinks, hashing the data on the way. Optional sinks (e.g. a listing of the stream)
+    are dropped once they stop reading. Pipes are closed at the end, s.t. the processes see the end of their input.
+    """
+    buffer = memoryview(_get_read_buffer(HASH_CHUNK_MIN_BYTE_SIZE))[:HASH_CHUNK_MIN_BYTE_SIZE]
+    optional_sinks = list(optional_sinks)
+
+    try:
+        for nr_bytes in iter(lambda: source.readinto(buffer), 0):
+            chunk = buffer[:nr_bytes]
+            for hasher in hashers:
+                hasher.update(chunk)
+            for sink in sinks:
+                sink.write(chunk)
+            for sink in list(optional_sinks):
+                try:
+                    sink.write(chunk)
+                except BrokenPipeError:
+                    # e.g. tar -t exits after the end of archive marker without reading the padding
+                    optional_sinks.remove(sink)
+    except BrokenPipeError:
+        # the next process failed, which is reported by its return code
+        pass
+    finally:
+        # the preceding process gets a broken pipe if it is still writing
+        source.close()
+        for sink in sinks + optional_sinks:
+            try:
+                sink.close()
+            except BrokenPipeError:
+                pass
+
+
+def exec_parallel(fnc, loop_var, args_fnc, threads, backend="process"):
     args = [args_fnc(l) for l in loop_var]
     if threads == 1:
         # if only one thread, don't invoke multiprocessing in order to avoid potential issues
         return [fnc(*a) for a in args]
+    elif backend == "thread":
+        with ThreadPoolExecutor(threads) as executor:
+            return list(executor.map(lambda a: fnc(*a), args))
     else:
         with multiprocessing.Pool(threads) as pool:
             # using starmap instead of map with lambdas taking a loop parameter
             # and invoking the function of interest in order to avoid serialization issues
             # with multiprocessing
             return pool.starmap(fnc, args)
+
+
+def _exec_batch(fnc_and_batch):
+    fnc, indexed_args = fnc_and_batch
+    return [(i, fnc(*a)) for i, a in indexed_args]
+
+
+def _batches_largest_first(sizes, threads):
+    """
+    Groups indices into batches ordered by decreasing size (longest processing time first). Large items form
+    their own batch, smaller items are grouped s.t. the overhead per item stays low.
+    """
+    # keeping several batches per worker also for small inputs, s.t. the load is still balanced
+    min_nr_batches = 4 * threads
+    # at least a byte, otherwise empty files would all count as large
+    max_batch_size = max(1, min(PARALLEL_BATCH_BYTE_SIZE, sum(sizes) // min_nr_batches))
+    max_batch_items = max(1, min(PARALLEL_BATCH_MAX_ITEMS, len(sizes) // min_nr_batches))
+
+    batches = []
+    batch = []
+    batch_size = 0
+
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        if sizes[i] >= max_batch_size:
+            batches.append([i])
+            continue
+
+        batch.append(i)
+        batch_size += sizes[i]
+
+        if len(batch) >= max_batch_items or batch_size >= max_batch_size:
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _imap_unordered(fnc, iterable, threads, backend):
+    if backend == "thread":
+        with ThreadPoolExecutor(threads) as executor:
+            # the executor processes submitted work in order
+            for future in as_completed([executor.submit(fnc, e) for e in iterable]):
+                yield future.result()
+    else:
+        with multiprocessing.Pool(threads) as pool:
+            yield from pool.imap_unordered(fnc, iterable)
+
+
+def exec_parallel_largest_first(fnc, loop_var, args_fnc, sizes, threads, backend="process"):
+    """
+    Same as exec_parallel, but work is scheduled by decreasing size to avoid a large item processed at the end
+    keeping a single worker busy while the others are idle. The results are returned in the order of loop_var.
+    """
+    args = [args_fnc(l) for l in loop_var]
+    if threads == 1 or len(args) <= 1:
+        return [fnc(*a) for a in args]
+
+    batches = [[(i, args[i]) for i in batch] for batch in _batches_largest_first(sizes, threads)]
+
+    results = [None] * len(args)
+    # batches are handed out one by one, s.t. idle workers pick up the next largest item
+    for batch_result in _imap_unordered(_exec_batch, [(fnc, b) for b in batches], threads, backend):
+        for i, r in batch_result:
+            results[i] = r
+
+    return results
+
+
+class ThreadBudget:
+    """Number of threads shared by concurrent jobs, a job waits until the threads it needs are free"""
+
+    def __init__(self, threads):
+        self.free = threads
+        self._condition = threading.Condition()
+
+    def acquire(self, threads):
+        with self._condition:
+            self._condition.wait_for(lambda: self.free >= threads)
+            self.free -= threads
+
+    def release(self, threads):
+        with self._condition:
+            self.free += threads
+            self._condition.notify_all()
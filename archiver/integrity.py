@@ -3,21 +3,25 @@ import tempfile
 from pathlib import Path
 
 from . import helpers
+from . import metadata
 from .constants import COMPRESSED_ARCHIVE_SUFFIX, ENCRYPTED_ARCHIVE_SUFFIX, \
-    LISTING_SUFFIX, HASH_SUFFIX, TAR_HASH_SUFFIX, COMPRESSED_ARCHIVE_HASH_SUFFIX, \
-    ENCRYPTED_ARCHIVE_HASH_SUFFIX
+    LISTING_SUFFIX, DEFAULT_HASH_BACKEND, CHUNK_HASH_SUFFIX
 from .extract import extract_archive
 from .listing import parse_tar_listing
 
 
-def check_integrity(source_path, deep_flag=False, threads=None, work_dir=None, archive_name=None):
+def check_integrity(source_path, deep_flag=False, threads=None, work_dir=None, archive_name=None,
+                    hash_backend=DEFAULT_HASH_BACKEND, quick=False):
 
     archives_with_hashes = get_archives_with_hashes_from_path(source_path)
     is_encrypted = helpers.path_target_is_encrypted(source_path)
 
     logging.info("Starting integrity check on: " + source_path.as_posix())
 
-    check_result = shallow_integrity_check(archives_with_hashes, workers=threads)
+    if quick:
+        check_result = quick_integrity_check(archives_with_hashes)
+    else:
+        check_result = shallow_integrity_check(archives_with_hashes, workers=threads)
 
     if source_path.is_dir():
         integrity_result = check_archive_list_integrity(source_path, archive_name)
@@ -34,7 +38,7 @@ def check_integrity(source_path, deep_flag=False, threads=None, work_dir=None, a
     if deep_flag:
         # with deep flag still continue, no matter what the result of the previous test was
         deep_check_result = deep_integrity_check(archives_with_hashes,
-                                                 is_encrypted, threads, work_dir, archive_name)
+                                                 is_encrypted, threads, work_dir, archive_name, hash_backend)
 
         if check_result and deep_check_result:
             logging.info("Deep integrity check successful.")
@@ -46,11 +50,12 @@ def check_integrity(source_path, deep_flag=False, threads=None, work_dir=None, a
                 "Deep integrity check unsuccessful. Archive has been changed since creation.")
         return check_result and deep_check_result
 
+    check_name = "Quick" if quick else "Basic"
     if not check_result:
         logging.error(
-            "Basic integrity check unsuccessful. Archive has been changed since creation.")
+            f"{check_name} integrity check unsuccessful. Archive has been changed since creation.")
     else:
-        logging.info("Basic integrity check successful.")
+        logging.info(f"{check_name} integrity check successful.")
 
     return check_result
 
@@ -58,19 +63,28 @@ def check_integrity(source_path, deep_flag=False, threads=None, work_dir=None, a
 def check_archive_part_integrity(source_name: Path) -> bool:
 
     check_result = True
-    for s in [HASH_SUFFIX, TAR_HASH_SUFFIX, LISTING_SUFFIX]:
+    listing_path = source_name.parent / Path(source_name.name + LISTING_SUFFIX)
+    if not listing_path.is_file():
+        logging.warning(f"Expected file {listing_path.as_posix()} does not exists.")
+        check_result = False
+
+    # hash lists may have been created with any of the supported hash algorithms
+    for s in ['', '.tar']:
         path = source_name.parent / Path(source_name.name + s)
-        if not path.is_file():
-            logging.warning(f"Expected file {path.as_posix()} does not exists.")
+        if not helpers.get_hash_file_for_path(path):
+            logging.warning(f"Expected hash file {path.as_posix()}.md5 (or other hash algorithm) does not exists.")
             check_result = False
 
-    for s in [(COMPRESSED_ARCHIVE_SUFFIX, ENCRYPTED_ARCHIVE_SUFFIX),
-              (COMPRESSED_ARCHIVE_HASH_SUFFIX, ENCRYPTED_ARCHIVE_HASH_SUFFIX)]:
-        path_c = source_name.parent / Path(source_name.name + s[0])
-        path_e = source_name.parent / Path(source_name.name + s[1])
-        if not (path_c.is_file() or path_e.is_file()):
-            logging.warning(f"Neither of the expected files {path_c.as_posix()} and {path_e.as_posix()} exist.")
-            check_result = False
+    path_c = source_name.parent / Path(source_name.name + COMPRESSED_ARCHIVE_SUFFIX)
+    path_e = source_name.parent / Path(source_name.name + ENCRYPTED_ARCHIVE_SUFFIX)
+    if not (path_c.is_file() or path_e.is_file()):
+        logging.warning(f"Neither of the expected files {path_c.as_posix()} and {path_e.as_posix()} exist.")
+        check_result = False
+
+    if not (helpers.get_hash_file_for_path(path_c) or helpers.get_hash_file_for_path(path_e)):
+        logging.warning(f"Neither of the expected hash files {path_c.as_posix()}.md5 and {path_e.as_posix()}.md5 "
+                        f"(or other hash algorithm) exist.")
+        check_result = False
 
     return check_result
 
@@ -111,6 +125,13 @@ def shallow_integrity_check(archives_with_hashes, workers=None):
     return all(ret)
 
 
+def quick_integrity_check(archives_with_hashes):
+    """Verifies size and format specific metadata of the archives recorded at creation time without reading them"""
+    ret = [metadata.verify_metadata(archive[0]) for archive in archives_with_hashes]
+
+    return all(ret)
+
+
 def verify_relative_symbolic_links(archives_with_hashes):
     """
     Checks whether relative links in archives can be resolved.
@@ -151,7 +172,8 @@ def verify_relative_symbolic_links(archives_with_hashes):
     return missing
 
 
-def deep_integrity_check(archives_with_hashes, is_encrypted, threads, work_dir, archive_name=None):
+def deep_integrity_check(archives_with_hashes, is_encrypted, threads, work_dir, archive_name=None,
+                         hash_backend=DEFAULT_HASH_BACKEND):
     # verify link structure
     missing_links = verify_relative_symbolic_links(archives_with_hashes)
 
@@ -172,9 +194,22 @@ def deep_integrity_check(archives_with_hashes, is_encrypted, threads, work_dir,
             terminate_if_extracted_archive_not_existing(archive_content_path)
 
             files = helpers.get_files_in_folder(archive_content_path)
-            hash_result = helpers.hash_files_and_check_symlinks(archive_content_path, files, max_workers=threads, integrity_check=True)
+            algorithm = helpers.hash_algorithm_from_path(expected_listing_hash_path)
+
+            # large files may have been hashed in chunks
+            chunk_hash_path = Path(str(expected_listing_hash_path) + CHUNK_HASH_SUFFIX)
+            chunk_size, expected_chunk_hashes, _ = helpers.read_chunk_hash_file(chunk_hash_path) \
+                if chunk_hash_path.exists() else (None, {}, {})
+            chunk_hashes = []
+
+            hash_result = helpers.hash_files_and_check_symlinks(archive_content_path, files, max_workers=threads,
+                                                                integrity_check=True, algorithms=(algorithm,),
+                                                                backend=hash_backend, chunk_size=chunk_size,
+                                                                chunk_hashes=chunk_hashes)
 
             r = compare_archive_listing_hashes(hash_result, expected_listing_hash_path)
+            if chunk_size:
+                r = compare_chunk_hashes(chunk_hashes, expected_chunk_hashes, chunk_size) and r
             successful = successful and r
 
     return successful
@@ -209,9 +244,27 @@ def compare_archive_listing_hashes(hash_result, expected_hash_listing_path):
     return not corruption_found
 
 
+def compare_chunk_hashes(chunk_hash_result, expected_chunk_hashes, chunk_size):
+    """Reports the chunks of files hashed in chunks which have changed or are missing, e.g. of truncated files"""
+    chunk_hash_result_dict = {(path, int(index)): chunk_hash for (path, index, chunk_hash) in chunk_hash_result}
+
+    corruption_found = False
+    for (path, index), expected_hash in sorted(expected_chunk_hashes.items()):
+        chunk_hash = chunk_hash_result_dict.get((path, index))
+        chunk_range = f"Chunk {index} (bytes {index * chunk_size} to {(index + 1) * chunk_size - 1}) of {path}"
+
+        if chunk_hash is None:
+            logging.error(f"{chunk_range} is missing")
+            corruption_found = True
+        elif chunk_hash != expected_hash:
+            logging.error(f"{chunk_range} has changed: Expected {expected_hash} but got {chunk_hash}")
+            corruption_found = True
+    return not corruption_found
+
+
 def compare_hashes_from_files(archive_file_path, archive_hash_file_path):
-    # Generate hash of .tar.lz
-    archive_hash = helpers.get_file_hash_from_path(archive_file_path)
+    # Generate hash of .tar.lz with the algorithm of the hash file
+    archive_hash = helpers.get_file_hash_from_path(archive_file_path, helpers.hash_algorithm_from_path(archive_hash_file_path))
 
     # Read hash of .tar.lz.md5
     with open(archive_hash_file_path, "r") as file:
@@ -234,15 +287,23 @@ def get_hashes_for_archive(archive_path):
 
     archive_file_path = archive_path
 
-    hash_file_path = archive_path.parent / (archive_path.name + ".md5")
-    helpers.terminate_if_path_nonexistent(hash_file_path)
+    hash_file_path = get_hash_file_or_terminate(archive_path)
 
-    hash_listing_path = archive_path.parent / (helpers.filename_without_archive_extensions_multipart(archive_path) + ".md5")
-    helpers.terminate_if_path_nonexistent(hash_listing_path)
+    hash_listing_path = get_hash_file_or_terminate(
+        archive_path.parent / helpers.filename_without_archive_extensions_multipart(archive_path))
 
     return [(archive_file_path, hash_file_path, hash_listing_path)]
 
 
+def get_hash_file_or_terminate(path):
+    hash_file_path = helpers.get_hash_file_for_path(path)
+
+    if not hash_file_path:
+        helpers.terminate_with_message(f"No hash file found for {helpers.get_absolute_path_string(path)}")
+
+    return hash_file_path
+
+
 def get_archives_with_hashes_from_directory(source_path):
     encrypted_archive_files = helpers.get_files_with_type_in_directory(source_path, ENCRYPTED_ARCHIVE_SUFFIX)
 
@@ -257,11 +318,10 @@ def get_archives_with_hashes_from_directory(source_path):
     archives_with_hashes = []
 
     for archive in archives:
-        hash_path = archive.parent / (archive.name + ".md5")
-        helpers.terminate_if_path_nonexistent(hash_path)
+        hash_path = get_hash_file_or_terminate(archive)
 
-        hash_listing_path = Path(archive.parent) / (helpers.filename_without_archive_extensions_multipart(archive) + ".md5")
-        helpers.terminate_if_path_nonexistent(hash_listing_path)
+        hash_listing_path = get_hash_file_or_terminate(
+            Path(archive.parent) / helpers.filename_without_archive_extensions_multipart(archive))
 
         archive_with_hash_path = (archive, hash_path, hash_listing_path)
 
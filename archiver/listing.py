@@ -96,8 +96,11 @@ def get_listing_files_for_path(path):
     return [listing_path]
 
 
+# link_target is the target of a symlink, relative to the directory of the link. hardlink_target is the name of the
+# file a hardlink refers to, which tar records relative to the archive root.
 ListingEntry=namedtuple('ListingEntry', ['permissions', 'owner',
-                                         'group', 'size', 'mod_date', 'mod_time', 'path', 'link_target'])
+                                         'group', 'size', 'mod_date', 'mod_time', 'path', 'link_target',
+                                         'hardlink_target'])
 
 
 def parse_tar_listing(path):
@@ -109,28 +112,33 @@ def parse_tar_listing(path):
         re_remaining = re.compile(rf'{re_prefix}\s(.*)')
         remaining = re_remaining.match(orig_line).groups()[0]
 
+        # hardlinks are listed as 'path link to target'
+        if fields[0].startswith('h') and ' link to ' in remaining:
+            path, hardlink_target = remaining.split(' link to ', 1)
+            return path, None, hardlink_target
+
         # last field may contain 'path' or 'path -> link target'
         link_parts = []
         if '->' in remaining:
             link_parts = LINK_RE_SEP.split(remaining)
 
         if len(link_parts) > 1:
-            return link_parts[0], link_parts[1]
+            return link_parts[0], link_parts[1], None
         else:
-            return remaining, None
+            return remaining, None, None
 
     def _process_gnutar(fields, orig_line):
-        path, link_target = _process_path(fields, 5, orig_line)
+        path, link_target, hardlink_target = _process_path(fields, 5, orig_line)
         owner, group = fields[1].split('/')
 
         return ListingEntry(fields[0], owner, group, fields[2], fields[3],
-                            fields[4], path, link_target)
+                            fields[4], path, link_target, hardlink_target)
 
     def _process_bsdtar(line, orig_line):
-        path, link_target = _process_path(line, 8, orig_line)
+        path, link_target, hardlink_target = _process_path(line, 8, orig_line)
 
         return ListingEntry(line[0], line[2], line[3], line[4],
-                            ' '.join(line[5:7]), line[7], path, link_target)
+                            ' '.join(line[5:7]), line[7], path, link_target, hardlink_target)
 
     entries = []
     with open(path, 'r', newline='\n') as f:
@@ -0,0 +1,97 @@
+"""
+Reading the headers and trailers of lzip files, see https://www.nongnu.org/lzip/manual/lzip_manual.html#File-format
+
+An lzip file consists of one or more members (plzip compresses blocks of the input into separate members).
+Every member starts with a 6 byte header and ends with a 20 byte trailer.
+"""
+import os
+import struct
+from collections import namedtuple
+
+LZIP_MAGIC = b"LZIP"
+HEADER_BYTE_SIZE = 6
+TRAILER_BYTE_SIZE = 20
+
+LzipHeader = namedtuple("LzipHeader", ["version", "dictionary_size"])
+LzipTrailer = namedtuple("LzipTrailer", ["crc32", "data_size", "member_size"])
+# offset and size of a member in the lzip file, the size of its uncompressed data and the CRC32 of that data
+LzipMember = namedtuple("LzipMember", ["offset", "member_size", "data_size", "crc32"])
+
+
+def parse_header(data):
+    if len(data) < HEADER_BYTE_SIZE or data[:4] != LZIP_MAGIC:
+        raise ValueError("Not an lzip member header")
+
+    # dictionary size is a power of two minus a number of sixteenths of it
+    coded_size = data[5]
+    base_size = 1 << (coded_size & 0x1f)
+    dictionary_size = base_size - (base_size // 16) * ((coded_size >> 5) & 0x07)
+
+    return LzipHeader(data[4], dictionary_size)
+
+
+def parse_trailer(data):
+    if len(data) < TRAILER_BYTE_SIZE:
+        raise ValueError("Truncated lzip member trailer")
+
+    return LzipTrailer(*struct.unpack("<IQQ", data[:TRAILER_BYTE_SIZE]))
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        return parse_header(f.read(HEADER_BYTE_SIZE))
+
+
+def read_last_trailer(path):
+    """Reads the trailer of the last member of an lzip file"""
+    with open(path, "rb") as f:
+        file_size = f.seek(0, os.SEEK_END)
+
+        if file_size < HEADER_BYTE_SIZE + TRAILER_BYTE_SIZE:
+            raise ValueError(f"File {path} is too small to be an lzip file")
+
+        f.seek(file_size - TRAILER_BYTE_SIZE)
+        trailer = parse_trailer(f.read(TRAILER_BYTE_SIZE))
+
+    if trailer.member_size > file_size or trailer.member_size < HEADER_BYTE_SIZE + TRAILER_BYTE_SIZE:
+        raise ValueError(f"Invalid member size in the trailer of {path}")
+
+    return trailer
+
+
+def read_members(path):
+    """
+    Reads the member table of an lzip file by walking from the trailer of the last member to the first member,
+    i.e. only the headers and trailers are read.
+
+    :return: list of LzipMember in the order of the file
+    """
+    members = []
+
+    with open(path, "rb") as f:
+        member_end = f.seek(0, os.SEEK_END)
+
+        while member_end > 0:
+            if member_end < HEADER_BYTE_SIZE + TRAILER_BYTE_SIZE:
+                raise ValueError(f"File {path} is too small to be an lzip file")
+
+            f.seek(member_end - TRAILER_BYTE_SIZE)
+            trailer = parse_trailer(f.read(TRAILER_BYTE_SIZE))
+
+            if trailer.member_size > member_end or trailer.member_size < HEADER_BYTE_SIZE + TRAILER_BYTE_SIZE:
+                raise ValueError(f"Invalid member size in a trailer of {path}")
+
+            member_offset = member_end - trailer.member_size
+            f.seek(member_offset)
+            parse_header(f.read(HEADER_BYTE_SIZE))
+
+            members.append(LzipMember(member_offset, trailer.member_size, trailer.data_size, trailer.crc32))
+            member_end = member_offset
+
+    members.reverse()
+    return members
+
+
+def get_uncompressed_size(path):
+    """:return: size of the decompressed data of an lzip file, like the total of `plzip --list`"""
+    return sum(member.data_size for member in read_members(path))
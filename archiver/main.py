@@ -13,7 +13,9 @@ from archiver import helpers, __version__
 from archiver.archive import create_archive, encrypt_existing_archive, \
     create_filelist_and_hashes, \
     create_tar_archives_and_listings, compress_and_hash
-from archiver.constants import DEFAULT_COMPRESSION_LEVEL
+from archiver.constants import DEFAULT_COMPRESSION_LEVEL, HASH_CACHE_FILENAME, \
+    HASH_ALGORITHMS, DEFAULT_HASH_ALGORITHM, HASH_BACKENDS, DEFAULT_HASH_BACKEND, SORT_MEMORY_BYTE_SIZE, \
+    SPLIT_STRATEGIES, DEFAULT_SPLIT_STRATEGY, HASH_CACHE_MAX_BYTE_SIZE, WALKER_PREFETCH_DIRECTORIES_PER_THREAD
 from archiver.extract import extract_archive, decrypt_existing_archive
 from archiver.integrity import check_integrity
 from archiver.listing import create_listing
@@ -79,12 +81,47 @@ def parse_arguments(args):
                      "part (based on uncompressed filesizes). Example: 5G for 5 gigibytes (2^30 bytes)."
     max_single_help = "When splitting archives and part-size is exceeded, this is the max size a single file can " \
                       "have to still be allowed to form an individual part. Example: 1T for 1 tebibytes (2^40 bytes)."
+    split_strategy_help = f"How files are split into parts, default is {DEFAULT_SPLIT_STRATEGY}. 'greedy' fills the " \
+                          f"parts in the order of the directory tree, 'balanced' packs directories and files into as " \
+                          f"few parts of similar size as possible."
+    parts_help = "Split archive into the given number of parts of similar size (based on uncompressed filesizes), " \
+                 "e.g. the number of nodes the parts are processed on. Cannot be combined with --part-size."
     part_help = "Which part to process. If missing, process all"
     force_help = "Overwrite output directory if it already exists and create parents of folder if they don't exist."
     thread_help = "Set the number of workers"
     encryption_key_help = "Path to public key which will be used for encryption. Archive will be encrypted when this " \
                           "option is used. Can be used more than once."
     remove_unencrypted_help = "Remove unencrypted archive after encrypted archive has been created and stored."
+    hash_cache_help = "Cache file hashes in the work directory (see --work-dir) and reuse them for unchanged files " \
+                      "(same device, inode, size and modification time) in later runs."
+    hash_cache_size_help = f"Maximum size of the hash cache (see --hash-cache), e.g. 32G, default is " \
+                           f"{HASH_CACHE_MAX_BYTE_SIZE // 1024 ** 3}G, which holds the hashes of about 100M files. " \
+                           f"Least recently used entries of earlier runs are evicted first."
+    hash_help = f"Hash algorithm for the file hash lists and archive hashes, default is {DEFAULT_HASH_ALGORITHM}. " \
+                f"Can be used more than once to compute several hashes while reading the files only once. " \
+                f"xxh3 requires the xxhash package."
+    hash_backend_help = f"Executor used to hash files in parallel, default is {DEFAULT_HASH_BACKEND}. 'thread' avoids " \
+                        f"the overhead of passing every file to a separate process, 'auto' uses threads and only " \
+                        f"hashes very large files in separate processes."
+    chunk_size_help = "Additionally hash files larger than the given size in chunks of that size in parallel, " \
+                      "e.g. 1G. The chunk hashes are stored next to the hash list s.t. a deep check can report " \
+                      "the corrupted chunk."
+    sort_memory_help = "Memory to use for sorting the file hash lists, e.g. 2G. Larger lists are sorted in " \
+                       "temporary files in the work directory (see --work-dir)."
+    walkers_help = "Number of threads listing directories in parallel, default is the number of workers (see --threads). " \
+                   "Listing directories in parallel hides the latency of parallel filesystems like GPFS or Lustre. " \
+                   f"Threads list the subdirectories they find right away, up to {WALKER_PREFETCH_DIRECTORIES_PER_THREAD} " \
+                   "directories ahead of the walk per thread. The entries are still consumed in a single ordered walk, " \
+                   "s.t. trees with few directories or directories holding most of the files gain little."
+    stream_help = "Pipe tar directly into plzip, s.t. the uncompressed tar archives are never written to disk. " \
+                  "This halves the disk I/O and the required free space in the destination. With --key, plzip is " \
+                  "also piped into gpg, s.t. only the encrypted archives are written."
+    adaptive_compression_help = "Put files which are already compressed (e.g. .bam, .cram, .gz or .jpg files, " \
+                                "recognized by their suffix or content) into parts of their own, which are " \
+                                "compressed at level 0. Parts are packed like with the 'balanced' split strategy. " \
+                                "Requires --part-size or --parts."
+    single_pass_help = "Write tar archives in-process and hash files while they are written into the archive, " \
+                       "s.t. every source file is only read once."
 
     # Create Archive Parent Parser
     archive_parent_parser = argparse.ArgumentParser(add_help=False)
@@ -99,8 +136,23 @@ def parse_arguments(args):
                                 help=encryption_key_help)
     parser_archive.add_argument("--part-size", type=str, help=part_size_help)
     parser_archive.add_argument("--max-single", type=str, help=max_single_help)
+    parser_archive.add_argument("--parts", type=int, help=parts_help)
+    parser_archive.add_argument("--split-strategy", type=str, choices=SPLIT_STRATEGIES, default=DEFAULT_SPLIT_STRATEGY,
+                                help=split_strategy_help)
     parser_archive.add_argument("-r", "--remove", action="store_true", default=False, help=remove_unencrypted_help)
     parser_archive.add_argument("-f", "--force", action="store_true", default=False, help=force_help)
+    parser_archive.add_argument("--single-pass", action="store_true", default=False, help=single_pass_help)
+    parser_archive.add_argument("--stream", action="store_true", default=False, help=stream_help)
+    parser_archive.add_argument("--hash-cache", action="store_true", default=False, help=hash_cache_help)
+    parser_archive.add_argument("--hash-cache-size", type=str, help=hash_cache_size_help)
+    parser_archive.add_argument("--hash", type=str, action="append", choices=HASH_ALGORITHMS, help=hash_help)
+    # no default, s.t. it can be rejected with --single-pass
+    parser_archive.add_argument("--hash-backend", type=str, choices=HASH_BACKENDS, help=hash_backend_help)
+    parser_archive.add_argument("--sort-memory", type=str, help=sort_memory_help)
+    parser_archive.add_argument("--chunk-size", type=str, help=chunk_size_help)
+    parser_archive.add_argument("--walkers", type=int, help=walkers_help)
+    parser_archive.add_argument("--adaptive-compression", action="store_true", default=False,
+                                help=adaptive_compression_help)
     parser_archive.set_defaults(func=handle_archive)
 
     parser_create = subparsers.add_parser("create", help="Create archives step-by-step (optimization possibilities for large split archives)")
@@ -109,7 +161,20 @@ def parse_arguments(args):
     parser_create_filelist = subparser_create.add_parser("filelist", help="create list and hashes of all files to be archived", parents=[archive_parent_parser])
     parser_create_filelist.add_argument("--part-size", type=str, help=part_size_help)
     parser_create_filelist.add_argument("--max-single", type=str, help=max_single_help)
+    parser_create_filelist.add_argument("--parts", type=int, help=parts_help)
+    parser_create_filelist.add_argument("--split-strategy", type=str, choices=SPLIT_STRATEGIES,
+                                        default=DEFAULT_SPLIT_STRATEGY, help=split_strategy_help)
     parser_create_filelist.add_argument("-f", "--force", action="store_true", default=False, help=force_help)
+    parser_create_filelist.add_argument("--hash-cache", action="store_true", default=False, help=hash_cache_help)
+    parser_create_filelist.add_argument("--hash-cache-size", type=str, help=hash_cache_size_help)
+    parser_create_filelist.add_argument("--hash", type=str, action="append", choices=HASH_ALGORITHMS, help=hash_help)
+    parser_create_filelist.add_argument("--hash-backend", type=str, choices=HASH_BACKENDS, default=DEFAULT_HASH_BACKEND,
+                                        help=hash_backend_help)
+    parser_create_filelist.add_argument("--sort-memory", type=str, help=sort_memory_help)
+    parser_create_filelist.add_argument("--chunk-size", type=str, help=chunk_size_help)
+    parser_create_filelist.add_argument("--walkers", type=int, help=walkers_help)
+    parser_create_filelist.add_argument("--adaptive-compression", action="store_true", default=False,
+                                        help=adaptive_compression_help)
     parser_create_filelist.set_defaults(func=handle_create_filelist)
 
     parser_create_tar = subparser_create.add_parser("tar", help="create tar archives and listings", parents=[archive_parent_parser])
@@ -165,6 +230,10 @@ def parse_arguments(args):
     parser_check.add_argument("archive_dir", type=str, help="Select source archive directory or .tar.lz file")
     parser_check.add_argument("-d", "--deep", action="store_true", help="Verify integrity by unpacking archive and hashing each file")
     parser_check.add_argument("-n", "--threads", type=int, help=thread_help)
+    parser_check.add_argument("--quick", action="store_true", help="Only verify size and metadata of the archive "
+                              "files recorded at creation time instead of hashing them")
+    parser_check.add_argument("--hash-backend", type=str, choices=HASH_BACKENDS, default=DEFAULT_HASH_BACKEND,
+                              help=hash_backend_help)
     parser_check.add_argument("--archive-name", type=str, help="Provide explicit source name of the archive (if contains suffixes used by the archiver - e.g., .part1)")
     parser_check.set_defaults(func=handle_check)
 
@@ -201,7 +270,31 @@ def handle_archive(args):
         except Exception as error:
             helpers.terminate_with_exception(error)
 
-    create_archive(source_path, destination_path, threads, args.key, compression, bytes_splitting, args.remove, args.force, work_dir)
+    if args.chunk_size and args.single_pass:
+        helpers.terminate_with_message("--chunk-size cannot be combined with --single-pass, which hashes files "
+                                       "while writing them sequentially into the tar archive")
+
+    if args.stream and args.single_pass:
+        helpers.terminate_with_message("--stream cannot be combined with --single-pass, which writes the tar archives "
+                                       "in-process")
+
+    if args.hash_cache and args.single_pass:
+        helpers.terminate_with_message("--hash-cache cannot be combined with --single-pass, which reads every file "
+                                       "for the tar archive anyway")
+
+    if args.hash_backend and args.single_pass:
+        helpers.terminate_with_message("--hash-backend cannot be combined with --single-pass, which hashes files "
+                                       "while writing them sequentially into the tar archive")
+
+    hash_backend = args.hash_backend or DEFAULT_HASH_BACKEND
+
+    create_archive(source_path, destination_path, threads, args.key, compression, bytes_splitting, args.remove, args.force, work_dir,
+                   single_pass=args.single_pass, hash_cache_path=get_hash_cache_path(args),
+                   hash_cache_size=get_hash_cache_size(args),
+                   hash_algorithms=get_hash_algorithms(args), hash_backend=hash_backend,
+                   sort_memory=get_sort_memory(args), chunk_size=get_chunk_size(args),
+                   walkers=get_walkers(args, threads), split_strategy=args.split_strategy,
+                   split_parts=get_split_parts(args), stream=args.stream, adaptive=get_adaptive_compression(args))
 
 
 def handle_create_filelist(args):
@@ -226,7 +319,106 @@ def handle_create_filelist(args):
 
     # Create destination folder if nonexistent or overwrite if --force option used
     helpers.handle_destination_directory_creation(destination_path, args.force)
-    create_filelist_and_hashes(source_path, destination_path, bytes_splitting, threads, bytes_splitting_single)
+    create_filelist_and_hashes(source_path, destination_path, bytes_splitting, threads, bytes_splitting_single,
+                               hash_cache_path=get_hash_cache_path(args), hash_cache_size=get_hash_cache_size(args),
+                               hash_algorithms=get_hash_algorithms(args),
+                               hash_backend=args.hash_backend, work_dir=args.work_dir, sort_memory=get_sort_memory(args),
+                               chunk_size=get_chunk_size(args), walkers=get_walkers(args, threads),
+                               split_strategy=args.split_strategy, split_parts=get_split_parts(args),
+                               adaptive=get_adaptive_compression(args))
+
+
+def get_split_parts(args):
+    if args.parts is None:
+        return None
+
+    if args.part_size:
+        helpers.terminate_with_message("--parts cannot be combined with --part-size")
+
+    if args.parts < 1:
+        helpers.terminate_with_message("--parts must be at least 1")
+
+    return args.parts
+
+
+def get_adaptive_compression(args):
+    if args.adaptive_compression and not (args.part_size or args.parts):
+        helpers.terminate_with_message("--adaptive-compression requires --part-size or --parts, as incompressible "
+                                       "files are put into parts of their own")
+
+    return args.adaptive_compression
+
+
+def get_walkers(args, threads):
+    if args.walkers is None:
+        return threads
+
+    if args.walkers < 1:
+        helpers.terminate_with_message("--walkers must be at least 1")
+
+    return args.walkers
+
+
+def get_hash_algorithms(args):
+    if not args.hash:
+        return [DEFAULT_HASH_ALGORITHM]
+
+    # removing duplicates while keeping the order
+    algorithms = list(dict.fromkeys(args.hash))
+
+    for algorithm in algorithms:
+        try:
+            helpers.get_hasher(algorithm)
+        except ValueError as error:
+            helpers.terminate_with_exception(error)
+
+    return algorithms
+
+
+def get_chunk_size(args):
+    if not args.chunk_size:
+        return None
+
+    try:
+        return helpers.get_bytes_in_string_with_unit(args.chunk_size)
+    except Exception as error:
+        helpers.terminate_with_exception(error)
+
+
+def get_sort_memory(args):
+    if not args.sort_memory:
+        return SORT_MEMORY_BYTE_SIZE
+
+    try:
+        return helpers.get_bytes_in_string_with_unit(args.sort_memory)
+    except Exception as error:
+        helpers.terminate_with_exception(error)
+
+
+def get_hash_cache_path(args):
+    if not args.hash_cache:
+        return None
+
+    if not args.work_dir:
+        helpers.terminate_with_message("--hash-cache requires a work directory to be set with --work-dir")
+
+    work_dir = Path(args.work_dir)
+    helpers.terminate_if_directory_nonexistent(work_dir)
+
+    return work_dir / HASH_CACHE_FILENAME
+
+
+def get_hash_cache_size(args):
+    if not args.hash_cache_size:
+        return HASH_CACHE_MAX_BYTE_SIZE
+
+    if not args.hash_cache:
+        helpers.terminate_with_message("--hash-cache-size requires --hash-cache")
+
+    try:
+        return helpers.get_bytes_in_string_with_unit(args.hash_cache_size)
+    except Exception as error:
+        helpers.terminate_with_exception(error)
 
 
 def handle_create_tar_archive(args):
@@ -298,7 +490,11 @@ def handle_check(args):
     source_path = Path(args.archive_dir)
     threads = helpers.get_threads_from_args_or_environment(args.threads)
 
-    if not check_integrity(source_path, args.deep, threads, args.work_dir, args.archive_name):
+    if args.quick and args.deep:
+        helpers.terminate_with_message("--quick cannot be combined with --deep")
+
+    if not check_integrity(source_path, args.deep, threads, args.work_dir, args.archive_name, args.hash_backend,
+                           quick=args.quick):
         # return a different error code to the default code of 1 to be able to distinguish
         # general errors from a successful run of the program with an unsuccessful outcome
         # not taking 2, as it usually stands for command line argument errors
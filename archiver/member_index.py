@@ -0,0 +1,228 @@
+"""
+Index of the members of a tar archive by their offsets in the uncompressed archive, e.g. NAME.tar.idx.
+
+Every line holds the offset of the first header block of a member (including pax extended headers), the offset
+after its padded content and the member name, escaped like in the hash lists:
+
+    1536 3584 folder/file.txt
+
+Together with the member table of the lzip file, which is read from the lzip trailers, single files can be
+extracted by decompressing only the lzip members containing them.
+"""
+import logging
+import re
+import subprocess
+import tarfile
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from . import helpers
+from . import lzip
+from .constants import MEMBER_INDEX_SUFFIX
+
+IndexEntry = namedtuple("IndexEntry", ["offset", "end", "name"])
+
+INDEX_LINE_REGEX = re.compile(r'(\\?)([0-9]+) ([0-9]+) (.*)')
+COPY_CHUNK_BYTE_SIZE = 1024 * 1024
+
+
+def get_member_index_path(archive_path):
+    """:return: path of the index belonging to a compressed or encrypted archive"""
+    archive_path = Path(archive_path)
+    return archive_path.parent / (helpers.filename_without_archive_extensions_multipart(archive_path) +
+                                  MEMBER_INDEX_SUFFIX)
+
+
+def format_index_entry(offset, end, name):
+    prefix = ""
+    if '\n' in name or '\\' in name:
+        # same escaping as for the hash lists
+        prefix = "\\"
+        name = name.replace('\\', '\\\\').replace('\n', '\\n')
+
+    return f"{prefix}{offset} {end} {name}\n"
+
+
+def read_member_index(index_path):
+    entries = []
+
+    with open(index_path, "r", newline="\n") as index_file:
+        for line in index_file:
+            escaped, offset, end, name = INDEX_LINE_REGEX.match(line.rstrip("\n")).groups()
+            if escaped:
+                name = name.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+            entries.append(IndexEntry(int(offset), int(end), name))
+
+    return entries
+
+
+def select_entries(entries, partial_extraction_path):
+    """:return: the entries which tar would extract for partial_extraction_path, i.e. the path and all below it"""
+    path = str(partial_extraction_path).rstrip("/")
+    return [e for e in entries if e.name == path or e.name.startswith(path + "/")]
+
+
+def get_ranges(entries):
+    """:return: sorted (start, end) offsets in the uncompressed archive, merging adjacent entries"""
+    ranges = []
+
+    for entry in sorted(entries):
+        if ranges and entry.offset <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], entry.end))
+        else:
+            ranges.append((entry.offset, entry.end))
+
+    return ranges
+
+
+def get_member_spans(ranges, members):
+    """
+    Maps ranges of the uncompressed archive onto the lzip members containing them.
+
+    :return: list of (first member index, last member index, uncompressed offset of the first member, ranges),
+    spans sharing or adjoining lzip members are merged s.t. every member is decompressed at most once
+    """
+    member_starts = []
+    data_offset = 0
+    for member in members:
+        member_starts.append(data_offset)
+        data_offset += member.data_size
+
+    spans = []
+    first = 0
+    for start, end in ranges:
+        if end > data_offset:
+            raise ValueError(f"Index range up to {end} exceeds the uncompressed size {data_offset} of the archive")
+
+        while member_starts[first] + members[first].data_size <= start:
+            first += 1
+        last = first
+        while member_starts[last] + members[last].data_size < end:
+            last += 1
+
+        if spans and first <= spans[-1][1] + 1:
+            spans[-1] = (spans[-1][0], last, spans[-1][2], spans[-1][3] + [(start, end)])
+        else:
+            spans.append((first, last, member_starts[first], [(start, end)]))
+
+    return spans
+
+
+def extract_with_index(archive_path, index_path, destination_directory_path, partial_extraction_path, threads=1):
+    """
+    Extracts partial_extraction_path from a compressed archive by decompressing only the lzip members
+    containing its tar members.
+
+    :return: False if the index has no entries for partial_extraction_path, e.g. since the path is not in this part
+    """
+    entries = select_entries(read_member_index(index_path), partial_extraction_path)
+    if not entries:
+        return False
+
+    members = lzip.read_members(archive_path)
+    spans = get_member_spans(get_ranges(entries), members)
+    nr_members = sum(last - first + 1 for first, last, _, _ in spans)
+    logging.info(f"Extracting {len(entries)} tar members from {nr_members} of {len(members)} lzip members "
+                 f"of {archive_path.name}")
+
+    tar_cmd = ["tar", "-x", "-C", destination_directory_path]
+    logging.debug(f"Executing command: '{' '.join(str(e) for e in tar_cmd)}' reading selected members")
+
+    decompression_error = None
+    with subprocess.Popen(tar_cmd, stdin=subprocess.PIPE) as tar_process:
+        try:
+            for first, last, data_offset, ranges in spans:
+                _write_ranges(archive_path, members[first:last + 1], data_offset, ranges, tar_process.stdin, threads)
+            # end of archive marker
+            tar_process.stdin.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        except BrokenPipeError:
+            # tar failed, which is reported by its return code
+            pass
+        except (EOFError, OSError) as error:
+            decompression_error = error
+        finally:
+            try:
+                tar_process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    if decompression_error:
+        helpers.terminate_with_message(str(decompression_error))
+    if tar_process.returncode != 0:
+        helpers.terminate_with_message(f"Extraction of {partial_extraction_path} from archive {archive_path} failed.")
+
+    return True
+
+
+def start_decompression(archive_path, members, threads=1):
+    """
+    Starts plzip decompressing the consecutive lzip members of archive_path to its standard output, the members are
+    passed to plzip by a thread.
+
+    :return: the plzip process and the thread, which ends once plzip has read all members or stopped reading
+    """
+    plzip_cmd = ["plzip", "--decompress", "--stdout"]
+    if threads:
+        plzip_cmd.extend(["--threads", str(threads)])
+
+    compressed_offset = members[0].offset
+    compressed_end = members[-1].offset + members[-1].member_size
+
+    plzip_process = subprocess.Popen(plzip_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    feeder = threading.Thread(target=_feed_file_range,
+                              args=(archive_path, compressed_offset, compressed_end, plzip_process.stdin))
+    feeder.start()
+
+    return plzip_process, feeder
+
+
+def _write_ranges(archive_path, members, data_offset, ranges, output, threads):
+    """Decompresses consecutive lzip members and writes the given ranges of their data to output"""
+    plzip_process, feeder = start_decompression(archive_path, members, threads)
+
+    with plzip_process:
+        position = data_offset
+        for start, end in ranges:
+            _copy_stream(plzip_process.stdout, None, start - position)
+            _copy_stream(plzip_process.stdout, output, end - start)
+            position = end
+
+        # the rest of the last member, s.t. plzip finishes normally
+        for _ in iter(lambda: plzip_process.stdout.read(COPY_CHUNK_BYTE_SIZE), b""):
+            pass
+        feeder.join()
+
+    if plzip_process.returncode != 0:
+        raise OSError(f"Decompression of archive {archive_path} failed.")
+
+
+def _feed_file_range(path, start, end, pipe):
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(remaining, COPY_CHUNK_BYTE_SIZE))
+                if not chunk:
+                    break
+                pipe.write(chunk)
+                remaining -= len(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+def _copy_stream(source, destination, byte_size):
+    """Copies byte_size bytes from source to destination, or skips them without destination"""
+    while byte_size:
+        chunk = source.read(min(byte_size, COPY_CHUNK_BYTE_SIZE))
+        if not chunk:
+            raise EOFError("Decompressed archive is shorter than expected from its index")
+        if destination:
+            destination.write(chunk)
+        byte_size -= len(chunk)
@@ -0,0 +1,67 @@
+import json
+import logging
+from pathlib import Path
+
+from . import lzip
+from .constants import COMPRESSED_ARCHIVE_SUFFIX, METADATA_SUFFIX
+
+# for encrypted archives, the last bytes are recorded
+TAIL_BYTE_SIZE = 32
+
+
+def get_metadata_path(archive_path):
+    return Path(str(archive_path) + METADATA_SUFFIX)
+
+
+def get_archive_metadata(archive_path):
+    """Metadata of an archive which can be verified without reading the archive, i.e. in seconds also for huge archives"""
+    stat_result = archive_path.stat()
+    metadata = {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns}
+
+    if archive_path.name.endswith(COMPRESSED_ARCHIVE_SUFFIX):
+        metadata["lzip_header"] = lzip.read_header(archive_path)._asdict()
+        metadata["lzip_trailer"] = lzip.read_last_trailer(archive_path)._asdict()
+    else:
+        with open(archive_path, "rb") as f:
+            f.seek(max(stat_result.st_size - TAIL_BYTE_SIZE, 0))
+            metadata["tail"] = f.read().hex()
+
+    return metadata
+
+
+def create_and_write_metadata(archive_path):
+    """Will save the metadata in same directory"""
+    with open(get_metadata_path(archive_path), "w") as metadata_file:
+        json.dump(get_archive_metadata(archive_path), metadata_file, indent=2)
+        metadata_file.write("\n")
+
+
+def verify_metadata(archive_path):
+    metadata_path = get_metadata_path(archive_path)
+
+    if not metadata_path.is_file():
+        logging.error(f"No metadata file {metadata_path} found. Use a check without --quick instead.")
+        return False
+
+    with open(metadata_path, "r") as metadata_file:
+        expected = json.load(metadata_file)
+
+    try:
+        actual = get_archive_metadata(archive_path)
+    except ValueError as error:
+        logging.error(f"Reading metadata of {archive_path.name} failed: {error}")
+        return False
+
+    successful = True
+    for key, expected_value in expected.items():
+        if actual.get(key) == expected_value:
+            continue
+
+        if key == "mtime_ns":
+            # the modification time also changes when copying the archive without preserving times
+            logging.warning(f"Modification time of {archive_path.name} has changed since creation.")
+        else:
+            logging.error(f"The {key} of {archive_path.name} has changed: Expected {expected_value} but got {actual.get(key)}")
+            successful = False
+
+    return successful
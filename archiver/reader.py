@@ -0,0 +1,236 @@
+"""
+Reading single files of an archive without extracting it, e.g. for analysis jobs:
+
+    reader = ArchiveReader("/path/to/archive_dir")
+    with reader.open("project/data/config.yaml") as f:
+        content = f.read()
+
+The part containing a file is found by the listings. With the member index of the part (see member_index), only the
+lzip members containing the file are decompressed, s.t. reading a file takes time proportional to its size. Without
+an index the part is decompressed up to the file. Encrypted parts can't be read from the middle, they are decrypted
+up to the file, but still only the lzip members containing the file are decompressed.
+"""
+import io
+import subprocess
+import tarfile
+from pathlib import Path, PurePosixPath
+
+from . import helpers
+from . import listing
+from . import lzip
+from . import member_index
+from .constants import LISTING_SUFFIX, COMPRESSED_ARCHIVE_SUFFIX, ENCRYPTED_ARCHIVE_SUFFIX
+
+
+class ArchiveReader:
+    def __init__(self, archive_dir, threads=1):
+        self.archive_dir = Path(archive_dir)
+        self.threads = threads
+
+        # raising instead of terminating like the command line tool
+        if not self.archive_dir.exists():
+            raise FileNotFoundError(f"Archive {self.archive_dir} doesn't exist")
+        if not self.archive_dir.is_dir() and not helpers.is_valid_archive_file(self.archive_dir):
+            raise ValueError(f"File {self.archive_dir} is not a valid archive of type {COMPRESSED_ARCHIVE_SUFFIX} "
+                             f"or {ENCRYPTED_ARCHIVE_SUFFIX}")
+
+        self.is_encrypted = bool(helpers.path_target_is_encrypted(self.archive_dir))
+        self.archives = helpers.sort_paths_with_part(helpers.get_archives_from_path(self.archive_dir, self.is_encrypted))
+
+        if not self.archives:
+            raise FileNotFoundError(f"No archives found in {self.archive_dir}")
+
+        # member name -> archive containing it, read from the listings on first use
+        self._archives_by_name = None
+        # archive -> {member name: index entry} and lzip members, read on first use
+        self._index_entries = {}
+        self._lzip_members = {}
+
+    def iter_members(self):
+        """Yields a listing.ListingEntry for every member of every part, read from the listings"""
+        for archive_path in self.archives:
+            yield from listing.parse_tar_listing(self._get_listing_path(archive_path))
+
+    def open(self, path):
+        """
+        :return: ArchiveMemberFile reading the content of the regular file (or hardlink) at path in the archive,
+        path is relative to the parent of the archived directory, like in the listings
+        """
+        name = PurePosixPath(path).as_posix().rstrip("/")
+        archive_path = self._get_archive_for_name(name)
+        index_entry = self._get_index_entries(archive_path).get(name)
+
+        stream = self._open_stream(archive_path, index_entry)
+        try:
+            tar = tarfile.open(fileobj=stream, mode="r|")
+            tarinfo = next((t for t in tar if t.name == name), None)
+        except BaseException:
+            stream.close()
+            raise
+
+        if tarinfo is None:
+            stream.close()
+            raise FileNotFoundError(f"{name} not found in {archive_path.name}")
+
+        if tarinfo.islnk():
+            # the content is stored with the first name of the file
+            stream.close()
+            return self.open(tarinfo.linkname)
+
+        if not tarinfo.isreg():
+            stream.close()
+            if tarinfo.isdir():
+                raise IsADirectoryError(f"{name} is a directory")
+            raise ValueError(f"{name} is not a regular file")
+
+        return ArchiveMemberFile(tar.extractfile(tarinfo), tarinfo, stream)
+
+    def _get_listing_path(self, archive_path):
+        return archive_path.parent / (helpers.filename_without_archive_extensions_multipart(archive_path) +
+                                      LISTING_SUFFIX)
+
+    def _get_archive_for_name(self, name):
+        if self._archives_by_name is None:
+            self._archives_by_name = {}
+            for archive_path in self.archives:
+                for entry in listing.parse_tar_listing(self._get_listing_path(archive_path)):
+                    self._archives_by_name[entry.path.rstrip("/")] = archive_path
+
+        if name not in self._archives_by_name:
+            raise FileNotFoundError(f"{name} not found in the listings of {self.archive_dir}")
+
+        return self._archives_by_name[name]
+
+    def _get_index_entries(self, archive_path):
+        if archive_path not in self._index_entries:
+            index_path = member_index.get_member_index_path(archive_path)
+            entries = member_index.read_member_index(index_path) if index_path.is_file() else []
+            self._index_entries[archive_path] = {e.name: e for e in entries}
+
+        return self._index_entries[archive_path]
+
+    def _open_stream(self, archive_path, index_entry):
+        """:return: _DecompressedStream of the tar archive in archive_path, or only of the member index_entry"""
+        if not index_entry:
+            return _DecompressedStream(_start_pipeline(self._get_decompression_cmds(archive_path)))
+
+        if self.is_encrypted:
+            # the lzip members can't be located in the encrypted archive, it is decrypted from its start
+            return _DecompressedStream(_start_pipeline(self._get_decompression_cmds(archive_path)),
+                                       skip_byte_size=index_entry.offset,
+                                       byte_size=index_entry.end - index_entry.offset)
+
+        if archive_path not in self._lzip_members:
+            self._lzip_members[archive_path] = lzip.read_members(archive_path)
+        members = self._lzip_members[archive_path]
+
+        first, last, data_offset, _ = member_index.get_member_spans([(index_entry.offset, index_entry.end)], members)[0]
+        plzip_process, feeder = member_index.start_decompression(archive_path, members[first:last + 1], self.threads)
+
+        return _DecompressedStream([plzip_process], feeder, skip_byte_size=index_entry.offset - data_offset,
+                                   byte_size=index_entry.end - index_entry.offset)
+
+    def _get_decompression_cmds(self, archive_path):
+        plzip_cmd = ["plzip", "--decompress", "--stdout", "--threads", str(self.threads)]
+
+        if not archive_path.name.endswith(COMPRESSED_ARCHIVE_SUFFIX):
+            return [["gpg", "--batch", "--decrypt", "--output", "-", archive_path], plzip_cmd]
+
+        return [plzip_cmd + [archive_path]]
+
+
+def _start_pipeline(cmds):
+    processes = []
+
+    for cmd in cmds:
+        stdin = processes[-1].stdout if processes else subprocess.DEVNULL
+        processes.append(subprocess.Popen([str(e) for e in cmd], stdin=stdin, stdout=subprocess.PIPE,
+                                          stderr=subprocess.DEVNULL))
+        if len(processes) > 1:
+            # only the next process reads the output
+            processes[-2].stdout.close()
+
+    return processes
+
+
+class _DecompressedStream(io.RawIOBase):
+    """
+    Readable stream of the output of the last process, starting after skip_byte_size bytes and ending after
+    byte_size bytes. The processes are stopped when the stream is closed.
+    """
+
+    def __init__(self, processes, feeder=None, skip_byte_size=0, byte_size=None):
+        self.processes = processes
+        self.feeder = feeder
+        self.source = processes[-1].stdout
+        self.skip_byte_size = skip_byte_size
+        self.remaining_byte_size = byte_size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.skip_byte_size:
+            skipped = len(self.source.read(min(self.skip_byte_size, member_index.COPY_CHUNK_BYTE_SIZE)))
+            if not skipped:
+                self._raise_if_failed()
+                raise EOFError("Decompressed archive is shorter than expected from its index")
+            self.skip_byte_size -= skipped
+
+        size = len(buffer)
+        if self.remaining_byte_size is not None:
+            size = min(size, self.remaining_byte_size)
+            if not size:
+                return 0
+
+        data = self.source.read(size)
+        if not data:
+            self._raise_if_failed()
+        if self.remaining_byte_size is not None:
+            self.remaining_byte_size -= len(data)
+
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.source.close()
+        for process in self.processes:
+            if process.poll() is None:
+                # not read until the end
+                process.kill()
+            process.wait()
+        if self.feeder:
+            self.feeder.join()
+
+        super().close()
+
+    def _raise_if_failed(self):
+        for process in self.processes:
+            if process.wait() != 0:
+                raise OSError(f"Reading the archive failed, '{' '.join(process.args)}' returned {process.returncode}")
+
+
+class ArchiveMemberFile(io.RawIOBase):
+    """Binary file-like object reading the content of a file in an archive, tarinfo holds its metadata"""
+
+    def __init__(self, fileobj, tarinfo, stream):
+        self.fileobj = fileobj
+        self.tarinfo = tarinfo
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+            self.stream.close()
+        super().close()
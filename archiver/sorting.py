@@ -0,0 +1,69 @@
+import contextlib
+import heapq
+import json
+import logging
+import tempfile
+from pathlib import Path
+
+from .constants import SORT_MEMORY_BYTE_SIZE
+
+# rough memory overhead of a row (list and string objects) in addition to its characters
+_ROW_OVERHEAD_BYTE_SIZE = 200
+
+
+def _row_key(row):
+    return row[0]
+
+
+def _row_byte_size(row):
+    return sum(len(e) for e in row) + _ROW_OVERHEAD_BYTE_SIZE
+
+
+def _write_run(rows, run_path):
+    with open(run_path, "w") as run_file:
+        for row in sorted(rows, key=_row_key):
+            # json escapes new lines, s.t. every row is on its own line
+            run_file.write(json.dumps(row) + "\n")
+
+
+def _read_run(run_file):
+    for line in run_file:
+        yield json.loads(line)
+
+
+def sort_rows(rows, work_dir=None, max_memory_byte_size=SORT_MEMORY_BYTE_SIZE):
+    """
+    Yields rows (lists of strings) sorted by their first element.
+
+    Rows are kept in memory up to about max_memory_byte_size. Beyond that, sorted runs are written to a
+    temporary directory in work_dir and merged at the end (external merge sort).
+    """
+    run = []
+    run_byte_size = 0
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as run_dir:
+        run_paths = []
+
+        for row in rows:
+            run.append(row)
+            run_byte_size += _row_byte_size(row)
+
+            if run_byte_size >= max_memory_byte_size:
+                run_paths.append(Path(run_dir) / f"run{len(run_paths)}.jsonl")
+                _write_run(run, run_paths[-1])
+                run = []
+                run_byte_size = 0
+
+        if not run_paths:
+            yield from sorted(run, key=_row_key)
+            return
+
+        if run:
+            run_paths.append(Path(run_dir) / f"run{len(run_paths)}.jsonl")
+            _write_run(run, run_paths[-1])
+            run = []
+
+        logging.info(f"Merging {len(run_paths)} sorted runs from {run_dir}")
+        with contextlib.ExitStack() as stack:
+            run_files = [stack.enter_context(open(p, "r")) for p in run_paths]
+            yield from heapq.merge(*[_read_run(f) for f in run_files], key=_row_key)
@@ -1,62 +1,390 @@
-import os
-from pathlib import Path
+import heapq
+import logging
+import math
+from collections import namedtuple
 
+from . import compressibility
 from . import helpers
+from . import tree_index
+from .constants import DEFAULT_SPLIT_STRATEGY, SPLIT_PARTS_UNIT_FRACTION
 
+# a directory or file which is put into a part as a whole. The listing contains the unit with all its content
+# (and possibly directories above the unit which aren't packed as a whole), order is the position in the walk.
+# Archive and listing contain the walker.FileEntry objects of the tree index, s.t. they aren't stat'ed again.
+# Hardlinked files have their inode set, all names of an inode are merged into one unit.
+SplitUnit = namedtuple("SplitUnit", ["order", "byte_size", "archive", "listing", "inode"])
 
-def split_directory(directory_path, max_package_size, max_single_size=None):
+
+def split_directory(directory_path, max_package_size, max_single_size=None, walkers=1, strategy=DEFAULT_SPLIT_STRATEGY):
+    """
+    Yields the (archive list, listing) of every part as lists of walker.FileEntry, s.t. every part is at most
+    max_package_size bytes large.
+    Files larger than that are put into a part of their own if they are at most max_single_size bytes large.
+
+    The greedy strategy fills the parts in the order of the directory walk and closes a part as soon as the next file
+    doesn't fit. The balanced strategy packs directories and files into as few parts as possible and balances the
+    sizes of the parts.
+    """
+    # sizes of all directories are computed in a single walk, see tree_index
+    index = tree_index.build_tree_index(directory_path, walkers)
+
+    if strategy == "balanced":
+        yield from _split_balanced(index, max_package_size, max_single_size)
+    else:
+        yield from _split_greedy(index, max_package_size, max_single_size)
+
+
+def split_directory_into_parts(directory_path, nr_parts, walkers=1):
+    """
+    Yields the (archive list, listing) of nr_parts parts of similar size. Directories are only split up if they are
+    larger than a fraction of a part, see SPLIT_PARTS_UNIT_FRACTION. Fewer parts are yielded if there are fewer
+    files than parts.
+    """
+    if nr_parts < 1:
+        raise ValueError(f"The number of parts must be at least 1, got {nr_parts}")
+
+    index = tree_index.build_tree_index(directory_path, walkers)
+    part_size = math.ceil(index.byte_size / nr_parts)
+
+    units = merge_hardlinked_units(iter_split_units(index, part_size // SPLIT_PARTS_UNIT_FRACTION))
+    parts = pack_largest_first(units, nr_parts)
+
+    if len(parts) < nr_parts:
+        logging.warning(f"Only {len(parts)} instead of {nr_parts} parts created, as there are only {len(units)} "
+                        f"directories and files to split")
+    logging.info(f"Split {index.byte_size} bytes into parts of {min(_get_part_sizes(parts), default=0)} to "
+                 f"{max(_get_part_sizes(parts), default=0)} bytes")
+
+    yield from get_parts_in_walk_order(parts)
+
+
+def _get_part_sizes(parts):
+    return [sum(u.byte_size for u in part) for part in parts]
+
+
+def _split_greedy(index, max_package_size, max_single_size=None):
     # all file sizes are in bytes
+    parts = []
     current_archive = []
     current_listing = []
     archive_size = 0
+    # part index of the first name of hardlinked files by inode, the current part has index len(parts)
+    hardlink_parts = {}
 
-    for root, dirs, files in os.walk(directory_path):
-        # removing path for directory index will exclude directory content from os.walk
-        # See: https://docs.python.org/3/library/os.html#os.walk
-        excluded_dirs = []
-
-        for directory in dirs:
-            # if the folder fits into an archive package, the content of the folder will not be looked at
-            dir_path = Path(root).joinpath(directory)
-            # treat symlinks to directories as files
-            if dir_path.is_symlink():
-                excluded_dirs.append(directory)
-                files.append(directory)
-                continue
-            dir_size = helpers.get_size_of_path(dir_path)
+    stack = [index]
+
+    while stack:
+        node = stack.pop()
+        # directories which don't fit into the current package, their content is looked at individually
+        descend = []
 
-            current_listing.append(dir_path)
-            if archive_size + dir_size <= max_package_size:
-                current_archive.append(dir_path)
-                current_listing.extend(helpers.get_files_in_folder(dir_path, include_dirs=True))
-                archive_size += dir_size
-                excluded_dirs.append(directory)
+        for directory in node.subdirectories:
+            # if the folder fits into an archive package, the content of the folder will not be looked at.
+            # Folders with files which have names outside the folder are looked at s.t. all names go into one part
+            current_listing.append(directory.entry)
+            if archive_size + directory.byte_size <= max_package_size and not directory.has_outside_hardlinks:
+                current_archive.append(directory.entry)
+                current_listing.extend(directory.iter_entries(include_dirs=True))
+                archive_size += directory.byte_size
+            else:
+                descend.append(directory)
 
             # for creating new package for directory that doesn't fit in current directory
             # See commit: #22d5fb7
 
-        dirs[:] = [dir_path for dir_path in dirs if dir_path not in excluded_dirs]
-
-        for file in files:
-            file_path = Path(root).joinpath(file)
-            file_size = 0
+        # symlinks to directories are treated as files
+        for entry in node.files:
+            # lstat size, i.e. symlinks (also broken ones) count with the size of the link itself
+            file_size = entry.get_allocated_size()
 
-            # Handle broken symlinks by not calculating file sizes for them
-            if file_path.exists():
-                file_size = file_path.stat().st_size
+            hardlink_part = hardlink_parts.get(entry.get_inode()) if entry.is_hardlinked() else None
+            if hardlink_part is not None:
+                # tar only stores the content once if all names are in the same part
+                if hardlink_part < len(parts):
+                    part_archive, part_listing = parts[hardlink_part]
+                else:
+                    part_archive, part_listing = current_archive, current_listing
+                part_archive.append(entry)
+                part_listing.append(entry)
+                continue
 
             if archive_size + file_size <= max_package_size:
-                current_archive.append(file_path)
-                current_listing.append(file_path)
+                current_archive.append(entry)
+                current_listing.append(entry)
                 archive_size += file_size
-            elif file_size <= max_package_size or (max_single_size is not None and file_size <= max_single_size):
-                yield current_archive, current_listing
+            elif _fits_into_single_part(file_size, max_package_size, max_single_size):
+                parts.append((current_archive, current_listing))
 
-                current_archive = [file_path]
-                current_listing = [file_path]
+                current_archive = [entry]
+                current_listing = [entry]
                 archive_size = file_size
             else:
-                raise ValueError(f"File {file_path.as_posix()} with {file_size} bytes "
-                                 f"is larger than the maximum package size of {max_package_size} bytes")
+                _raise_too_large(entry.path, file_size, max_package_size)
+
+            if entry.is_hardlinked():
+                hardlink_parts[entry.get_inode()] = len(parts)
+
+        stack.extend(reversed(descend))
+
+    parts.append((current_archive, current_listing))
+    # parts are only yielded at the end, as names of hardlinked files may still be added to previous parts
+    yield from parts
+
+
+def _split_balanced(index, max_package_size, max_single_size=None):
+    units = merge_hardlinked_units(iter_split_units(index, max_package_size))
+    parts = _pack_balanced(units, max_package_size, max_single_size)
+
+    logging.info(f"Packed {len(units)} directories and files into {len(parts)} parts")
+    yield from get_parts_in_walk_order(parts)
+
+
+def _pack_balanced(units, max_package_size, max_single_size=None):
+    """
+    :return: units packed into as few parts of similar size of at most max_package_size bytes as possible, units
+    larger than that form parts of their own
+    """
+    oversized = [u for u in units if u.byte_size > max_package_size]
+    for unit in oversized:
+        if not _fits_into_single_part(unit.byte_size, max_package_size, max_single_size):
+            _raise_too_large(unit.archive[0].path, unit.byte_size, max_package_size)
+
+    regular = [u for u in units if u.byte_size <= max_package_size]
+    parts = pack_first_fit_decreasing(regular, max_package_size)
+    # first-fit decreasing minimizes the number of parts, but leaves the last parts almost empty
+    parts = pack_largest_first(regular, len(parts), max_package_size) or parts
+
+    return parts + [[u] for u in oversized]
+
+
+def split_directory_by_compressibility(directory_path, max_package_size=None, nr_parts=None, max_single_size=None,
+                                       walkers=1, workers=1):
+    """
+    Yields the (archive list, listing, incompressible) of every part like split_directory with the balanced strategy
+    or like split_directory_into_parts if nr_parts is given, but files which are already compressed (see
+    compressibility) are packed into parts of their own, which come after the other parts. Directories containing
+    both kinds of files are split up.
+    """
+    index = tree_index.build_tree_index(directory_path, walkers)
+
+    files = [e for e in index.iter_entries() if e.is_file()]
+    flags = helpers.exec_parallel(compressibility.is_incompressible, files, lambda e: (e.path, e.stat.st_size),
+                                  workers, backend="thread")
+    incompressible_paths = {e.path for e, flag in zip(files, flags) if flag}
+    kinds = _get_content_kinds(index, incompressible_paths)
+
+    if nr_parts:
+        max_unit_size = math.ceil(index.byte_size / nr_parts) // SPLIT_PARTS_UNIT_FRACTION
+    else:
+        max_unit_size = max_package_size
+    split_up = {path for path, path_kinds in kinds.items() if len(path_kinds) > 1}
+    units = merge_hardlinked_units(iter_split_units(index, max_unit_size, split_up))
+
+    compressible_units = []
+    incompressible_units = []
+    for unit in units:
+        # the first path of the unit is the directory or the first name of the file
+        first_path = unit.archive[0].path if unit.archive else None
+        if first_path in incompressible_paths or kinds.get(first_path) == {True}:
+            incompressible_units.append(unit)
+        else:
+            compressible_units.append(unit)
+
+    if nr_parts:
+        nr_incompressible_parts = _get_nr_incompressible_parts(compressible_units, incompressible_units, nr_parts)
+        if incompressible_units and not nr_incompressible_parts:
+            logging.warning("Incompressible files can't be put into parts of their own with a single part")
+            compressible_units += incompressible_units
+            incompressible_units = []
+        compressible_parts = pack_largest_first(compressible_units, nr_parts - nr_incompressible_parts)
+        incompressible_parts = pack_largest_first(incompressible_units, nr_incompressible_parts)
+    else:
+        compressible_parts = _pack_balanced(compressible_units, max_package_size, max_single_size)
+        incompressible_parts = _pack_balanced(incompressible_units, max_package_size, max_single_size)
+
+    logging.info(f"Packed {len(units)} directories and files into {len(compressible_parts)} parts and "
+                 f"{sum(u.byte_size for u in incompressible_units)} bytes of incompressible files into "
+                 f"{len(incompressible_parts)} parts of their own")
+
+    if not compressible_parts and not incompressible_parts:
+        yield [], [], False
+
+    for parts, incompressible in ((compressible_parts, False), (incompressible_parts, True)):
+        if parts:
+            for archive, listing in get_parts_in_walk_order(parts):
+                yield archive, listing, incompressible
+
+
+def _get_content_kinds(index, incompressible_paths):
+    """
+    :return: for every directory, the set of kinds of the files with content below it, True for incompressible and
+    False for compressible files
+    """
+    nodes = []
+    stack = [index]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(node.subdirectories)
+
+    kinds = {}
+    # children before their parents
+    for node in reversed(nodes):
+        node_kinds = {e.path in incompressible_paths for e in node.files if e.is_file() and e.stat.st_size}
+        for directory in node.subdirectories:
+            node_kinds |= kinds[directory.path]
+        kinds[node.path] = node_kinds
+
+    return kinds
+
+
+def _get_nr_incompressible_parts(compressible_units, incompressible_units, nr_parts):
+    """:return: number of the nr_parts parts for the incompressible units, proportional to their size"""
+    if not incompressible_units:
+        return 0
+    if not compressible_units:
+        return nr_parts
+
+    incompressible_size = sum(u.byte_size for u in incompressible_units)
+    total_size = incompressible_size + sum(u.byte_size for u in compressible_units)
+
+    return min(nr_parts - 1, max(1, round(nr_parts * incompressible_size / total_size)))
+
+
+def iter_split_units(index, max_unit_size, split_up=frozenset()):
+    """
+    Yields the directories which are at most max_unit_size bytes large, but whose parent directory isn't, and all
+    files not within such a directory as SplitUnit in the order of the walk. Directories with hardlinked files which
+    have names outside of the directory and directories with their path in split_up are never yielded as a whole.
+    """
+    order = 0
+    # directories above the units are listed together with the next unit
+    pending_directories = []
+    last_unit = None
+    hardlinked_inodes = set()
+
+    stack = [index]
+    while stack:
+        node = stack.pop()
+        descend = []
+
+        for directory in node.subdirectories:
+            if directory.byte_size <= max_unit_size and not directory.has_outside_hardlinks and \
+                    directory.path not in split_up:
+                listing = pending_directories + [directory.entry]
+                listing.extend(directory.iter_entries(include_dirs=True))
+                last_unit = SplitUnit(order, directory.byte_size, [directory.entry], listing, None)
+                yield last_unit
+                pending_directories = []
+                order += 1
+            else:
+                pending_directories.append(directory.entry)
+                descend.append(directory)
+
+        for entry in node.files:
+            file_size = entry.get_allocated_size()
+            inode = None
+
+            if entry.is_hardlinked():
+                inode = entry.get_inode()
+                if inode in hardlinked_inodes:
+                    # content already counted for another name
+                    file_size = 0
+                hardlinked_inodes.add(inode)
+
+            last_unit = SplitUnit(order, file_size, [entry], pending_directories + [entry], inode)
+            yield last_unit
+            pending_directories = []
+            order += 1
+
+        stack.extend(reversed(descend))
+
+    if pending_directories:
+        # only possible for directories which are larger than max_unit_size on their own
+        if last_unit:
+            last_unit.listing.extend(pending_directories)
+        else:
+            yield SplitUnit(order, 0, [], pending_directories, None)
+
+
+def merge_hardlinked_units(units):
+    """:return: list of units, where the units of all names of a hardlinked file are merged into the first one"""
+    merged = []
+    units_by_inode = {}
+
+    for unit in units:
+        if unit.inode is None:
+            merged.append(unit)
+        elif unit.inode in units_by_inode:
+            # only the first name has a size
+            units_by_inode[unit.inode].archive.extend(unit.archive)
+            units_by_inode[unit.inode].listing.extend(unit.listing)
+        else:
+            units_by_inode[unit.inode] = unit
+            merged.append(unit)
+
+    return merged
+
+
+def pack_first_fit_decreasing(units, capacity):
+    """:return: units packed into parts of at most capacity bytes, every unit into the first part it fits in"""
+    parts = []
+    part_sizes = []
+
+    for unit in sorted(units, key=lambda u: u.byte_size, reverse=True):
+        for i, part_size in enumerate(part_sizes):
+            if part_size + unit.byte_size <= capacity:
+                parts[i].append(unit)
+                part_sizes[i] += unit.byte_size
+                break
+        else:
+            parts.append([unit])
+            part_sizes.append(unit.byte_size)
+
+    return parts
+
+
+def pack_largest_first(units, nr_parts, capacity=None):
+    """
+    :return: units packed into nr_parts parts, every unit into the part which is the smallest at that point, which
+    results in parts of similar sizes. None if a part would exceed capacity. Empty parts are dropped.
+    """
+    if nr_parts < 1:
+        return []
+
+    # (size, part index) of all parts, the smallest part first
+    part_heap = [(0, i) for i in range(nr_parts)]
+    parts = [[] for _ in range(nr_parts)]
+
+    for unit in sorted(units, key=lambda u: u.byte_size, reverse=True):
+        part_size, i = heapq.heappop(part_heap)
+
+        if capacity is not None and part_size + unit.byte_size > capacity:
+            return None
+
+        parts[i].append(unit)
+        heapq.heappush(part_heap, (part_size + unit.byte_size, i))
+
+    return [p for p in parts if p]
+
+
+def get_parts_in_walk_order(parts):
+    """Yields (archive list, listing) of every part, parts and their content sorted by the order of the walk"""
+    parts = [sorted(p, key=lambda u: u.order) for p in parts]
+
+    if not parts:
+        yield [], []
+
+    for part in sorted(parts, key=lambda p: p[0].order):
+        archive = [path for u in part for path in u.archive]
+        listing = [path for u in part for path in u.listing]
+        yield archive, listing
+
+
+def _fits_into_single_part(file_size, max_package_size, max_single_size):
+    return file_size <= max_package_size or (max_single_size is not None and file_size <= max_single_size)
+
 
-    yield current_archive, current_listing
+def _raise_too_large(file_path, file_size, max_package_size):
+    raise ValueError(f"File {file_path.as_posix()} with {file_size} bytes "
+                     f"is larger than the maximum package size of {max_package_size} bytes")
@@ -0,0 +1,291 @@
+"""
+Listings of tar archives in the format of GNU `tar -tvf`, generated from the member headers while the archive is
+written, s.t. the archive doesn't need to be read again only for its listing.
+
+The format is the one of GNU tar 1.34 in a UTF-8 locale, e.g.:
+
+    -rw-r--r-- user/group      1234 2021-03-04 13:37 folder/file
+    lrwxrwxrwx user/group         0 2021-03-04 13:37 folder/symlink -> file
+    hrw-r--r-- user/group         0 2021-03-04 13:37 folder/hardlink link to folder/file
+"""
+import math
+import stat
+import tarfile
+import time
+
+from .member_index import format_index_entry
+
+# type characters of GNU tar, regular files are '-' and unknown types '?'
+_TYPE_CHARACTERS = {
+    tarfile.LNKTYPE: "h",
+    tarfile.SYMTYPE: "l",
+    tarfile.CHRTYPE: "c",
+    tarfile.BLKTYPE: "b",
+    tarfile.DIRTYPE: "d",
+    tarfile.FIFOTYPE: "p",
+}
+
+_ESCAPES = {"\\": "\\\\", "\a": "\\a", "\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t", "\v": "\\v"}
+
+# like GNU tar, the user/group and size columns are aligned to this width and the width only ever grows
+USER_GROUP_SIZE_MIN_WIDTH = 18
+TIME_STAMP_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class TarListingFormatter:
+    """Formats tarfile.TarInfo objects into lines of `tar -tvf`, keeping the column widths between lines"""
+
+    def __init__(self):
+        self.user_group_size_width = USER_GROUP_SIZE_MIN_WIDTH
+        self.time_stamp_width = len("YYYY-MM-DD HH:MM")
+
+    def format(self, tarinfo):
+        if tarinfo.type in tarfile.REGULAR_TYPES:
+            type_character = "-"
+        else:
+            type_character = _TYPE_CHARACTERS.get(tarinfo.type, "?")
+
+        modes = type_character + stat.filemode(tarinfo.mode & 0o7777)[1:]
+        user = tarinfo.uname or str(tarinfo.uid)
+        group = tarinfo.gname or str(tarinfo.gid)
+
+        if tarinfo.ischr() or tarinfo.isblk():
+            size = f"{tarinfo.devmajor},{tarinfo.devminor}"
+        else:
+            size = str(tarinfo.size)
+
+        pad = len(user) + 1 + len(group) + len(size)
+        self.user_group_size_width = max(self.user_group_size_width, pad)
+        time_stamp = time.strftime(TIME_STAMP_FORMAT, time.localtime(math.floor(tarinfo.mtime)))
+        self.time_stamp_width = max(self.time_stamp_width, len(time_stamp))
+
+        name = tarinfo.name
+        if tarinfo.isdir():
+            name = name.rstrip("/") + "/"
+
+        line = (f"{modes} {user}/{group} {size:>{self.user_group_size_width - pad + len(size)}} "
+                f"{time_stamp:<{self.time_stamp_width}} {quote_name(name)}")
+
+        if tarinfo.issym():
+            line += f" -> {quote_name(tarinfo.linkname)}"
+        elif tarinfo.islnk():
+            line += f" link to {quote_name(tarinfo.linkname)}"
+
+        return line + "\n"
+
+
+def quote_name(name):
+    """Escapes backslashes and non-printable characters like the default quoting style of GNU tar"""
+    if name.isprintable() and "\\" not in name:
+        return name
+
+    quoted = []
+    for character in name:
+        if character in _ESCAPES:
+            quoted.append(_ESCAPES[character])
+        elif character.isprintable():
+            quoted.append(character)
+        else:
+            quoted.extend(f"\\{byte:03o}" for byte in character.encode("utf-8", "surrogateescape"))
+
+    return "".join(quoted)
+
+
+class TarListingWriter:
+    """
+    File-like sink parsing a tar archive written to it block by block and writing the listing of its members to
+    listing_file and, optionally, their offsets to index_file (see member_index). Member contents are skipped
+    in the written data without being buffered. Supports ustar headers with pax extended headers (as written by tar --posix, including
+    sparse files) and GNU long names.
+    """
+
+    def __init__(self, listing_file, index_file=None):
+        self.listing_file = listing_file
+        self.index_file = index_file
+        self.formatter = TarListingFormatter()
+        self._buffer = bytearray()
+        # bytes of member content (and padding) still to be skipped
+        self._skip_byte_size = 0
+        # header of an extended header or long name whose content is collected
+        self._extension_header = None
+        self._pax_headers = {}
+        self._global_pax_headers = {}
+        self._long_names = {}
+        # whether blocks of the sparse map of an old GNU sparse file follow, which precede its content
+        self._sparse_extension = False
+        self._finished = False
+        # offset in the archive of the data at the start of the buffer
+        self._position = 0
+        # offset of the first header of the member being read and offset and name of the last member read,
+        # whose index entry is written once the next header starts
+        self._member_offset = None
+        self._last_member = None
+
+    def write(self, data):
+        if self._finished:
+            # padding after the end of archive marker
+            return len(data)
+
+        view = memoryview(data).cast("B")
+        while True:
+            while self._process_buffer():
+                pass
+
+            if self._finished or not view:
+                break
+
+            if self._skip_byte_size and not self._sparse_extension:
+                # member content is skipped in the incoming data, the buffer is empty at this point
+                consumed = min(self._skip_byte_size, len(view))
+                self._skip_byte_size -= consumed
+                self._position += consumed
+            else:
+                # only headers, sparse maps and the content of extended headers are buffered
+                consumed = min(self._get_missing_byte_size(), len(view))
+                self._buffer += view[:consumed]
+            view = view[consumed:]
+
+        return len(data)
+
+    def close(self):
+        self.listing_file.close()
+        if self.index_file:
+            self.index_file.close()
+
+    def _get_missing_byte_size(self):
+        """:return: number of bytes missing in the buffer to process the next block or extended header content"""
+        if self._extension_header:
+            return _padded_size(self._extension_header.size) - len(self._buffer)
+        return tarfile.BLOCKSIZE - len(self._buffer)
+
+    def _process_buffer(self):
+        """:return: whether processing can continue with the data in the buffer"""
+        if self._sparse_extension:
+            if len(self._buffer) < tarfile.BLOCKSIZE:
+                return False
+            # the last byte of the 21 map entries tells whether another block follows
+            self._sparse_extension = bool(self._buffer[504])
+            self._consume(tarfile.BLOCKSIZE)
+            return True
+
+        if self._skip_byte_size:
+            skipped = min(self._skip_byte_size, len(self._buffer))
+            self._consume(skipped)
+            self._skip_byte_size -= skipped
+            return self._skip_byte_size == 0
+
+        if self._extension_header:
+            return self._process_extension()
+
+        if len(self._buffer) < tarfile.BLOCKSIZE:
+            return False
+
+        block = bytes(self._buffer[:tarfile.BLOCKSIZE])
+
+        if self._member_offset is None:
+            self._write_index_entry()
+            self._member_offset = self._position
+
+        if block == tarfile.NUL * tarfile.BLOCKSIZE:
+            # end of archive marker
+            self._finished = True
+            self._buffer.clear()
+            return False
+
+        self._consume(tarfile.BLOCKSIZE)
+
+        tarinfo = tarfile.TarInfo.frombuf(block, "utf-8", "surrogateescape")
+
+        if tarinfo.type in (tarfile.XHDTYPE, tarfile.XGLTYPE, tarfile.GNUTYPE_LONGNAME, tarfile.GNUTYPE_LONGLINK):
+            self._extension_header = tarinfo
+            return True
+
+        self._process_member(tarinfo, block)
+        return True
+
+    def _process_extension(self):
+        header = self._extension_header
+        padded_size = _padded_size(header.size)
+
+        if len(self._buffer) < padded_size:
+            return False
+
+        data = bytes(self._buffer[:header.size])
+        self._consume(padded_size)
+        self._extension_header = None
+
+        if header.type == tarfile.XHDTYPE:
+            self._pax_headers.update(_parse_pax_records(data))
+        elif header.type == tarfile.XGLTYPE:
+            self._global_pax_headers.update(_parse_pax_records(data))
+        else:
+            self._long_names[header.type] = data.rstrip(tarfile.NUL).decode("utf-8", "surrogateescape")
+
+        return True
+
+    def _process_member(self, tarinfo, block):
+        pax_headers = {**self._global_pax_headers, **self._pax_headers}
+        self._pax_headers = {}
+
+        if tarfile.GNUTYPE_LONGNAME in self._long_names:
+            tarinfo.name = self._long_names[tarfile.GNUTYPE_LONGNAME]
+        if tarfile.GNUTYPE_LONGLINK in self._long_names:
+            tarinfo.linkname = self._long_names[tarfile.GNUTYPE_LONGLINK]
+        self._long_names = {}
+
+        tarinfo.name = pax_headers.get("path", tarinfo.name)
+        tarinfo.linkname = pax_headers.get("linkpath", tarinfo.linkname)
+        tarinfo.uname = pax_headers.get("uname", tarinfo.uname)
+        tarinfo.gname = pax_headers.get("gname", tarinfo.gname)
+        for key in ("uid", "gid", "size"):
+            if key in pax_headers:
+                setattr(tarinfo, key, int(pax_headers[key]))
+        if "mtime" in pax_headers:
+            tarinfo.mtime = float(pax_headers["mtime"])
+
+        # like tarfile, only regular files and unknown types have content
+        stored_byte_size = tarinfo.size if tarinfo.isreg() or tarinfo.type not in tarfile.SUPPORTED_TYPES else 0
+
+        # the content of sparse files is stored with a map of the data, tar lists their name and real size
+        tarinfo.name = pax_headers.get("GNU.sparse.name", tarinfo.name)
+        tarinfo.size = int(pax_headers.get("GNU.sparse.realsize", pax_headers.get("GNU.sparse.size", tarinfo.size)))
+        if tarinfo.type == tarfile.GNUTYPE_SPARSE:
+            # old GNU header with the real size after the first 4 map entries
+            self._sparse_extension = bool(block[482])
+            tarinfo.size = tarfile.nti(block[483:495])
+
+        self.listing_file.write(self.formatter.format(tarinfo))
+        self._skip_byte_size = _padded_size(stored_byte_size)
+
+        name = tarinfo.name.rstrip("/") if tarinfo.isdir() else tarinfo.name
+        self._last_member = (self._member_offset, name)
+        self._member_offset = None
+
+    def _consume(self, byte_size):
+        del self._buffer[:byte_size]
+        self._position += byte_size
+
+    def _write_index_entry(self):
+        if self.index_file and self._last_member:
+            offset, name = self._last_member
+            self.index_file.write(format_index_entry(offset, self._position, name))
+        self._last_member = None
+
+
+def _padded_size(byte_size):
+    return -(-byte_size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def _parse_pax_records(data):
+    """Parses records of the form '<length> <keyword>=<value>\\n' of a pax extended header"""
+    records = {}
+    position = 0
+
+    while position < len(data) and data[position:position + 1] != tarfile.NUL:
+        length_end = data.index(b" ", position)
+        length = int(data[position:length_end])
+        keyword, value = data[length_end + 1:position + length - 1].split(b"=", 1)
+        records[keyword.decode("utf-8")] = value.decode("utf-8", "surrogateescape")
+        position += length
+
+    return records
@@ -0,0 +1,122 @@
+import logging
+import os
+import tarfile
+import unicodedata
+
+from . import helpers
+from .constants import DEFAULT_HASH_ALGORITHM
+from .member_index import format_index_entry
+from .tar_listing import TarListingFormatter
+
+
+class HashingReader:
+    """
+    Wraps a binary file object and feeds every chunk read from it to hashers. Chunks are read into the reused
+    per-thread buffer, i.e. the view returned by read is only valid until the next read.
+    """
+
+    def __init__(self, fileobj, hashers):
+        self.fileobj = fileobj
+        self.hashers = hashers
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        nr_bytes = 0
+
+        # unbuffered files may return fewer bytes than requested before their end
+        while nr_bytes < len(view):
+            nr_read = self.fileobj.readinto(view[nr_bytes:])
+            if not nr_read:
+                break
+            nr_bytes += nr_read
+
+        chunk = view[:nr_bytes]
+        for hasher in self.hashers:
+            hasher.update(chunk)
+        return nr_bytes
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            chunk = self.fileobj.read()
+            for hasher in self.hashers:
+                hasher.update(chunk)
+            return chunk
+
+        buffer = memoryview(helpers._get_read_buffer(size))[:size]
+        return buffer[:self.readinto(buffer)]
+
+
+class HashingWriter:
+    """Wraps a binary file object and feeds every chunk written to it to hashers"""
+
+    def __init__(self, fileobj, hashers):
+        self.fileobj = fileobj
+        self.hashers = hashers
+
+    def write(self, data):
+        for hasher in self.hashers:
+            hasher.update(data)
+        return self.fileobj.write(data)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+
+def write_tar_with_hashes(source_path, tar_path, listing, algorithms=(DEFAULT_HASH_ALGORITHM,), tar_listing_path=None,
+                          index_path=None):
+    """
+    Writes a posix tar archive containing the paths in listing (in that order) and hashes the
+    content of every file while it is copied into the archive, s.t. source data is read only once.
+    With tar_listing_path, the listing of the archive like `tar -tvf` is written there from the member headers,
+    with index_path the offsets of the members (see member_index).
+
+    :return: list of [relative path, hash per algorithm...] for files and symlinks and the hashes of the tar archive
+    """
+    source_path_parent = source_path.absolute().parent
+
+    hashes = []
+    hashes_by_name = {}
+    tar_hashers = [helpers.get_hasher(a) for a in algorithms]
+    formatter = TarListingFormatter()
+
+    with open(tar_path, "wb") as tar_file, open(tar_listing_path or os.devnull, "w") as tar_listing_file, \
+            open(index_path or os.devnull, "w") as index_file:
+        with tarfile.open(fileobj=HashingWriter(tar_file, tar_hashers), mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for abs_path in listing:
+                arcname = abs_path.absolute().relative_to(source_path_parent).as_posix()
+                tarinfo = tar.gettarinfo(abs_path, arcname)
+
+                if tarinfo is None:
+                    # same as tar, ignoring sockets
+                    logging.warning(f"Skipping {arcname} as its file type cannot be archived.")
+                    continue
+
+                tar_listing_file.write(formatter.format(tarinfo))
+                member_offset = tar.offset
+
+                file_hash = None
+                if tarinfo.isreg():
+                    hashers = [helpers.get_hasher(a) for a in algorithms]
+                    # unbuffered, s.t. data is read directly into the reused buffer without intermediate copies
+                    with open(abs_path, "rb", buffering=0) as file:
+                        tar.copybufsize = helpers.get_read_chunk_size(os.fstat(file.fileno()))
+                        tar.addfile(tarinfo, HashingReader(file, hashers))
+                    file_hash = [hasher.hexdigest() for hasher in hashers]
+                elif tarinfo.islnk():
+                    # hardlink to a file already in the archive, the content is not stored again
+                    tar.addfile(tarinfo)
+                    file_hash = hashes_by_name[tarinfo.linkname]
+                else:
+                    tar.addfile(tarinfo)
+
+                    if tarinfo.issym():
+                        helpers._check_symlinks(abs_path, source_path)
+                        file_hash = helpers.get_symlink_path_hashes(abs_path, algorithms)
+
+                index_file.write(format_index_entry(member_offset, tar.offset, arcname))
+
+                if file_hash:
+                    hashes_by_name[arcname] = file_hash
+                    hashes.append([unicodedata.normalize('NFC', arcname)] + file_hash)
+
+    return hashes, [hasher.hexdigest() for hasher in tar_hashers]
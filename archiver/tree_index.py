@@ -0,0 +1,107 @@
+"""
+In-memory index of a directory tree with cumulative sizes, built in a single walk.
+
+The sizes follow `du --apparent-size --bytes`: the size of a directory is the sum of the lstat sizes of the directory
+itself and of all entries below it. Symlinks are not followed and files with several names (hardlinks) are only
+counted once, like tar only stores their content once. Sparse files are counted with their allocated size, i.e.
+without holes, like tar --sparse stores them.
+"""
+import logging
+import os
+from pathlib import Path
+
+from . import walker
+
+
+class DirectoryNode:
+    __slots__ = ("entry", "files", "subdirectories", "byte_size", "nr_files", "has_outside_hardlinks")
+
+    def __init__(self, entry):
+        self.entry = entry
+        # all entries which aren't directories, i.e. also symlinks, in the order of the walk
+        self.files = []
+        self.subdirectories = []
+        # cumulative over the whole subtree
+        self.byte_size = entry.stat.st_size
+        self.nr_files = 0
+        # whether a file below this directory has another name outside of it within the tree
+        self.has_outside_hardlinks = False
+
+    @property
+    def path(self):
+        return self.entry.path
+
+    def iter_entries(self, include_dirs=False):
+        """Yields the entries below this directory in the same order as walker.scan_tree"""
+        stack = [self]
+
+        while stack:
+            node = stack.pop()
+            yield from node.files
+
+            if include_dirs:
+                yield from (d.entry for d in node.subdirectories)
+
+            stack.extend(reversed(node.subdirectories))
+
+
+def build_tree_index(folder_path, walkers=1):
+    """:return: DirectoryNode of folder_path with the complete subtree"""
+    root = DirectoryNode(walker.get_file_entry(folder_path))
+    # directories in pre-order, s.t. children come after their parents
+    nodes = [root]
+    nodes_by_path = {root.path: root}
+    # directories containing a name of a hardlinked file by inode
+    hardlinks = {}
+    sparse_byte_size = 0
+
+    for entry in walker.scan_tree(Path(folder_path), include_dirs=True, walkers=walkers):
+        parent = nodes_by_path[entry.path.parent]
+
+        if entry.is_dir():
+            node = DirectoryNode(entry)
+            parent.subdirectories.append(node)
+            nodes.append(node)
+            nodes_by_path[entry.path] = node
+        else:
+            parent.files.append(entry)
+            parent.nr_files += 1
+
+            if entry.is_hardlinked():
+                directories = hardlinks.setdefault(entry.get_inode(), [])
+                directories.append(parent.path)
+                if len(directories) > 1:
+                    # content already counted for another name
+                    continue
+
+            allocated_size = entry.get_allocated_size()
+            parent.byte_size += allocated_size
+            sparse_byte_size += entry.stat.st_size - allocated_size
+
+    # accumulating bottom-up
+    for node in reversed(nodes[1:]):
+        parent = nodes_by_path[node.path.parent]
+        parent.byte_size += node.byte_size
+        parent.nr_files += node.nr_files
+
+    _mark_outside_hardlinks(nodes_by_path, hardlinks.values())
+
+    if sparse_byte_size:
+        logging.info(f"Sparse files in {folder_path} take {sparse_byte_size} bytes ({sparse_byte_size/1024**3:.3f}GB) "
+                     f"less than their apparent size, which are not archived")
+
+    return root
+
+
+def _mark_outside_hardlinks(nodes_by_path, hardlink_directories):
+    for directories in hardlink_directories:
+        if len(directories) < 2:
+            continue
+
+        # all directories below the common directory only contain some of the names
+        common_path = Path(os.path.commonpath(directories))
+        for directory in directories:
+            node = nodes_by_path[directory]
+            while node.path != common_path:
+                node.has_outside_hardlinks = True
+                node = nodes_by_path[node.path.parent]
@@ -0,0 +1,193 @@
+import logging
+import os
+import stat
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .constants import WALKER_PREFETCH_DIRECTORIES_PER_THREAD
+
+
+class FileEntry(namedtuple('FileEntry', ['path', 'stat'])):
+    """Path together with its lstat result, s.t. the file type and size are available without further system calls"""
+    __slots__ = ()
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.stat.st_mode)
+
+    def is_file(self):
+        return stat.S_ISREG(self.stat.st_mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.stat.st_mode)
+
+    def is_hardlinked(self):
+        """:return: whether the entry is a regular file with several names"""
+        return self.is_file() and self.stat.st_nlink > 1
+
+    def get_inode(self):
+        return self.stat.st_dev, self.stat.st_ino
+
+    def get_allocated_size(self):
+        return get_allocated_size(self.stat)
+
+
+def get_allocated_size(stat_result):
+    """
+    :return: the size of a regular file without holes, i.e. the size tar --sparse stores,
+    and the apparent size for all other file types
+    """
+    if not stat.S_ISREG(stat_result.st_mode):
+        return stat_result.st_size
+
+    # st_blocks is in units of 512 bytes, including the last partially used block
+    return min(stat_result.st_size, stat_result.st_blocks * 512)
+
+
+def get_file_entry(path):
+    return FileEntry(Path(path), os.lstat(path))
+
+
+def scan_directory(directory_path):
+    """:return: entries of a directory sorted by name, stat'ing every entry once"""
+    try:
+        with os.scandir(directory_path) as it:
+            dir_entries = list(it)
+    except OSError as error:
+        # like os.walk, skipping directories which cannot be read
+        logging.warning(f"Cannot read directory {directory_path}: {error}")
+        return []
+
+    entries = []
+    for dir_entry in dir_entries:
+        try:
+            entries.append(FileEntry(directory_path / dir_entry.name, dir_entry.stat(follow_symlinks=False)))
+        except OSError as error:
+            # e.g. removed since reading the directory, only skipping this entry
+            logging.warning(f"Cannot stat {directory_path / dir_entry.name}: {error}")
+
+    return sorted(entries, key=lambda e: e.path.name)
+
+
+class _PendingDirectory:
+    __slots__ = ("path", "future", "subdirectories")
+
+    def __init__(self, path):
+        self.path = path
+        self.future = None
+        # pending subdirectories, created by the thread scanning the directory
+        self.subdirectories = None
+
+
+class _Prefetcher:
+    """
+    Scans directories in a pool of threads. A thread which has scanned a directory starts scanning its subdirectories
+    right away, s.t. also deep and narrow trees are scanned in parallel. At most max_prefetched scans are started
+    which haven't been taken yet, which bounds the memory for entries scanned ahead.
+    """
+
+    def __init__(self, executor, max_prefetched):
+        self.executor = executor
+        self.max_prefetched = max_prefetched
+        self.prefetched = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def submit(self, pending):
+        """:return: whether the scan of pending was started or had been started already"""
+        with self.lock:
+            if pending.future is not None:
+                return True
+            if self.closed or self.prefetched >= self.max_prefetched:
+                return False
+
+            self.prefetched += 1
+            pending.future = self.executor.submit(self._scan, pending)
+            return True
+
+    def take(self, pending):
+        """:return: entries of the directory, scanned in the calling thread if its scan wasn't started yet"""
+        with self.lock:
+            prefetched = pending.future is not None
+            if prefetched:
+                self.prefetched -= 1
+            else:
+                # s.t. no thread starts scanning it anymore
+                pending.future = _TAKEN
+
+        if prefetched:
+            return pending.future.result()
+
+        entries = scan_directory(pending.path)
+        pending.subdirectories = [_PendingDirectory(e.path) for e in entries if e.is_dir()]
+        return entries
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+    def _scan(self, pending):
+        entries = scan_directory(pending.path)
+        pending.subdirectories = [_PendingDirectory(e.path) for e in entries if e.is_dir()]
+
+        # the subdirectories are yielded next in the order of the walk
+        for subdirectory in pending.subdirectories:
+            if not self.submit(subdirectory):
+                break
+
+        return entries
+
+
+# marks directories which are scanned by the thread walking the tree
+_TAKEN = object()
+
+
+def scan_tree(folder_path, include_dirs=False, walkers=1):
+    """
+    Yields a FileEntry for every file and symlink below folder_path and, with include_dirs, every directory.
+    The tree is traversed top-down and in sorted order. For every directory, its files and symlinks are yielded before
+    its subdirectories. Symlinks to directories are not followed.
+
+    With walkers > 1, directories are scanned ahead by a pool of threads, which hides the latency of the metadata
+    servers of parallel filesystems. Threads scan the subdirectories they find themselves (see _Prefetcher), but
+    entries are still yielded by a single traversal, s.t. their order doesn't depend on walkers.
+    """
+    if walkers > 1:
+        with ThreadPoolExecutor(max_workers=walkers) as executor:
+            prefetcher = _Prefetcher(executor, walkers * WALKER_PREFETCH_DIRECTORIES_PER_THREAD)
+            try:
+                yield from _scan_tree(folder_path, include_dirs, prefetcher)
+            finally:
+                # no scans are started anymore if the walk is stopped early
+                prefetcher.close()
+    else:
+        yield from _scan_tree(folder_path, include_dirs)
+
+
+def _scan_tree(folder_path, include_dirs, prefetcher=None):
+    # directories still to be yielded, the last one is the next one
+    stack = [_PendingDirectory(Path(folder_path))]
+
+    while stack:
+        pending = stack.pop()
+
+        if prefetcher:
+            entries = prefetcher.take(pending)
+            subdirectories = pending.subdirectories
+        else:
+            entries = scan_directory(pending.path)
+            subdirectories = [_PendingDirectory(e.path) for e in entries if e.is_dir()]
+
+        stack.extend(reversed(subdirectories))
+
+        if prefetcher:
+            # keeping the threads busy with the directories yielded next, before the entries are consumed
+            for pending in reversed(stack):
+                if not prefetcher.submit(pending):
+                    break
+
+        yield from (e for e in entries if not e.is_dir())
+
+        if include_dirs:
+            yield from (e for e in entries if e.is_dir())
@@ -20,6 +20,10 @@ SPLIT_ENCRYPTED_LISTINGS = [".part1.tar.lst", ".part1.tar.lz.md5", ".part1.md5",
 HASH_SUFFIX = [".md5"]
 SPLIT_HASH_SUFFIX = [".part1.md5", ".part2.md5"]
 
+# metadata for quick checks and member indices for partial extraction, not present in archives created by older versions
+METADATA_SUFFIX = ".meta"
+MEMBER_INDEX_SUFFIX = ".tar.idx"
+
 CONTENT_LISTING = [".tar.lst"]
 SPLIT_CONTENT_LISTING = [".part1.tar.lst", ".part2.tar.lst"]
 
@@ -36,7 +40,7 @@ def assert_successful_archive_creation(destination_path, archive_path, folder_na
     # Get all hash filesnames from expected listing
     hash_filenames = hash_filenames_from_list(expected_listing)
 
-    dir_listing = os.listdir(destination_path)
+    dir_listing = list_archive_directory(destination_path)
     expected_named_listing = add_prefix_to_list_elements(expected_listing, folder_name)
     helpers.compare_list_content_ignoring_order(dir_listing, expected_named_listing)
 
@@ -60,7 +64,7 @@ def assert_successful_action_to_destination(destination_path, archive_path, fold
     expected_listing = add_split_prefix_to_file_suffixes(expected_listing_suffixes, split)
     hash_filenames = hash_filenames_from_list(expected_listing)
 
-    dir_listing = os.listdir(destination_path)
+    dir_listing = list_archive_directory(destination_path)
     expected_named_listing = add_prefix_to_list_elements(expected_listing, folder_name)
     helpers.compare_list_content_ignoring_order(dir_listing, expected_named_listing)
 
@@ -68,6 +72,10 @@ def assert_successful_action_to_destination(destination_path, archive_path, fold
     assert_hashes_in_file_list_valid(hash_file_paths)
 
 
+def list_archive_directory(directory):
+    return [f for f in os.listdir(directory) if not f.endswith((METADATA_SUFFIX, MEMBER_INDEX_SUFFIX))]
+
+
 def get_required_listing_suffixes(encrypted, unencrypted):
     expected_listing = []
 
@@ -196,3 +204,13 @@ def valid_md5_hash_in_file(hash_file_path):
             return False
     except:
         return False
+
+
+def get_lzip_dictionary_size(lzip_path):
+    """Returns the dictionary size coded in the header of the first member of an lzip file"""
+    with open(lzip_path, "rb") as file:
+        header = file.read(6)
+
+    assert header[:4] == b"LZIP"
+    base = 1 << (header[5] & 0x1F)
+    return base - (base // 16) * (header[5] >> 5)
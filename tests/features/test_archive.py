@@ -1,14 +1,22 @@
+import hashlib
+import io
+import os
+import subprocess
 import tarfile
 
 import pytest
 
 import archiver
-from archiver import integrity
-from archiver.archive import create_archive
+from archiver import integrity, walker
+from archiver.archive import create_archive, create_tar_archive, create_tar_archives_and_hashes_single_pass, \
+    create_filelist_and_hashes
+from archiver.helpers import get_files_in_folder, read_hash_file
+from archiver.constants import LZIP_DICTIONARY_BYTE_SIZES, INCOMPRESSIBLE_COMPRESSION_LEVEL
+from archiver.tar_writer import write_tar_with_hashes, HashingReader
 from tests import helpers
 from tests.helpers import run_archiver_tool, generate_splitting_directory
 from .archiving_helpers import assert_successful_archive_creation, \
-    get_public_key_paths
+    get_public_key_paths, get_lzip_dictionary_size
 
 
 def test_create_archive(tmp_path):
@@ -20,6 +28,133 @@ def test_create_archive(tmp_path):
 
     create_archive(folder_path, destination_path, compression=5)
     assert_successful_archive_creation(destination_path, archive_path, folder_name, unencrypted="all")
+    assert (destination_path / "test-folder.tar.lz.meta").is_file()
+    assert (destination_path / "test-folder.tar.idx").is_file()
+
+
+def test_create_archive_single_pass(tmp_path):
+    folder_name = "test-folder"
+
+    folder_path = helpers.get_directory_with_name(folder_name)
+    archive_path = helpers.get_directory_with_name("normal-archive")
+    destination_path = tmp_path / "name-of-destination-folder"
+
+    create_archive(folder_path, destination_path, compression=5, single_pass=True)
+    assert_successful_archive_creation(destination_path, archive_path, folder_name, unencrypted="all")
+
+
+def test_create_tar_archives_and_hashes_single_pass_sorted_on_disk(tmp_path):
+    folder_path = helpers.get_directory_with_name("test-folder")
+    expected_hashes = helpers.get_directory_with_name("normal-archive") / "test-folder.md5"
+    destination_path = tmp_path / "archive"
+    destination_path.mkdir()
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+
+    # a tiny sort memory sorts the hash list in temporary files in the work directory
+    create_tar_archives_and_hashes_single_pass(folder_path, destination_path, None, 1, work_dir=work_dir,
+                                               sort_memory=1)
+
+    assert (destination_path / "test-folder.md5").read_text() == expected_hashes.read_text()
+
+
+def test_create_archive_stream(tmp_path):
+    folder_name = "test-folder"
+
+    folder_path = helpers.get_directory_with_name(folder_name)
+    archive_path = helpers.get_directory_with_name("normal-archive")
+    destination_path = tmp_path / "name-of-destination-folder"
+
+    create_archive(folder_path, destination_path, compression=5, stream=True)
+    assert_successful_archive_creation(destination_path, archive_path, folder_name, unencrypted="all")
+    assert not (destination_path / "test-folder.tar").exists()
+
+
+def test_write_tar_with_hashes(tmp_path):
+    folder_path = helpers.get_directory_with_name("test-folder")
+    expected_hashes = read_hash_file(helpers.get_directory_with_name("normal-archive") / "test-folder.md5")
+    tar_path = tmp_path / "test-folder.tar"
+
+    listing = get_files_in_folder(folder_path, include_dirs=True)
+    hashes, tar_hashes = write_tar_with_hashes(folder_path, tar_path, listing, ("md5", "sha256"))
+
+    assert {h[0]: h[1] for h in hashes} == expected_hashes
+    assert {h[0]: h[2] for h in hashes} == {p: hashlib.sha256((folder_path.parent / p).read_bytes()).hexdigest()
+                                            for p in expected_hashes}
+    assert tar_hashes == archiver.helpers.get_file_hashes_from_path(tar_path, ("md5", "sha256"))
+
+    with tarfile.open(tar_path) as f:
+        assert set(f.getnames()) == {'test-folder/file1.txt', 'test-folder/folder-in-archive',
+                                     'test-folder/folder-in-archive/file2.txt'}
+
+
+def test_hashing_reader_reads_into_reused_buffer():
+    content = os.urandom(10000)
+    hasher = hashlib.md5()
+    reader = HashingReader(io.BytesIO(content), [hasher])
+
+    chunks = []
+    for chunk in iter(lambda: reader.read(4096), b""):
+        assert isinstance(chunk, memoryview)
+        chunks.append(bytes(chunk))
+
+    assert b"".join(chunks) == content
+    assert hasher.hexdigest() == hashlib.md5(content).hexdigest()
+
+
+def test_create_tar_archive_hashes_while_writing(tmp_path):
+    folder_path = helpers.get_directory_with_name("test-folder")
+
+    tar_hashes = create_tar_archive(folder_path, tmp_path, "test-folder", algorithms=("md5", "sha256"))
+
+    tar_path = tmp_path / "test-folder.tar"
+    assert tar_hashes == archiver.helpers.get_file_hashes_from_path(tar_path, ("md5", "sha256"))
+
+    with tarfile.open(tar_path) as f:
+        assert 'test-folder/folder-in-archive/file2.txt' in f.getnames()
+
+
+def test_create_tar_archive_listing_while_writing(tmp_path):
+    folder_path = helpers.get_directory_with_name("test-folder")
+    listing_path = tmp_path / "test-folder.tar.lst"
+
+    create_tar_archive(folder_path, tmp_path, "test-folder", listing_path=listing_path)
+
+    expected_listing = subprocess.run(["tar", "-tvf", tmp_path / "test-folder.tar"], check=True, capture_output=True,
+                                      text=True).stdout
+    assert listing_path.read_text() == expected_listing
+
+
+def test_write_tar_with_hashes_listing(tmp_path):
+    folder_path = helpers.get_directory_with_name("test-folder")
+    tar_path = tmp_path / "test-folder.tar"
+    listing_path = tmp_path / "test-folder.tar.lst"
+
+    write_tar_with_hashes(folder_path, tar_path, get_files_in_folder(folder_path, include_dirs=True),
+                          tar_listing_path=listing_path)
+
+    expected_listing = subprocess.run(["tar", "-tvf", tar_path], check=True, capture_output=True, text=True).stdout
+    assert listing_path.read_text() == expected_listing
+
+
+def test_create_tar_archive_sparse(tmp_path):
+    folder_path = tmp_path / "sparse-folder"
+    folder_path.mkdir()
+    sparse_file_size = 100 * 1000 * 1000
+    with open(folder_path / "sparse-file", "wb") as f:
+        f.truncate(sparse_file_size)
+        f.write(b"data")
+
+    destination_path = tmp_path / "archive"
+    destination_path.mkdir()
+    create_tar_archive(folder_path, destination_path, "sparse-folder")
+
+    # the hole isn't stored in the archive
+    tar_path = destination_path / "sparse-folder.tar"
+    assert tar_path.stat().st_size < 1000 * 1000
+
+    with tarfile.open(tar_path) as f:
+        assert f.getmember("sparse-folder/sparse-file").size == sparse_file_size
 
 
 @pytest.mark.parametrize("workers", [2, 1])
@@ -61,6 +196,39 @@ def test_create_archive_split_granular(tmp_path, generate_splitting_directory):
     assert run_archiver_tool(['check', '--deep', destination_path]).returncode == 0
 
 
+@pytest.mark.parametrize("split_size", [None, 1000 * 1000 * 50])
+def test_create_filelist_and_hashes_walks_tree_once(tmp_path, generate_splitting_directory, monkeypatch, split_size):
+    scanned_paths = []
+    stated_paths = []
+    scan_tree = walker.scan_tree
+    get_file_entry = walker.get_file_entry
+
+    def counting_scan_tree(folder_path, *args, **kwargs):
+        scanned_paths.append(folder_path)
+        return scan_tree(folder_path, *args, **kwargs)
+
+    def counting_get_file_entry(path):
+        stated_paths.append(path)
+        return get_file_entry(path)
+
+    monkeypatch.setattr(walker, "scan_tree", counting_scan_tree)
+    monkeypatch.setattr(walker, "get_file_entry", counting_get_file_entry)
+    monkeypatch.setattr(archiver.helpers, "get_file_entry", counting_get_file_entry)
+
+    create_filelist_and_hashes(generate_splitting_directory, tmp_path, split_size, threads=2)
+
+    # hashes and listings are created from the entries of a single walk, only the root is stat'ed for the tree index
+    assert scanned_paths == [generate_splitting_directory]
+    assert len(stated_paths) <= 1
+
+    listed = [line for lst in tmp_path.glob("*.lst") for line in lst.read_text().splitlines()]
+    hashed = [path for md5 in tmp_path.glob("*.md5") for path in read_hash_file(md5)]
+    assert sorted(listed) == sorted(p.relative_to(generate_splitting_directory.parent).as_posix()
+                                    for p in get_files_in_folder(generate_splitting_directory, include_dirs=True))
+    assert sorted(hashed) == sorted(p.relative_to(generate_splitting_directory.parent).as_posix()
+                                    for p in get_files_in_folder(generate_splitting_directory))
+
+
 def test_create_symlink_archive(tmp_path, caplog):
     folder_name = "symlink-folder"
 
@@ -70,6 +238,7 @@ def test_create_symlink_archive(tmp_path, caplog):
 
     create_archive(folder_path, destination_path, compression=5)
     assert_successful_archive_creation(destination_path, archive_path, folder_name, unencrypted="all")
+    assert (destination_path / "symlink-folder.tar.lz.meta").is_file()
 
     assert "Broken symlink symlink-folder/invalid_link found pointing to a non-existing file " in caplog.text
     assert "Symlink with outside target symlink-folder/invalid_link_abs found pointing to /not/existing which is outside the archiving directory" in caplog.text
@@ -99,6 +268,18 @@ def test_create_encrypted_archive(tmp_path):
     assert_successful_archive_creation(destination_path, archive_path, folder_name, encrypted="all")
 
 
+def test_create_encrypted_archive_stream(tmp_path):
+    folder_name = "test-folder"
+
+    folder_path = helpers.get_directory_with_name(folder_name)
+    archive_path = helpers.get_directory_with_name("encrypted-archive")
+    destination_path = tmp_path / "name-of-destination-folder"
+    keys = get_public_key_paths()
+
+    create_archive(folder_path, destination_path, encryption_keys=keys, compression=5, stream=True)
+    assert_successful_archive_creation(destination_path, archive_path, folder_name, encrypted="all")
+
+
 def test_create_archive_split_encrypted(tmp_path, generate_splitting_directory):
     max_size = 1000 * 1000 * 50
     folder_name = "large-test-folder"
@@ -112,6 +293,30 @@ def test_create_archive_split_encrypted(tmp_path, generate_splitting_directory):
     assert_successful_archive_creation(destination_path, archive_path, folder_name, split=2, encrypted="all")
 
 
+@pytest.mark.parametrize("stream", [False, True])
+def test_create_archive_adaptive_compression(tmp_path, stream):
+    source_path = tmp_path / "project"
+    (source_path / "reads").mkdir(parents=True)
+    (source_path / "reads" / "sample.bam").write_bytes(os.urandom(100 * 1000))
+    (source_path / "results").mkdir()
+    # larger than the 8MiB dictionary of level 6, which plzip reduces to the size of smaller data
+    (source_path / "results" / "table.tsv").write_bytes(b"x" * 9 * 1000 * 1000)
+    destination_path = tmp_path / "archive"
+
+    create_archive(source_path, destination_path, threads=2, compression=6, split_parts=2, adaptive=True,
+                   stream=stream)
+
+    assert (destination_path / "project.incompressible.txt").read_text() == "project.part2\n"
+    assert read_hash_file(destination_path / "project.part2.md5").keys() == {"project/reads/sample.bam"}
+    assert integrity.check_integrity(destination_path, deep_flag=True, threads=1)
+
+    # the level used is recognizable by its dictionary size, 64KiB for level 0 and 8MiB for level 6
+    assert get_lzip_dictionary_size(destination_path / "project.part1.tar.lz") == LZIP_DICTIONARY_BYTE_SIZES[6]
+    assert get_lzip_dictionary_size(destination_path / "project.part2.tar.lz") == \
+        LZIP_DICTIONARY_BYTE_SIZES[INCOMPRESSIBLE_COMPRESSION_LEVEL]
+    assert (destination_path / "project.part2.tar.lz").stat().st_size > 100 * 1000
+
+
 @pytest.mark.parametrize('splitting_param', [None, 1000**5])
 def test_split_archive_with_exotic_filenames(tmp_path, splitting_param):
     # file name with trailing \r
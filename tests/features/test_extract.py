@@ -1,9 +1,11 @@
 import filecmp
 import os
+import subprocess
 from pathlib import Path
 
 import pytest
 
+from archiver.archive import create_tar_archive
 from archiver.extract import extract_archive
 from tests import helpers
 
@@ -49,6 +51,38 @@ def test_extract_archive_partial(tmp_path):
                        extraction_path.joinpath(extracted_file_path))
 
 
+@pytest.mark.parametrize("extracted_path", ["index-folder/file-b.bin", "index-folder/subfolder"])
+def test_extract_archive_partial_with_index(tmp_path, extracted_path):
+    folder_path = tmp_path / "index-folder"
+    (folder_path / "subfolder").mkdir(parents=True)
+    for name in ["file-a.bin", "file-b.bin", "subfolder/file-c.bin", "subfolder/file-d.bin"]:
+        (folder_path / name).write_bytes(os.urandom(300 * 1000))
+
+    archive_path = tmp_path / "archive"
+    archive_path.mkdir()
+    create_tar_archive(folder_path, archive_path, "index-folder", listing_path=archive_path / "index-folder.tar.lst",
+                       index_path=archive_path / "index-folder.tar.idx")
+
+    # compressing blocks of the tar archive into separate lzip members like plzip does for large archives
+    tar_content = (archive_path / "index-folder.tar").read_bytes()
+    with open(archive_path / "index-folder.tar.lz", "wb") as compressed_file:
+        for offset in range(0, len(tar_content), 200 * 1000):
+            compressed_file.write(subprocess.run(["plzip", "-c"], input=tar_content[offset:offset + 200 * 1000],
+                                                 stdout=subprocess.PIPE, check=True).stdout)
+    (archive_path / "index-folder.tar").unlink()
+
+    extraction_path = tmp_path / "extraction-folder"
+    extract_archive(archive_path, extraction_path, extracted_path)
+
+    extracted_files = sorted(p.relative_to(extraction_path).as_posix() for p in extraction_path.rglob("*") if p.is_file())
+    expected_files = sorted(p.relative_to(tmp_path).as_posix() for p in (tmp_path / extracted_path).rglob("*")
+                            if p.is_file()) or [extracted_path]
+    assert extracted_files == expected_files
+
+    for path in extracted_files:
+        assert filecmp.cmp(tmp_path / path, extraction_path / path, shallow=False)
+
+
 @pytest.mark.parametrize("partial_extraction_path",
                          [
                              None,  # "normal" extraction
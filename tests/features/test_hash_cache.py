@@ -0,0 +1,59 @@
+import os
+
+from archiver.hash_cache import HashCache
+from archiver.helpers import hash_files_and_check_symlinks, get_files_in_folder
+from tests.helpers import create_file_with_size
+
+
+def test_hash_cache_reused_for_unchanged_files(tmp_path):
+    source_path = tmp_path / "source"
+    source_path.mkdir()
+    create_file_with_size(source_path / "file_a.txt", 1000)
+    create_file_with_size(source_path / "file_b.txt", 2000)
+
+    cache_path = tmp_path / "cache.sqlite"
+    files = get_files_in_folder(source_path)
+
+    with HashCache(cache_path) as cache:
+        expected = hash_files_and_check_symlinks(source_path, files, hash_cache=cache)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    with HashCache(cache_path) as cache:
+        assert hash_files_and_check_symlinks(source_path, files, hash_cache=cache) == expected
+        assert (cache.hits, cache.misses) == (2, 0)
+
+    # changing content and modification time invalidates the entry
+    with open(source_path / "file_a.txt", "w") as f:
+        f.write("changed")
+    os.utime(source_path / "file_a.txt", ns=(0, 10**9))
+
+    with HashCache(cache_path) as cache:
+        hashes = dict(hash_files_and_check_symlinks(source_path, files, hash_cache=cache))
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    assert hashes["source/file_a.txt"] != dict(expected)["source/file_a.txt"]
+    assert hashes["source/file_b.txt"] == dict(expected)["source/file_b.txt"]
+
+
+def test_hash_cache_eviction(tmp_path):
+    source_path = tmp_path / "source"
+    source_path.mkdir()
+    for i in range(5):
+        create_file_with_size(source_path / f"file_{i}.txt", 10 + i)
+    files = get_files_in_folder(source_path)
+
+    cache_path = tmp_path / "cache.sqlite"
+
+    with HashCache(cache_path) as cache:
+        cache.run_timestamp = 100
+        hash_files_and_check_symlinks(source_path, files[:3], hash_cache=cache)
+
+    # the cache exceeds its size, only the entries of earlier runs are evicted
+    with HashCache(cache_path, max_byte_size=1) as cache:
+        cache.run_timestamp = 200
+        hash_files_and_check_symlinks(source_path, files[2:], hash_cache=cache)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    with HashCache(cache_path) as cache:
+        hash_files_and_check_symlinks(source_path, files, hash_cache=cache)
+        assert (cache.hits, cache.misses) == (3, 2)
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+import os
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from archiver import helpers
+from tests.helpers import create_file_with_size, get_directory_with_name
+
+
+def _square(x):
+    return x * x
+
+
+def test_batches_largest_first():
+    sizes = [10, 500, 1, 200, 3, 2]
+
+    batches = helpers._batches_largest_first(sizes, threads=1)
+
+    # every index scheduled exactly once, largest first
+    assert sorted(i for b in batches for i in b) == list(range(len(sizes)))
+    assert batches[0] == [1]
+    assert [i for b in batches for i in b] == sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True)
+
+
+@pytest.mark.parametrize("sizes", [[0] * 100000, [1] * 3 + [0] * 10000, [1] * 100000])
+def test_batches_largest_first_small_sizes(sizes):
+    batches = helpers._batches_largest_first(sizes, threads=4)
+
+    assert sorted(i for b in batches for i in b) == list(range(len(sizes)))
+    # empty and tiny files are grouped instead of being dispatched one by one
+    assert len(batches) <= len(sizes) // 500 + 3
+    assert max(len(b) for b in batches) <= helpers.PARALLEL_BATCH_MAX_ITEMS
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_exec_parallel_largest_first_keeps_order(backend):
+    values = list(range(50))
+    sizes = [(v * 37) % 11 for v in values]
+
+    assert helpers.exec_parallel_largest_first(_square, values, lambda v: (v,), sizes, 3, backend=backend) == \
+           [v * v for v in values]
+
+
+def test_hash_files_backends_agree(tmp_path):
+    source_path = tmp_path / "source"
+    source_path.mkdir()
+    for i in range(20):
+        create_file_with_size(source_path / f"file_{i}.txt", 100 * i)
+    (source_path / "link").symlink_to("file_1.txt")
+
+    files = helpers.get_files_in_folder(source_path)
+    expected = helpers.hash_files_and_check_symlinks(source_path, files, backend="process", max_workers=1)
+
+    for backend in ["auto", "thread", "process"]:
+        assert helpers.hash_files_and_check_symlinks(source_path, files, max_workers=4, backend=backend) == expected
+
+
+def test_get_read_chunk_size():
+    assert helpers.get_read_chunk_size(SimpleNamespace(st_blksize=4096)) == 4 * 1024 ** 2
+    # multiple of the block size of the filesystem
+    assert helpers.get_read_chunk_size(SimpleNamespace(st_blksize=3 * 1000 ** 2)) == 6 * 1000 ** 2
+    assert helpers.get_read_chunk_size(SimpleNamespace(st_blksize=1024 ** 3)) == 64 * 1024 ** 2
+
+
+def test_get_file_hashes_from_path_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(helpers, "HASH_CHUNK_MIN_BYTE_SIZE", 1000)
+
+    content = os.urandom(10 * 1000 + 123)
+    file_path = tmp_path / "file.bin"
+    file_path.write_bytes(content)
+
+    assert helpers.get_file_hashes_from_path(file_path, ["md5", "sha256"]) == \
+           [hashlib.md5(content).hexdigest(), hashlib.sha256(content).hexdigest()]
+
+    # the read buffer is reused for smaller files
+    small_content = content[:10]
+    small_file_path = tmp_path / "small.bin"
+    small_file_path.write_bytes(small_content)
+    assert helpers.get_file_hash_from_path(small_file_path) == hashlib.md5(small_content).hexdigest()
+
+
+def test_hash_files_in_chunks(tmp_path):
+    content = os.urandom(2500)
+    file_path = tmp_path / "file.bin"
+    file_path.write_bytes(content)
+
+    chunk_hashes = []
+    hashes = helpers.hash_files_and_check_symlinks(tmp_path, [file_path], max_workers=2, algorithms=["md5", "sha256"],
+                                                   chunk_size=1000, chunk_hashes=chunk_hashes)
+
+    chunks = [content[:1000], content[1000:2000], content[2000:]]
+    assert chunk_hashes == [[f"{tmp_path.name}/file.bin", str(i), hashlib.md5(c).hexdigest(), hashlib.sha256(c).hexdigest()]
+                            for i, c in enumerate(chunks)]
+
+    # the hash list keeps the hashes of the file content
+    assert hashes == [[f"{tmp_path.name}/file.bin", hashlib.md5(content).hexdigest(), hashlib.sha256(content).hexdigest()]]
+
+
+def test_run_cmd_with_hashed_output(tmp_path):
+    content = os.urandom(10000)
+    input_path = tmp_path / "input.bin"
+    input_path.write_bytes(content)
+    output_path = tmp_path / "output.bin"
+
+    hashes = helpers.run_cmd_with_hashed_output(["cat", input_path], output_path, ["md5", "sha256"])
+
+    assert output_path.read_bytes() == content
+    assert hashes == [hashlib.md5(content).hexdigest(), hashlib.sha256(content).hexdigest()]
+
+
+def test_run_cmd_with_hashed_output_failing(tmp_path):
+    output_path = tmp_path / "output.bin"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        helpers.run_cmd_with_hashed_output(["cat", tmp_path / "not-existing"], output_path)
+
+    assert not output_path.exists()
+
+
+def test_run_pipeline_with_hashed_outputs(tmp_path):
+    input_path = tmp_path / "input"
+    input_path.write_bytes(b"some content\n" * 100000)
+    output_path = tmp_path / "output.gz"
+    listing_path = tmp_path / "listing"
+
+    hashes = helpers.run_pipeline_with_hashed_outputs([["tar", "-cf", "-", "-C", tmp_path, "input"], ["gzip", "-c"]],
+                                                      output_path, ["md5"],
+                                                      taps={0: [(["tar", "-tf", "-"], listing_path)]})
+
+    with gzip.open(output_path) as f:
+        tar_content = f.read()
+
+    assert hashes == [[hashlib.md5(tar_content).hexdigest()], [hashlib.md5(output_path.read_bytes()).hexdigest()]]
+    assert listing_path.read_text() == "input\n"
+
+
+def test_run_pipeline_with_hashed_outputs_failing(tmp_path):
+    output_path = tmp_path / "output"
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        helpers.run_pipeline_with_hashed_outputs([["cat", "/dev/zero"], ["false"]], output_path)
+
+    # the command causing the failure is reported rather than the one with a broken pipe
+    assert error.value.cmd == ["false"]
+    assert not output_path.exists()
+
+
+def test_get_uncompressed_archive_size_in_bytes(tmp_path):
+    archive_file = get_directory_with_name("normal-archive") / "test-folder.tar.lz"
+    multi_member_file = tmp_path / "multi-member.tar.lz"
+    multi_member_file.write_bytes(archive_file.read_bytes() * 2)
+
+    tar_size = helpers.get_uncompressed_archive_size_in_bytes(archive_file)
+
+    # tar archives consist of 512 byte blocks
+    assert tar_size > 0 and tar_size % 512 == 0
+    assert helpers.get_uncompressed_archive_size_in_bytes(multi_member_file) == 2 * tar_size
+
+    not_lzip_file = tmp_path / "not-lzip.tar.lz"
+    not_lzip_file.write_bytes(b"\0" * 100)
+    with pytest.raises(SystemExit):
+        helpers.get_uncompressed_archive_size_in_bytes(not_lzip_file)
@@ -1,4 +1,12 @@
-from archiver.integrity import check_integrity, verify_relative_symbolic_links, get_archives_with_hashes_from_path
+import os
+import shutil
+
+from archiver import metadata
+from archiver.archive import create_archive, write_hash_files, write_chunk_hash_files
+from archiver.helpers import hash_files_and_check_symlinks, get_files_in_folder, read_chunk_hash_file, get_tree_hash, \
+    get_file_hash_from_path
+from archiver.integrity import check_integrity, verify_relative_symbolic_links, get_archives_with_hashes_from_path, \
+    compare_archive_listing_hashes, compare_chunk_hashes
 from tests.helpers import get_directory_with_name
 
 DEEP = True
@@ -185,6 +193,103 @@ def test_verify_relative_symbolic_links():
     assert len(missing) == 1
 
 
+def test_integrity_check_deep_hardlink_in_subdirectory(tmp_path, caplog):
+    source_path = tmp_path / "hardlink-folder"
+    (source_path / "subfolder").mkdir(parents=True)
+    (source_path / "subfolder" / "file.txt").write_text("content")
+    os.link(source_path / "subfolder" / "file.txt", source_path / "subfolder" / "hardlink.txt")
+    archive_dir = tmp_path / "archive"
+    create_archive(source_path, archive_dir)
+
+    # tar records the target of a hardlink relative to the archive root, unlike the target of a symlink
+    assert verify_relative_symbolic_links(get_archives_with_hashes_from_path(archive_dir)) == {}
+    assert_successful_deep_check(archive_dir, caplog)
+    assert "is broken in archive" not in caplog.text
+
+
+def test_compare_archive_listing_hashes_multiple_algorithms(tmp_path, caplog):
+    folder_path = get_directory_with_name("test-folder")
+    files = get_files_in_folder(folder_path)
+
+    hashes = hash_files_and_check_symlinks(folder_path, files, algorithms=("sha256", "blake2b"))
+    write_hash_files(hashes, tmp_path, "test-folder", ("sha256", "blake2b"))
+
+    for index, algorithm in enumerate(["sha256", "blake2b"]):
+        hash_result = [(h[0], h[index + 1]) for h in hashes]
+        assert compare_archive_listing_hashes(hash_result, tmp_path / f"test-folder.{algorithm}")
+
+    md5_result = hash_files_and_check_symlinks(folder_path, files)
+    assert not compare_archive_listing_hashes(md5_result, tmp_path / "test-folder.sha256")
+
+
+def test_compare_chunk_hashes(tmp_path, caplog):
+    folder_path = tmp_path / "folder"
+    folder_path.mkdir()
+    file_path = folder_path / "large_file.bin"
+    file_path.write_bytes(os.urandom(1000 * 10 + 10))
+
+    chunk_hashes = []
+    hashes = hash_files_and_check_symlinks(folder_path, [file_path], chunk_size=1000, chunk_hashes=chunk_hashes)
+    write_hash_files(hashes, tmp_path, "folder", ["md5"])
+    write_chunk_hash_files(chunk_hashes, tmp_path, "folder", ["md5"], 1000)
+
+    chunk_size, expected_chunk_hashes, tree_hashes = read_chunk_hash_file(tmp_path / "folder.md5.chunks")
+    assert chunk_size == 1000
+    assert len(expected_chunk_hashes) == 11
+    assert tree_hashes == {"folder/large_file.bin": get_tree_hash([expected_chunk_hashes[("folder/large_file.bin", i)]
+                                                                    for i in range(11)], "md5")}
+    assert hashes == [["folder/large_file.bin", get_file_hash_from_path(file_path)]]
+
+    # corrupting the 4th chunk
+    with open(file_path, "r+b") as f:
+        f.seek(3500)
+        f.write(b"corrupted")
+
+    chunk_hash_result = []
+    hash_result = hash_files_and_check_symlinks(folder_path, [file_path], chunk_size=chunk_size,
+                                                chunk_hashes=chunk_hash_result)
+
+    assert not compare_archive_listing_hashes(hash_result, tmp_path / "folder.md5")
+    assert not compare_chunk_hashes(chunk_hash_result, expected_chunk_hashes, chunk_size)
+    assert "Chunk 3 (bytes 3000 to 3999) of folder/large_file.bin has changed" in caplog.text
+
+    # truncating the file to less than 8 chunks
+    with open(file_path, "r+b") as f:
+        f.truncate(7500)
+
+    chunk_hash_result = []
+    hash_files_and_check_symlinks(folder_path, [file_path], chunk_size=chunk_size, chunk_hashes=chunk_hash_result)
+
+    caplog.clear()
+    assert not compare_chunk_hashes(chunk_hash_result, expected_chunk_hashes, chunk_size)
+    assert "Chunk 7 (bytes 7000 to 7999) of folder/large_file.bin has changed" in caplog.text
+    assert "Chunk 8 (bytes 8000 to 8999) of folder/large_file.bin is missing" in caplog.text
+    assert "Chunk 10 (bytes 10000 to 10999) of folder/large_file.bin is missing" in caplog.text
+
+
+def test_quick_integrity_check(tmp_path, caplog):
+    archive_dir = tmp_path / "normal-archive"
+    shutil.copytree(get_directory_with_name("normal-archive"), archive_dir)
+    archive_file = archive_dir / "test-folder.tar.lz"
+
+    assert not check_integrity(archive_dir, quick=True)
+    assert "No metadata file" in caplog.text
+
+    metadata.create_and_write_metadata(archive_file)
+    assert check_integrity(archive_dir, quick=True)
+    assert "Quick integrity check successful." in caplog.text
+
+    # corrupting the crc of the lzip trailer
+    with open(archive_file, "r+b") as f:
+        f.seek(-20, os.SEEK_END)
+        crc_byte = f.read(1)
+        f.seek(-20, os.SEEK_END)
+        f.write(bytes([crc_byte[0] ^ 0xff]))
+
+    assert not check_integrity(archive_dir, quick=True)
+    assert "The lzip_trailer of test-folder.tar.lz has changed" in caplog.text
+
+
 # MARK: Helpers
 
 def assert_successful_deep_check(archive_path, caplog, archive_name=None):
@@ -0,0 +1,53 @@
+import pytest
+
+from archiver import lzip
+from tests.helpers import get_directory_with_name
+
+
+def test_read_header_and_trailer():
+    archive_file = get_directory_with_name("normal-archive") / "test-folder.tar.lz"
+
+    header = lzip.read_header(archive_file)
+    assert header.version == 1
+    assert header.dictionary_size >= 4096
+
+    trailer = lzip.read_last_trailer(archive_file)
+    # uncompressed tar archives consist of 512 byte blocks
+    assert trailer.data_size % 512 == 0
+    assert trailer.member_size <= archive_file.stat().st_size
+
+
+def test_read_header_of_non_lzip_file(tmp_path):
+    file_path = tmp_path / "file.tar.lz"
+    file_path.write_bytes(b"not an lzip file at all")
+
+    with pytest.raises(ValueError):
+        lzip.read_header(file_path)
+
+    with pytest.raises(ValueError):
+        lzip.read_last_trailer(file_path)
+
+
+def test_read_members(tmp_path):
+    archive_file = get_directory_with_name("normal-archive") / "test-folder.tar.lz"
+    member_size = archive_file.stat().st_size
+
+    # concatenated lzip files are a valid multi-member lzip file
+    multi_member_file = tmp_path / "multi-member.tar.lz"
+    multi_member_file.write_bytes(archive_file.read_bytes() * 3)
+
+    members = lzip.read_members(multi_member_file)
+
+    trailer = lzip.read_last_trailer(archive_file)
+    assert members == [lzip.LzipMember(i * member_size, member_size, trailer.data_size, trailer.crc32)
+                       for i in range(3)]
+    assert lzip.get_uncompressed_size(multi_member_file) == 3 * trailer.data_size
+
+
+def test_read_members_of_corrupted_file(tmp_path):
+    archive_file = get_directory_with_name("normal-archive") / "test-folder.tar.lz"
+    file_path = tmp_path / "corrupted.tar.lz"
+    file_path.write_bytes(b"some garbage" + archive_file.read_bytes())
+
+    with pytest.raises(ValueError):
+        lzip.read_members(file_path)
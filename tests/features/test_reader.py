@@ -0,0 +1,102 @@
+import os
+import subprocess
+
+import pytest
+
+from archiver.archive import create_tar_archive
+from archiver.reader import ArchiveReader
+from tests import helpers
+
+
+@pytest.fixture
+def indexed_archive(tmp_path):
+    folder_path = tmp_path / "index-folder"
+    (folder_path / "subfolder").mkdir(parents=True)
+    for name in ["file-a.bin", "file-b.bin", "subfolder/file-c.bin"]:
+        (folder_path / name).write_bytes(os.urandom(300 * 1000))
+    os.link(folder_path / "file-a.bin", folder_path / "subfolder" / "hardlink.bin")
+
+    archive_path = tmp_path / "archive"
+    archive_path.mkdir()
+    create_tar_archive(folder_path, archive_path, "index-folder", listing_path=archive_path / "index-folder.tar.lst",
+                       index_path=archive_path / "index-folder.tar.idx")
+
+    # compressing blocks of the tar archive into separate lzip members like plzip does for large archives
+    tar_content = (archive_path / "index-folder.tar").read_bytes()
+    with open(archive_path / "index-folder.tar.lz", "wb") as compressed_file:
+        for offset in range(0, len(tar_content), 200 * 1000):
+            compressed_file.write(subprocess.run(["plzip", "-c"], input=tar_content[offset:offset + 200 * 1000],
+                                                 stdout=subprocess.PIPE, check=True).stdout)
+    (archive_path / "index-folder.tar").unlink()
+
+    return folder_path, archive_path
+
+
+@pytest.mark.parametrize("with_index", [True, False])
+def test_read_files(indexed_archive, with_index):
+    folder_path, archive_path = indexed_archive
+    if not with_index:
+        (archive_path / "index-folder.tar.idx").unlink()
+
+    reader = ArchiveReader(archive_path)
+
+    for name in ["file-b.bin", "subfolder/file-c.bin", "subfolder/hardlink.bin"]:
+        with reader.open(f"index-folder/{name}") as f:
+            assert f.read() == (folder_path / name).read_bytes()
+
+    # reading only the start of a file
+    with reader.open("index-folder/file-a.bin") as f:
+        assert f.read(1000) == (folder_path / "file-a.bin").read_bytes()[:1000]
+        assert f.tarinfo.size == 300 * 1000
+
+
+def test_read_missing_file_and_directory(indexed_archive):
+    _, archive_path = indexed_archive
+    reader = ArchiveReader(archive_path)
+
+    with pytest.raises(FileNotFoundError):
+        reader.open("index-folder/missing.bin")
+
+    with pytest.raises(IsADirectoryError):
+        reader.open("index-folder/subfolder")
+
+
+def test_open_non_archive_raises(tmp_path):
+    (tmp_path / "file.txt").write_text("no archive")
+
+    # raising exceptions instead of terminating like the command line tool
+    with pytest.raises(FileNotFoundError):
+        ArchiveReader(tmp_path)
+    with pytest.raises(FileNotFoundError):
+        ArchiveReader(tmp_path / "missing")
+    with pytest.raises(ValueError):
+        ArchiveReader(tmp_path / "file.txt")
+
+
+def test_iter_members(indexed_archive):
+    _, archive_path = indexed_archive
+
+    members = list(ArchiveReader(archive_path).iter_members())
+
+    # tar archives the directory in the order of readdir, either name of the hardlinked file may come first
+    assert {m.path for m in members if not m.permissions.startswith("d")} == \
+           {"index-folder/file-a.bin", "index-folder/file-b.bin", "index-folder/subfolder/file-c.bin",
+            "index-folder/subfolder/hardlink.bin"}
+    assert [sorted([m.path, m.hardlink_target]) for m in members if m.permissions.startswith("h")] == \
+           [["index-folder/file-a.bin", "index-folder/subfolder/hardlink.bin"]]
+
+
+def test_read_file_from_split_archive():
+    folder_path = helpers.get_directory_with_name("large-folder")
+    reader = ArchiveReader(helpers.get_directory_with_name("split-archive"))
+
+    with reader.open("large-folder/subfolder/file_c.txt") as f:
+        assert f.read() == (folder_path / "subfolder" / "file_c.txt").read_bytes()
+
+
+def test_read_file_from_encrypted_split_archive(setup_gpg):
+    folder_path = helpers.get_directory_with_name("large-folder")
+    reader = ArchiveReader(helpers.get_directory_with_name("split-encrypted-archive"))
+
+    with reader.open("large-folder/file_b.txt") as f:
+        assert f.read() == (folder_path / "file_b.txt").read_bytes()
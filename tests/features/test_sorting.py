@@ -0,0 +1,23 @@
+import random
+
+from archiver.sorting import sort_rows
+
+
+def test_sort_rows_in_memory(tmp_path):
+    rows = [["b", "2"], ["a", "1"], ["c", "3"]]
+
+    assert list(sort_rows(rows, tmp_path)) == [["a", "1"], ["b", "2"], ["c", "3"]]
+
+
+def test_sort_rows_external(tmp_path):
+    rows = [[f"folder/file_{i}", f"hash_{i}"] for i in range(1000)]
+    rows.append(["folder/new\nline", "hash_newline"])
+    rows.append(["folder/äöü", "hash_umlaut"])
+    shuffled = rows.copy()
+    random.Random(42).shuffle(shuffled)
+
+    # forcing many sorted runs on disk
+    assert list(sort_rows(shuffled, tmp_path, max_memory_byte_size=10 * 1000)) == sorted(rows)
+
+    # temporary runs are removed
+    assert list(tmp_path.iterdir()) == []
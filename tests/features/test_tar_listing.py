@@ -0,0 +1,100 @@
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+from archiver import listing
+from archiver.tar_listing import TarListingWriter
+from tests.helpers import get_directory_with_name
+
+
+@pytest.fixture
+def listing_folder(tmp_path):
+    folder_path = tmp_path / "listing-folder"
+    (folder_path / "sub folder").mkdir(parents=True)
+    (folder_path / "file.txt").write_text("some content\n")
+    os.link(folder_path / "file.txt", folder_path / "sub folder" / "hardlink.txt")
+    os.symlink("../file.txt", folder_path / "sub folder" / "symlink")
+    (folder_path / ("long-name-" * 20)).write_text("")
+    (folder_path / "back\\slash").write_text("")
+    with open(folder_path / "sparse-file", "wb") as f:
+        f.truncate(10 * 1000 * 1000)
+        f.write(b"data")
+
+    return folder_path
+
+
+def write_listing_in_chunks(tar_path, listing_path, chunk_size):
+    with open(tar_path, "rb") as tar_file, open(listing_path, "w") as listing_file:
+        writer = TarListingWriter(listing_file)
+        for chunk in iter(lambda: tar_file.read(chunk_size), b""):
+            writer.write(chunk)
+        writer.close()
+
+
+@pytest.mark.parametrize("tar_format", ["--posix", "--format=gnu"])
+@pytest.mark.parametrize("chunk_size", [100, 512, 65536])
+def test_listing_equals_tar_listing(tmp_path, listing_folder, tar_format, chunk_size):
+    tar_path = tmp_path / "archive.tar"
+    subprocess.run(["tar", tar_format, "--sparse", "-cf", tar_path, "-C", tmp_path, listing_folder.name], check=True)
+
+    listing_path = tmp_path / "archive.tar.lst"
+    write_listing_in_chunks(tar_path, listing_path, chunk_size)
+
+    expected = subprocess.run(["tar", "-tvf", tar_path], check=True, capture_output=True, text=True).stdout
+    assert listing_path.read_text() == expected
+
+    entries = listing.parse_tar_listing(listing_path)
+    assert f"{listing_folder.name}/sparse-file" in {e.path for e in entries}
+    assert "../file.txt" in {e.link_target for e in entries}
+    hardlinks = [(e.path, e.hardlink_target) for e in entries if e.permissions.startswith("h")]
+    assert sorted(hardlinks[0]) == [f"{listing_folder.name}/file.txt", f"{listing_folder.name}/sub folder/hardlink.txt"]
+
+
+def test_listing_of_tarfile_archive(tmp_path, listing_folder):
+    tar_path = tmp_path / "archive.tar"
+    with tarfile.open(tar_path, "w", format=tarfile.PAX_FORMAT) as tar:
+        tar.add(listing_folder, listing_folder.name)
+
+    listing_path = tmp_path / "archive.tar.lst"
+    write_listing_in_chunks(tar_path, listing_path, 1000)
+
+    expected = subprocess.run(["tar", "-tvf", tar_path], check=True, capture_output=True, text=True).stdout
+    assert listing_path.read_text() == expected
+
+
+def test_listing_of_archive_in_test_resources(tmp_path):
+    tar_path = tmp_path / "test-folder.tar"
+    subprocess.run(["tar", "--posix", "-cf", tar_path, "-C", get_directory_with_name("test-folder").parent,
+                    "test-folder"], check=True)
+
+    listing_path = tmp_path / "test-folder.tar.lst"
+    write_listing_in_chunks(tar_path, listing_path, 4096)
+
+    expected = subprocess.run(["tar", "-tvf", tar_path], check=True, capture_output=True, text=True).stdout
+    assert listing_path.read_text() == expected
+
+
+def test_listing_does_not_buffer_member_content(tmp_path, monkeypatch):
+    (tmp_path / "folder").mkdir()
+    (tmp_path / "folder" / "large-file").write_bytes(os.urandom(10 * 1000 * 1000))
+    tar_path = tmp_path / "archive.tar"
+    subprocess.run(["tar", "--posix", "-cf", tar_path, "-C", tmp_path, "folder"], check=True)
+
+    buffer_byte_sizes = []
+    process_buffer = TarListingWriter._process_buffer
+
+    def recording_process_buffer(self):
+        buffer_byte_sizes.append(len(self._buffer))
+        return process_buffer(self)
+
+    monkeypatch.setattr(TarListingWriter, "_process_buffer", recording_process_buffer)
+
+    listing_path = tmp_path / "archive.tar.lst"
+    write_listing_in_chunks(tar_path, listing_path, 4 * 1000 * 1000)
+
+    expected = subprocess.run(["tar", "-tvf", tar_path], check=True, capture_output=True, text=True).stdout
+    assert listing_path.read_text() == expected
+    # only headers and extended headers are buffered, the content is skipped in the written data
+    assert max(buffer_byte_sizes) <= 4 * tarfile.BLOCKSIZE
@@ -0,0 +1,113 @@
+import contextlib
+import os
+import threading
+import time
+
+from archiver import walker
+from archiver.constants import WALKER_PREFETCH_DIRECTORIES_PER_THREAD
+from archiver.walker import get_file_entry, scan_tree
+
+
+def test_scan_tree(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file_b").write_text("b")
+    (tmp_path / "a" / "file_a").write_text("a")
+    (tmp_path / "file").write_text("content")
+    os.symlink("a", tmp_path / "link_to_dir")
+
+    entries = list(scan_tree(tmp_path, include_dirs=True))
+    paths = [e.path.relative_to(tmp_path).as_posix() for e in entries]
+
+    assert sorted(paths) == ["a", "a/b", "a/b/file_b", "a/file_a", "file", "link_to_dir"]
+    # parents are yielded before their content
+    assert paths.index("a") < paths.index("a/file_a") < paths.index("a/b") < paths.index("a/b/file_b")
+
+    by_path = dict(zip(paths, entries))
+    assert by_path["a"].is_dir()
+    assert by_path["link_to_dir"].is_symlink() and not by_path["link_to_dir"].is_dir()
+    assert by_path["file"].is_file() and by_path["file"].stat.st_size == len("content")
+
+    assert [e.path for e in scan_tree(tmp_path)] == [e.path for e in entries if not e.is_dir()]
+
+
+def test_get_file_entry_broken_symlink(tmp_path):
+    os.symlink("missing", tmp_path / "broken")
+
+    entry = get_file_entry(tmp_path / "broken")
+
+    assert entry.is_symlink() and not entry.is_file()
+
+
+def test_scan_tree_skips_vanished_entry(tmp_path, monkeypatch, caplog):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file").write_text("content")
+    (tmp_path / "vanished").write_text("content")
+    (tmp_path / "file").write_text("content")
+    scandir = os.scandir
+
+    @contextlib.contextmanager
+    def scandir_removing_entry(path):
+        with scandir(path) as it:
+            dir_entries = list(it)
+        # removed after reading the directory, but before it is stat'ed
+        if (tmp_path / "vanished").exists():
+            (tmp_path / "vanished").unlink()
+        yield iter(dir_entries)
+
+    monkeypatch.setattr(walker.os, "scandir", scandir_removing_entry)
+
+    paths = [e.path.relative_to(tmp_path).as_posix() for e in scan_tree(tmp_path, include_dirs=True)]
+
+    # only the vanished entry is missing, not its siblings and their content
+    assert sorted(paths) == ["dir", "dir/file", "file"]
+    assert f"Cannot stat {tmp_path / 'vanished'}" in caplog.text
+
+
+def test_scan_tree_parallel(tmp_path):
+    for i in range(20):
+        for j in range(5):
+            (tmp_path / f"dir_{i}" / f"subdir_{j}").mkdir(parents=True)
+            (tmp_path / f"dir_{i}" / f"subdir_{j}" / "file").write_text(f"{i} {j}")
+        (tmp_path / f"dir_{i}" / "file").write_text(str(i))
+
+    sequential = [e.path for e in scan_tree(tmp_path, include_dirs=True)]
+
+    assert len(sequential) == 20 * (1 + 1 + 5 * 2)
+    assert [p for p in sequential if p.parent == tmp_path] == sorted(tmp_path.iterdir())
+
+    for walkers in [2, 8]:
+        assert [e.path for e in scan_tree(tmp_path, include_dirs=True, walkers=walkers)] == sequential
+
+
+def test_scan_tree_parallel_scans_deep_trees_ahead(tmp_path, monkeypatch):
+    # the root is scanned by the walk itself
+    max_scanned = 1 + 2 * WALKER_PREFETCH_DIRECTORIES_PER_THREAD
+
+    path = tmp_path
+    for depth in range(max_scanned + 10):
+        path = path / f"l{depth}"
+        path.mkdir()
+        (path / "file").write_text(str(depth))
+    scanned = []
+    scanned_ahead = threading.Event()
+    scan_directory = walker.scan_directory
+
+    def recording_scan_directory(directory_path):
+        scanned.append(directory_path)
+        if len(scanned) == max_scanned:
+            scanned_ahead.set()
+        return scan_directory(directory_path)
+
+    monkeypatch.setattr(walker, "scan_directory", recording_scan_directory)
+
+    entries = scan_tree(tmp_path, include_dirs=True, walkers=2)
+    first = next(entries)
+
+    # the threads scan the subdirectories they find without waiting for the walk to reach them,
+    # up to the number of directories scanned ahead
+    assert scanned_ahead.wait(5)
+    time.sleep(0.1)
+    assert len(scanned) == max_scanned
+
+    assert [first.path] + [e.path for e in entries] == \
+           [e.path for e in walker._scan_tree(tmp_path, include_dirs=True)]
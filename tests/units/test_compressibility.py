@@ -0,0 +1,32 @@
+import gzip
+import os
+
+from archiver.compressibility import is_incompressible, estimate_compression_seconds
+from archiver.constants import COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE
+
+
+def write_file(path, content):
+    path.write_bytes(content)
+    return path, len(content)
+
+
+def test_incompressible_by_suffix(tmp_path):
+    assert is_incompressible(*write_file(tmp_path / "reads.BAM", b"x" * 100))
+    assert not is_incompressible(*write_file(tmp_path / "notes.txt", b"x" * 100))
+
+
+def test_incompressible_by_magic_number(tmp_path):
+    content = gzip.compress(os.urandom(COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE))
+    assert is_incompressible(*write_file(tmp_path / "reads", content))
+
+    # small files are only judged by their suffix
+    assert not is_incompressible(*write_file(tmp_path / "small", gzip.compress(b"x")))
+
+
+def test_incompressible_by_sample(tmp_path):
+    assert is_incompressible(*write_file(tmp_path / "random.bin", os.urandom(COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE)))
+    assert not is_incompressible(*write_file(tmp_path / "zeros.bin", bytes(COMPRESSIBILITY_SAMPLE_MIN_FILE_SIZE)))
+
+
+def test_estimate_compression_seconds():
+    assert estimate_compression_seconds(1000 ** 3, 0) < estimate_compression_seconds(1000 ** 3, 6)
@@ -0,0 +1,46 @@
+import threading
+
+from archiver.archive import get_compression_thread_allotment
+from archiver.helpers import ThreadBudget
+
+MiB = 1024 * 1024
+GB = 1000 * 1000 * 1000
+
+
+def test_allotment_single_part_uses_all_threads():
+    assert get_compression_thread_allotment([500 * GB], 64, [6]) == [64]
+
+
+def test_allotment_divides_threads_among_parts():
+    assert get_compression_thread_allotment([500 * GB] * 5, 64, [6] * 5) == [16] * 5
+    assert get_compression_thread_allotment([500 * GB] * 2, 64, [6] * 2) == [32, 32]
+    # too few threads for compressing parts concurrently
+    assert get_compression_thread_allotment([500 * GB] * 5, 8, [6] * 5) == [8] * 5
+
+
+def test_allotment_limited_by_blocks_of_part():
+    # level 6 compresses blocks of 16MiB, level 0 of 1MiB
+    assert get_compression_thread_allotment([500 * GB, 40 * MiB, 10], 64, [6, 6, 6]) == [21, 3, 1]
+    assert get_compression_thread_allotment([40 * MiB], 64, [0]) == [40]
+    # parts of incompressible files compressed at level 0
+    assert get_compression_thread_allotment([40 * MiB, 40 * MiB], 64, [6, 0]) == [3, 32]
+
+
+def test_thread_budget_waits_for_free_threads():
+    budget = ThreadBudget(4)
+    budget.acquire(3)
+
+    acquired = threading.Event()
+
+    def acquire_more():
+        budget.acquire(2)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire_more)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    budget.release(3)
+    thread.join()
+    assert acquired.is_set()
+    assert budget.free == 2
@@ -0,0 +1,45 @@
+from archiver import member_index
+from archiver.lzip import LzipMember
+from archiver.member_index import IndexEntry
+
+
+def test_index_entries_with_special_names(tmp_path):
+    entries = [IndexEntry(0, 1024, "folder"), IndexEntry(1024, 3072, "folder/new\nline"),
+               IndexEntry(3072, 4096, "folder/back\\slash"), IndexEntry(4096, 5120, "folder/with space")]
+
+    index_path = tmp_path / "archive.tar.idx"
+    with open(index_path, "w") as index_file:
+        for entry in entries:
+            index_file.write(member_index.format_index_entry(*entry))
+
+    assert member_index.read_member_index(index_path) == entries
+
+
+def test_select_entries():
+    entries = [IndexEntry(0, 512, "folder"), IndexEntry(512, 1536, "folder/file"),
+               IndexEntry(1536, 2048, "folder/sub"), IndexEntry(2048, 3072, "folder/sub/file"),
+               IndexEntry(3072, 4096, "folder/subfolder/file")]
+
+    assert member_index.select_entries(entries, "folder/sub") == entries[2:4]
+    assert member_index.select_entries(entries, "folder/sub/") == entries[2:4]
+    assert member_index.select_entries(entries, "folder/file") == [entries[1]]
+    assert member_index.select_entries(entries, "folder/missing") == []
+
+
+def test_get_ranges_merges_adjacent_entries():
+    entries = [IndexEntry(2048, 3072, "c"), IndexEntry(0, 512, "a"), IndexEntry(512, 1536, "b")]
+
+    assert member_index.get_ranges(entries) == [(0, 1536), (2048, 3072)]
+
+
+def test_get_member_spans():
+    # uncompressed data: member 0 [0, 1000), 1 [1000, 2000), 2 [2000, 3000), 3 [3000, 4000)
+    members = [LzipMember(i * 100, 100, 1000, 0) for i in range(4)]
+
+    # within a single member
+    assert member_index.get_member_spans([(1200, 1400)], members) == [(1, 1, 1000, [(1200, 1400)])]
+    # across member boundaries, ending at a boundary
+    assert member_index.get_member_spans([(900, 2000)], members) == [(0, 1, 0, [(900, 2000)])]
+    # ranges in adjoining members are decompressed together, others separately
+    assert member_index.get_member_spans([(0, 100), (1500, 1600), (3500, 3600)], members) == \
+           [(0, 1, 0, [(0, 100), (1500, 1600)]), (3, 3, 3000, [(3500, 3600)])]
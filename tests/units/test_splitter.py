@@ -2,8 +2,8 @@ import pytest
 import os
 from pathlib import Path
 
-from archiver.splitter import split_directory
-from archiver.helpers import get_size_of_path
+from archiver.splitter import split_directory, split_directory_into_parts, split_directory_by_compressibility
+from archiver.helpers import get_size_of_path, get_files_in_folder
 from tests.helpers import generate_splitting_directory, flatten_nested_list, compare_list_content_ignoring_order
 
 
@@ -35,6 +35,127 @@ def test_split_archive_invalid_inputs(generate_splitting_directory):
         split_directory()
 
 
+def test_split_archive_balanced(tmp_path):
+    for name, size in [("a", 6000), ("b", 5000), ("c", 4000), ("d", 3000), ("e", 2000)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+
+    # the greedy strategy closes parts as soon as the next file doesn't fit
+    assert [len(archive) for archive, _ in split_directory(tmp_path, 10000)] == [1, 2, 2]
+
+    parts = list(split_directory(tmp_path, 10000, strategy="balanced"))
+
+    assert [relatative_string_from_path_list(archive, tmp_path) for archive, _ in parts] == [["a", "c"], ["b", "d", "e"]]
+
+
+def test_split_archive_balanced_listing(tmp_path):
+    (tmp_path / "large" / "small").mkdir(parents=True)
+    (tmp_path / "large" / "small" / "file").write_bytes(b"x" * 100)
+    (tmp_path / "large" / "file").write_bytes(b"x" * 10000)
+    max_size = 10000 + (tmp_path / "large" / "small").stat().st_size
+
+    parts = list(split_directory(tmp_path, max_size, strategy="balanced"))
+    listings = [relatative_string_from_path_list(listing, tmp_path) for _, listing in parts]
+
+    # the directory above the units is listed once
+    assert sorted(listings) == [["large", "large/small", "large/small/file"], ["large/file"]]
+
+
+def test_split_archive_balanced_max_single(tmp_path):
+    for name, size in [("a", 300), ("b", 50), ("c", 50)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+
+    with pytest.raises(ValueError):
+        list(split_directory(tmp_path, 100, strategy="balanced"))
+
+    parts = list(split_directory(tmp_path, 100, max_single_size=500, strategy="balanced"))
+
+    assert [relatative_string_from_path_list(archive, tmp_path) for archive, _ in parts] == [["a"], ["b", "c"]]
+
+
+def test_split_archive_into_parts(tmp_path):
+    for i in range(4):
+        (tmp_path / f"dir_{i}").mkdir()
+        for j in range(10):
+            (tmp_path / f"dir_{i}" / f"file_{j}").write_bytes(b"x" * 1000 * (i + j + 1))
+
+    parts = list(split_directory_into_parts(tmp_path, 3))
+
+    assert len(parts) == 3
+    part_sizes = [size_of_path_list(archive) for archive, _ in parts]
+    assert max(part_sizes) - min(part_sizes) <= 1000 * 13
+
+    listing = [entry.path for _, part_listing in parts for entry in part_listing]
+    assert sorted(listing) == sorted(get_files_in_folder(tmp_path, include_dirs=True))
+
+    with pytest.raises(ValueError):
+        list(split_directory_into_parts(tmp_path, 0))
+
+
+def test_split_archive_into_more_parts_than_files(tmp_path):
+    (tmp_path / "file").write_text("content")
+
+    assert len(list(split_directory_into_parts(tmp_path, 3))) == 1
+
+
+@pytest.mark.parametrize("strategy", ["greedy", "balanced"])
+def test_split_archive_hardlinks(tmp_path, strategy):
+    (tmp_path / "dir_a").mkdir()
+    (tmp_path / "dir_b").mkdir()
+    (tmp_path / "dir_a" / "file").write_bytes(b"x" * 6000)
+    os.link(tmp_path / "dir_a" / "file", tmp_path / "dir_b" / "link")
+    (tmp_path / "file").write_bytes(b"x" * 5000)
+
+    parts = list(split_directory(tmp_path, 10000, strategy=strategy))
+    archives = [sorted(relatative_string_from_path_list(archive, tmp_path)) for archive, _ in parts]
+
+    # the hardlinked file is only counted once and both names are in the same part
+    assert sorted(archives) == [["dir_a/file", "dir_b/link"], ["file"]]
+
+
+def generate_mixed_compressibility_directory(path):
+    (path / "reads").mkdir()
+    (path / "reads" / "sample_a.bam").write_bytes(os.urandom(3000))
+    (path / "reads" / "sample_b.bam").write_bytes(os.urandom(3000))
+    (path / "results").mkdir()
+    (path / "results" / "table.tsv").write_bytes(b"x" * 3000)
+    (path / "results" / "plot.jpg").write_bytes(os.urandom(2000))
+    (path / "notes.txt").write_bytes(b"x" * 1000)
+
+
+def test_split_archive_by_compressibility(tmp_path):
+    generate_mixed_compressibility_directory(tmp_path)
+
+    parts = list(split_directory_by_compressibility(tmp_path, 1000 * 1000))
+    archives = [(sorted(relatative_string_from_path_list(archive, tmp_path)), incompressible)
+                for archive, _, incompressible in parts]
+
+    # the directory with both kinds of files is split up
+    assert archives == [(["notes.txt", "results/table.tsv"], False),
+                        (["reads", "results/plot.jpg"], True)]
+
+    listing = [entry.path for _, part_listing, _ in parts for entry in part_listing]
+    assert sorted(listing) == sorted(get_files_in_folder(tmp_path, include_dirs=True))
+
+
+def test_split_archive_by_compressibility_into_parts(tmp_path):
+    generate_mixed_compressibility_directory(tmp_path)
+
+    parts = list(split_directory_by_compressibility(tmp_path, nr_parts=3))
+    assert [incompressible for _, _, incompressible in parts] == [False, True, True]
+
+    # without a second part for the incompressible files, they are put into the only part
+    parts = list(split_directory_by_compressibility(tmp_path, nr_parts=1))
+    assert [incompressible for _, _, incompressible in parts] == [False]
+    assert len(parts[0][1]) == len(get_files_in_folder(tmp_path, include_dirs=True))
+
+
+def test_split_archive_by_compressibility_only_compressible(tmp_path):
+    (tmp_path / "file").write_bytes(b"x" * 1000)
+
+    parts = list(split_directory_by_compressibility(tmp_path, 1000 * 1000))
+    assert [(len(archive), incompressible) for archive, _, incompressible in parts] == [(1, False)]
+
+
 # MARK: Test helpers
 
 def assert_archiving_splitting(path, max_size, expected_result):
@@ -55,7 +176,7 @@ def relative_strings_from_archives_list(archives, relative_to_path):
 
 
 def relatative_string_from_path_list(path_list, relative_to_path):
-    return [path.relative_to(relative_to_path).as_posix() for path in path_list]
+    return [entry.path.relative_to(relative_to_path).as_posix() for entry in path_list]
 
 
 def size_of_all_parts_below_maximum(archives, max_size):
@@ -69,7 +190,7 @@ def size_of_all_parts_below_maximum(archives, max_size):
 def size_of_path_list(path_list):
     archive_size = 0
 
-    for path in path_list:
-        archive_size += get_size_of_path(path)
+    for entry in path_list:
+        archive_size += get_size_of_path(entry.path)
 
     return archive_size
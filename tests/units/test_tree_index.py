@@ -0,0 +1,55 @@
+import os
+import subprocess
+
+from archiver.tree_index import build_tree_index
+from archiver.walker import scan_tree
+
+
+def test_build_tree_index(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "file_b").write_bytes(b"b" * 1000)
+    (tmp_path / "a" / "file_a").write_bytes(b"a" * 10)
+    (tmp_path / "empty").mkdir()
+    os.symlink("a/file_a", tmp_path / "link")
+
+    index = build_tree_index(tmp_path, walkers=2)
+
+    assert [d.path.name for d in index.subdirectories] == ["a", "empty"]
+    assert [e.path.name for e in index.files] == ["link"]
+    assert index.nr_files == 3
+    assert index.subdirectories[0].nr_files == 2
+
+    # same sizes as du with apparent sizes
+    du_output = subprocess.run(["du", "-sb", str(tmp_path)], stdout=subprocess.PIPE, check=True).stdout
+    assert index.byte_size == int(du_output.split()[0])
+
+    # same order as a walk
+    assert list(index.iter_entries(include_dirs=True)) == list(scan_tree(tmp_path, include_dirs=True))
+    assert list(index.iter_entries()) == list(scan_tree(tmp_path))
+
+
+def test_build_tree_index_hardlinks(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "c").mkdir()
+    (tmp_path / "a" / "b" / "file").write_bytes(b"x" * 1000)
+    os.link(tmp_path / "a" / "b" / "file", tmp_path / "a" / "link")
+    os.link(tmp_path / "a" / "b" / "file", tmp_path / "c" / "link")
+
+    index = build_tree_index(tmp_path)
+    a, c = index.subdirectories
+
+    du_output = subprocess.run(["du", "-sb", str(tmp_path)], stdout=subprocess.PIPE, check=True).stdout
+    assert index.byte_size == int(du_output.split()[0])
+    assert index.nr_files == 3
+
+    assert not index.has_outside_hardlinks
+    assert a.has_outside_hardlinks and a.subdirectories[0].has_outside_hardlinks and c.has_outside_hardlinks
+
+
+def test_build_tree_index_sparse_files(tmp_path):
+    with open(tmp_path / "sparse-file", "wb") as f:
+        f.truncate(100 * 1000 * 1000)
+
+    index = build_tree_index(tmp_path)
+
+    assert index.byte_size < 1000 * 1000